@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+def get_redis_client(cache):
+    """
+    Return the redis-py client behind a Django cache, or None when the cache
+    is not backed by Redis. Both django-redis and the Django's builtin
+    RedisCache are supported.
+    """
+    # django-redis exposes its client as `client` and Django's RedisCache
+    # as `_cache`
+    for attribute in ('client', '_cache'):
+        client = getattr(cache, attribute, None)
+        if hasattr(client, 'get_client'):
+            return client.get_client(write=True)
+
+    return None
+
+
+class CacheScript(object):
+    """
+    A Lua script to be run atomically on the Redis server behind a
+    Django cache. The keys are given as cache keys, so that the cache prefix
+    and version are applied as in any other cache operation.
+    """
+
+    def __init__(self, source):
+        self.source = source
+
+    def __call__(self, cache, keys=(), args=()):
+        client = get_redis_client(cache)
+        script = client.register_script(self.source)
+        return script(
+            keys=[cache.make_key(key) for key in keys],
+            args=args,
+            client=client
+        )
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+import inspect
+
+
+def is_coroutine_function(func):
+    iscoroutinefunction = getattr(inspect, 'iscoroutinefunction', None)
+    return iscoroutinefunction is not None and iscoroutinefunction(func)
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import time
+import uuid
+import weakref
+from functools import wraps
+
+from django_toolkit.cache_scripts import get_redis_client
+
+from .exceptions import LockAcquireError, LockActiveError, LockReleaseError
+
+logger = logging.getLogger(__name__)
+
+_asyncio_locks = weakref.WeakValueDictionary()
+
+
+class AsyncLocalMemoryLockMixin(object):
+    """
+    Add `async with` support to the local memory lock
+    """
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *args, **kwargs):
+        self.__exit__(*args, **kwargs)
+
+
+class AsyncCacheLockMixin(object):
+    """
+    Add `async with` support to the cache lock, performing its cache
+    operations with the Django's async cache API (Django 4.0+)
+
+    Blocking acquisitions wait with `asyncio.sleep` and the lease renewal
+    runs as an asyncio task, so the event loop is never blocked
+    """
+
+    async def __aenter__(self):
+        started_at = time.perf_counter()
+        self.active = await self._aacquire_or_wait()
+
+        if self.active:
+            self._send_acquired(started_at)
+        else:
+            self._send_failed(started_at)
+            if self.raise_exception:
+                raise LockActiveError('For key {key}'.format(key=self._key))
+
+        if self.active and self.renew_interval:
+            self._astart_renewal()
+
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        await self._astop_renewal_task()
+        self._send_released()
+
+        if self.active and self.delete_on_exit:
+            try:
+                await self._arelease()
+            except Exception as e:
+                raise LockReleaseError(
+                    'Could not release a lock. Caused by: {}'.format(e)
+                )
+
+        self.active = False
+
+    async def _aacquire(self):
+        token = uuid.uuid4().int
+        if not await self.cache.aadd(self._key, token, self._expire):
+            return False
+
+        self.token = token
+        if self.fencing:
+            self.fencing_token = await self._aget_next_fencing_token()
+
+        return True
+
+    async def _aget_next_fencing_token(self):
+        key = self._get_fencing_key()
+        try:
+            return await self.cache.aincr(key)
+        except ValueError:
+            await self.cache.aadd(key, 0, None)
+            return await self.cache.aincr(key)
+
+    async def _arelease(self):
+        if get_redis_client(self.cache) is not None:
+            # The compare-and-delete script is only available through the
+            # sync client
+            from asgiref.sync import sync_to_async
+            return await sync_to_async(self._release)()
+
+        key = self._get_lease_key()
+        released = await self.cache.aget(key) == self.token
+        if released:
+            await self.cache.adelete(key)
+        else:
+            logger.warning(
+                'Lock {key} expired before being released'.format(key=key)
+            )
+
+    def _astart_renewal(self):
+        self.lease_lost.clear()
+        self._renewal = asyncio.ensure_future(self._arenew_until_stopped())
+
+    async def _astop_renewal_task(self):
+        if self._renewal is None:
+            return
+
+        self._renewal.cancel()
+        try:
+            await self._renewal
+        except asyncio.CancelledError:
+            pass
+        self._renewal = None
+
+    async def _arenew_until_stopped(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                renewed = await self._arenew()
+            except Exception as e:
+                logger.warning(
+                    'Could not renew lock {key}. Caused by: {error}'.format(
+                        key=self._key,
+                        error=e
+                    )
+                )
+                continue
+
+            if not renewed:
+                self._lose_lease()
+                return
+
+    async def _arenew(self):
+        if get_redis_client(self.cache) is not None:
+            from asgiref.sync import sync_to_async
+            return await sync_to_async(self._renew)()
+
+        key = self._get_lease_key()
+        if await self.cache.aget(key) != self.token:
+            return False
+
+        return await self.cache.atouch(key, self._get_expire_seconds())
+
+    async def _atry_acquire(self):
+        try:
+            return await self._aacquire()
+        except Exception as e:
+            raise LockAcquireError(
+                'Could not acquire a lock. Caused by: {}'.format(e)
+            )
+
+    async def _aacquire_or_wait(self):
+        acquired = await self._atry_acquire()
+        if acquired or not self.blocking:
+            return acquired
+
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+
+        for delay in self._get_retry_delays():
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+
+            await asyncio.sleep(delay)
+
+            if await self._atry_acquire():
+                return True
+
+
+class SyncToAsyncCacheLockMixin(object):
+    """
+    Add `async with` support to the cache locks acquired and released with
+    many cache operations. Each acquisition and release runs from a single
+    thread hop, as there is no async counterpart of their Redis scripts
+    """
+
+    async def _aacquire(self):
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(self._acquire)()
+
+    async def _arelease(self):
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(self._release)()
+
+
+class LocalAsyncLock(object):
+    """
+    An `async with` context manager to handle a lock shared by name between
+    the tasks of an event loop, backed by an `asyncio.Lock`
+
+    When `blocking` is True, an active lock is waited until it is released
+    or `timeout` seconds have passed. The lock is not reentrant
+    """
+
+    def __init__(
+        self,
+        key,
+        blocking=False,
+        timeout=None,
+        raise_exception=True,
+    ):
+        self.active = False
+        self._key = key
+        self.blocking = blocking
+        self.timeout = timeout
+        self.raise_exception = raise_exception
+        self._lock = None
+
+    async def __aenter__(self):
+        self._lock = self._get_lock()
+        self.active = await self._acquire()
+
+        if not self.active and self.raise_exception:
+            raise LockActiveError('For key {key}'.format(key=self._key))
+
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        if self.active:
+            self._lock.release()
+
+        self.active = False
+
+    def _get_lock(self):
+        # An asyncio lock can only be used by the tasks of a single event
+        # loop, so the locks are shared by name within each loop
+        key = (asyncio.get_event_loop(), self._key)
+        lock = _asyncio_locks.get(key)
+        if lock is None:
+            lock = _asyncio_locks[key] = asyncio.Lock()
+        return lock
+
+    async def _acquire(self):
+        if not self.blocking:
+            # An unlocked lock with pending waiters was handed over to one of
+            # them, so acquiring it would wait behind them
+            if self._lock.locked() or _has_waiters(self._lock):
+                return False
+            return await self._lock.acquire()
+
+        try:
+            return await asyncio.wait_for(self._lock.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            return False
+
+
+def _has_waiters(lock):
+    # The same check `asyncio.Lock.acquire` does before acquiring an unlocked
+    # lock right away
+    waiters = getattr(lock, '_waiters', None) or ()
+    return any(not waiter.cancelled() for waiter in waiters)
+
+
+class AsyncCacheSemaphoreMixin(SyncToAsyncCacheLockMixin):
+    """
+    Add `async with` support to the cache semaphore and let it decorate
+    coroutine functions
+    """
+
+    def _wrap_coroutine_function(self, func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            async with self._copy():
+                return await func(*args, **kwargs)
+        return inner
+
+
+class AsyncRateLimiterMixin(object):
+    """
+    Add `async with` support to the rate limiter and let it decorate
+    coroutine functions
+    """
+
+    async def __aenter__(self):
+        retry_after = await self.acheck()
+        if retry_after:
+            self._raise_exceeded(retry_after)
+
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        pass
+
+    async def aallow(self):
+        return not await self.acheck()
+
+    async def acheck(self):
+        now = self._now()
+
+        retry_after = self._get_local_retry_after(now)
+        if retry_after:
+            return self._to_seconds(retry_after)
+
+        if get_redis_client(self.cache) is not None:
+            from asgiref.sync import sync_to_async
+            return await sync_to_async(self.check)()
+
+        retry_after, tat = self._update(await self.cache.aget(self._key), now)
+        if not retry_after:
+            await self.cache.aset(
+                self._key,
+                tat,
+                self._get_timeout(tat, now)
+            )
+
+        self._set_local_retry_after(now, retry_after)
+        return self._to_seconds(retry_after)
+
+    def _wrap_coroutine_function(self, func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            async with self:
+                return await func(*args, **kwargs)
+        return inner
@@ -0,0 +1,17 @@
+class LockActiveError(Exception):
+    pass
+
+
+class LockAcquireError(Exception):
+    pass
+
+
+class LockReleaseError(Exception):
+    pass
+
+
+class RateLimitExceededError(Exception):
+
+    def __init__(self, message, retry_after):
+        super(RateLimitExceededError, self).__init__(message)
+        self.retry_after = retry_after
@@ -1,26 +1,202 @@
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+import weakref
+
 from django.core.cache import caches
 from django.core.cache.backends.base import DEFAULT_TIMEOUT
 
+from django_toolkit.cache_scripts import CacheScript, get_redis_client
 
-class LockActiveError(Exception):
-    pass
+from .exceptions import (  # noqa
+    LockAcquireError,
+    LockActiveError,
+    LockReleaseError
+)
+from .signals import lock_acquired, lock_failed, lock_released
 
+if sys.version_info >= (3, 5):
+    from .aio import (  # noqa
+        AsyncCacheLockMixin,
+        AsyncLocalMemoryLockMixin,
+        LocalAsyncLock,
+        SyncToAsyncCacheLockMixin
+    )
+else:
+    AsyncCacheLockMixin = AsyncLocalMemoryLockMixin = object
+    SyncToAsyncCacheLockMixin = object
 
-class LockAcquireError(Exception):
-    pass
+logger = logging.getLogger(__name__)
 
+timer = getattr(time, 'perf_counter', time.time)
 
-class LockReleaseError(Exception):
-    pass
+release_script = CacheScript("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
 
+renew_script = CacheScript("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+""")
+
+# Set all the keys only when none of them exists, so that the acquisition
+# is all-or-nothing
+multi_acquire_script = CacheScript("""
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        return 0
+    end
+end
+for _, key in ipairs(KEYS) do
+    if ARGV[2] == '0' then
+        redis.call('SET', key, ARGV[1])
+    else
+        redis.call('SET', key, ARGV[1], 'PX', ARGV[2])
+    end
+end
+return 1
+""")
+
+multi_release_script = CacheScript("""
+local released = 0
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        released = released + redis.call('DEL', key)
+    end
+end
+return released
+""")
+
+# A reader gets in only when there is no writer, neither holding nor waiting
+# for the lock
+read_acquire_script = CacheScript("""
+if redis.call('EXISTS', KEYS[1], KEYS[2]) > 0 then
+    return 0
+end
+local readers = redis.call('INCR', KEYS[3])
+if ARGV[1] ~= '0' then
+    redis.call('PEXPIRE', KEYS[3], ARGV[1])
+end
+return readers
+""")
+
+read_release_script = CacheScript("""
+local readers = tonumber(redis.call('GET', KEYS[1]) or '0')
+if readers <= 1 then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+return redis.call('DECR', KEYS[1])
+""")
+
+# A writer gets in only when there is no writer nor reader. Otherwise, a
+# blocking writer announces itself as waiting, so that no new reader gets in
+write_acquire_script = CacheScript("""
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+if tonumber(redis.call('GET', KEYS[3]) or '0') > 0 then
+    if ARGV[4] ~= '0' then
+        redis.call('SET', KEYS[2], ARGV[3], 'PX', ARGV[4])
+    end
+    return 0
+end
+if ARGV[2] == '0' then
+    redis.call('SET', KEYS[1], ARGV[1])
+else
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+end
+if redis.call('GET', KEYS[2]) == ARGV[3] then
+    redis.call('DEL', KEYS[2])
+end
+return 1
+""")
 
-class Lock(object):
+
+class ReleaseNotifier(object):
+    """
+    Wake up the threads of this process waiting for a lock key as soon as
+    the key is released, instead of waiting for their next retry
+    """
 
     def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}
+
+    def wait(self, key, timeout):
+        with self._lock:
+            waiters = self._waiters.get(key)
+            if waiters is None:
+                waiters = self._waiters[key] = [
+                    threading.Condition(self._lock),
+                    0
+                ]
+
+            waiters[1] += 1
+            try:
+                waiters[0].wait(timeout)
+            finally:
+                waiters[1] -= 1
+                if not waiters[1]:
+                    del self._waiters[key]
+
+    def notify(self, key):
+        with self._lock:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters[0].notify_all()
+
+
+release_notifier = ReleaseNotifier()
+
+
+class Lock(object):
+
+    def __init__(self, key=None):
         self.active = False
+        self._key = key
+        self._acquired_at = None
+
+    def _send_acquired(self, started_at):
+        self._acquired_at = timer()
+        lock_acquired.send(
+            sender=self.__class__,
+            lock=self,
+            key=self._key,
+            wait_time=self._acquired_at - started_at
+        )
+
+    def _send_failed(self, started_at):
+        lock_failed.send(
+            sender=self.__class__,
+            lock=self,
+            key=self._key,
+            wait_time=timer() - started_at
+        )
 
+    def _send_released(self):
+        if self._acquired_at is None:
+            return
 
-class LocalMemoryLock(Lock):
+        hold_time = timer() - self._acquired_at
+        self._acquired_at = None
+        lock_released.send(
+            sender=self.__class__,
+            lock=self,
+            key=self._key,
+            hold_time=hold_time
+        )
+
+
+class LocalMemoryLock(AsyncLocalMemoryLockMixin, Lock):
     """
     A context manager to handle a lock status in memory
 
@@ -28,24 +204,150 @@ class LocalMemoryLock(Lock):
     """
 
     def __enter__(self):
+        started_at = timer()
 
         if self.active:
+            self._send_failed(started_at)
             raise LockActiveError('Lock is already active')
 
         self.active = True
+        self._send_acquired(started_at)
         return self
 
     def __exit__(self, *args, **kwargs):
         self.active = False
+        self._send_released()
 
 
-class CacheLock(Lock):
+class LockRegistry(object):
+    """
+    Share a lock object between all the users of a name in this process.
+    The lock is dropped once it is no longer referenced
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._locks = weakref.WeakValueDictionary()
+
+    def get(self, key):
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = self.factory()
+            return lock
+
+
+thread_locks = LockRegistry(threading.Lock)
+reentrant_thread_locks = LockRegistry(threading.RLock)
+
+
+def _thread_local_property(name, default):
+    def get(self):
+        return getattr(self._thread_state, name, default)
+
+    def set(self, value):
+        setattr(self._thread_state, name, value)
+
+    return property(get, set)
+
+
+class LocalThreadLock(Lock):
+    """
+    A context manager to handle a lock shared by name between the threads
+    of this process
+
+    Unlike `LocalMemoryLock`, the lock is acquired atomically, so that only
+    one thread holds a name at a time. When `reentrant` is True, the thread
+    holding the lock can acquire it again. Reentrant and non reentrant locks
+    of the same name are distinct locks
+
+    When `blocking` is True, an active lock is waited until it is released
+    or `timeout` seconds have passed (the timeout requires Python 3)
+
+    The status of the lock is kept per thread, so that an instance can be
+    shared between threads as a `LocalMemoryLock`
+    """
+
+    active = _thread_local_property('active', False)
+    _depth = _thread_local_property('depth', 0)
+    _acquired_at = _thread_local_property('acquired_at', None)
+
+    def __init__(
+        self,
+        key,
+        reentrant=False,
+        blocking=False,
+        timeout=None,
+        raise_exception=True,
+    ):
+        self._thread_state = threading.local()
+        super(LocalThreadLock, self).__init__(key)
+        self.reentrant = reentrant
+        self.blocking = blocking
+        self.timeout = timeout
+        self.raise_exception = raise_exception
+        registry = reentrant_thread_locks if reentrant else thread_locks
+        self._lock = registry.get(key)
+
+    def __enter__(self):
+        started_at = timer()
+
+        if self._acquire():
+            self._depth += 1
+            self.active = True
+            # A reentrant lock is instrumented from its first acquisition
+            # to its last release
+            if self._depth == 1:
+                self._send_acquired(started_at)
+        else:
+            self._send_failed(started_at)
+            if self.raise_exception:
+                raise LockActiveError('For key {key}'.format(key=self._key))
+
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        # Only a thread that acquired the lock releases it
+        if not self._depth:
+            return
+
+        self._depth -= 1
+        self.active = bool(self._depth)
+        self._lock.release()
+        if not self._depth:
+            self._send_released()
+
+    def _acquire(self):
+        if not self.blocking:
+            return self._lock.acquire(False)
+
+        if self.timeout is None:
+            return self._lock.acquire(True)
+
+        return self._lock.acquire(True, self.timeout)
+
+
+class CacheLock(AsyncCacheLockMixin, Lock):
     """
     A context manager to handle a lock status using Django cache
 
     The active status is True on __enter__ and False on __exit__
 
     The cache will be deleted on context __exit__
+
+    When `blocking` is True, a lock that is already active is retried with
+    exponential backoff and jitter until it is acquired or `timeout` seconds
+    have passed
+
+    Each acquisition stores a unique owner token, so that a lock is only
+    deleted by its owner. With `fencing` set, each acquisition also gets a
+    monotonically increasing `fencing_token`
+
+    With `renew_interval` set, a background thread extends the lock
+    expiration every `renew_interval` seconds while the context is active.
+    When the lock is found lost, `lease_lost` is set and `on_renew_failure`
+    is called with the lock
     """
 
     def __init__(
@@ -54,35 +356,515 @@ class CacheLock(Lock):
         cache_alias='default',
         expire=DEFAULT_TIMEOUT,
         raise_exception=True,
-        delete_on_exit=True
+        delete_on_exit=True,
+        blocking=False,
+        timeout=None,
+        retry_delay=0.01,
+        max_retry_delay=1,
+        fencing=False,
+        renew_interval=None,
+        on_renew_failure=None,
     ):
-        super(CacheLock, self).__init__()
-        self._key = key
+        super(CacheLock, self).__init__(key)
         self._expire = expire
+        self.cache_alias = cache_alias
         self.cache = caches[cache_alias]
         self.raise_exception = raise_exception
         self.delete_on_exit = delete_on_exit
+        self.blocking = blocking
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.fencing = fencing
+        self.token = None
+        self.fencing_token = None
+        self.renew_interval = renew_interval
+        self.on_renew_failure = on_renew_failure
+        if renew_interval is not None:
+            self._check_renew_interval()
+        self.lease_lost = threading.Event()
+        self._renewal = None
+        self._stop_renewal = threading.Event()
 
     def __enter__(self):
-        try:
-            self.active = self.cache.add(self._key, True, self._expire)
-        except Exception as e:
-            raise LockAcquireError(
-                'Could not acquire a lock. Caused by: {}'.format(e)
-            )
+        started_at = timer()
+        self.active = self._acquire_or_wait()
+
+        if self.active:
+            self._send_acquired(started_at)
+        else:
+            self._send_failed(started_at)
+            if self.raise_exception:
+                raise LockActiveError('For key {key}'.format(key=self._key))
 
-        if not self.active and self.raise_exception:
-            raise LockActiveError('For key {key}'.format(key=self._key))
+        if self.active and self.renew_interval:
+            self._start_renewal()
 
         return self
 
     def __exit__(self, *args, **kwargs):
+        self._stop_renewal_thread()
+        self._send_released()
+
         if self.active and self.delete_on_exit:
             try:
-                self.cache.delete(self._key)
+                self._release()
             except Exception as e:
                 raise LockReleaseError(
                     'Could not release a lock. Caused by: {}'.format(e)
                 )
 
+            self._notify_release()
+
         self.active = False
+
+    def _acquire(self):
+        # The token is an integer so that it is stored as is by the Redis
+        # backends and can be compared by the release script
+        token = uuid.uuid4().int
+        if not self.cache.add(self._key, token, self._expire):
+            return False
+
+        self.token = token
+        if self.fencing:
+            self.fencing_token = self._get_next_fencing_token()
+
+        return True
+
+    def _check_renew_interval(self):
+        expire = self._get_expire_seconds()
+        if expire is None:
+            raise ValueError(
+                'A lock with renew_interval requires a finite expire'
+            )
+        if self.renew_interval >= expire:
+            raise ValueError(
+                'The renew_interval ({renew_interval}) of a lock must be '
+                'smaller than its expire ({expire})'.format(
+                    renew_interval=self.renew_interval,
+                    expire=expire
+                )
+            )
+
+    def _get_lease_key(self):
+        return self._key
+
+    def _notify_release(self):
+        release_notifier.notify(self._key)
+
+    def _get_fencing_key(self):
+        return '{key}:fencing'.format(key=self._key)
+
+    def _get_expire_seconds(self):
+        if self._expire is DEFAULT_TIMEOUT:
+            return self.cache.default_timeout
+        return self._expire
+
+    def _get_next_fencing_token(self):
+        key = self._get_fencing_key()
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, 0, None)
+            return self.cache.incr(key)
+
+    def _release(self):
+        key = self._get_lease_key()
+
+        if get_redis_client(self.cache) is not None:
+            released = release_script(
+                self.cache,
+                keys=[key],
+                args=[self.token]
+            )
+        else:
+            # Best effort, the lock may expire between the get and the delete
+            released = self.cache.get(key) == self.token
+            if released:
+                self.cache.delete(key)
+
+        if not released:
+            logger.warning(
+                'Lock {key} expired before being released'.format(key=key)
+            )
+
+    def _start_renewal(self):
+        self.lease_lost.clear()
+        self._stop_renewal.clear()
+        self._renewal = threading.Thread(
+            target=self._renew_until_stopped,
+            name='CacheLock renewal for {key}'.format(key=self._key)
+        )
+        self._renewal.daemon = True
+        self._renewal.start()
+
+    def _stop_renewal_thread(self):
+        if self._renewal is None:
+            return
+
+        self._stop_renewal.set()
+        self._renewal.join()
+        self._renewal = None
+
+    def _renew_until_stopped(self):
+        while not self._stop_renewal.wait(self.renew_interval):
+            try:
+                renewed = self._renew()
+            except Exception as e:
+                # The lease may still be valid, so try again on next interval
+                logger.warning(
+                    'Could not renew lock {key}. Caused by: {error}'.format(
+                        key=self._key,
+                        error=e
+                    )
+                )
+                continue
+
+            if not renewed:
+                self._lose_lease()
+                return
+
+    def _renew(self):
+        # The lock is renewed from another thread, which must use its own
+        # cache instance since they aren't thread-safe
+        cache = caches[self.cache_alias]
+        key = self._get_lease_key()
+        expire = self._get_expire_seconds()
+
+        if get_redis_client(cache) is not None:
+            return bool(renew_script(
+                cache,
+                keys=[key],
+                args=[self.token, int(expire * 1000)]
+            ))
+
+        # Best effort, the lock may expire between the get and the touch
+        if cache.get(key) != self.token:
+            return False
+
+        return cache.touch(key, expire)
+
+    def _lose_lease(self):
+        logger.warning('Lock {key} was lost'.format(key=self._key))
+
+        self.lease_lost.set()
+        if self.on_renew_failure is not None:
+            self.on_renew_failure(self)
+
+    def _try_acquire(self):
+        try:
+            return self._acquire()
+        except Exception as e:
+            raise LockAcquireError(
+                'Could not acquire a lock. Caused by: {}'.format(e)
+            )
+
+    def _acquire_or_wait(self):
+        acquired = self._try_acquire()
+        if acquired or not self.blocking:
+            return acquired
+
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+
+        for delay in self._get_retry_delays():
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+
+            release_notifier.wait(self._key, delay)
+
+            if self._try_acquire():
+                return True
+
+    def _get_retry_delays(self):
+        delay = self.retry_delay
+        while True:
+            # Full jitter, so that waiters don't retry in lockstep
+            yield random.uniform(0, delay)
+            delay = min(self.max_retry_delay, delay * 2)
+
+
+class MultiCacheLock(SyncToAsyncCacheLockMixin, CacheLock):
+    """
+    A context manager to handle the lock of many keys at once using Django
+    cache
+
+    The keys are acquired in sorted order, to avoid deadlocks between locks
+    sharing some keys, and all-or-nothing: when any key is already locked,
+    none of them is kept. On Redis, the keys are acquired and released in a
+    single script, other backends add the keys one by one and roll back the
+    added ones on failure
+    """
+
+    def __init__(
+        self,
+        keys,
+        cache_alias='default',
+        expire=DEFAULT_TIMEOUT,
+        raise_exception=True,
+        delete_on_exit=True,
+        blocking=False,
+        timeout=None,
+        retry_delay=0.01,
+        max_retry_delay=1,
+    ):
+        self.keys = sorted(set(keys))
+        super(MultiCacheLock, self).__init__(
+            key=','.join(self.keys),
+            cache_alias=cache_alias,
+            expire=expire,
+            raise_exception=raise_exception,
+            delete_on_exit=delete_on_exit,
+            blocking=blocking,
+            timeout=timeout,
+            retry_delay=retry_delay,
+            max_retry_delay=max_retry_delay,
+        )
+
+    def _acquire(self):
+        token = uuid.uuid4().int
+
+        if get_redis_client(self.cache) is not None:
+            expire = self._get_expire_seconds()
+            acquired = multi_acquire_script(
+                self.cache,
+                keys=self.keys,
+                args=[token, int((expire or 0) * 1000)]
+            )
+        else:
+            acquired = self._add_all(token)
+
+        if not acquired:
+            return False
+
+        self.token = token
+        return True
+
+    def _add_all(self, token):
+        added = []
+        for key in self.keys:
+            if not self.cache.add(key, token, self._expire):
+                self._delete_owned(added, token)
+                return False
+            added.append(key)
+
+        return True
+
+    def _delete_owned(self, keys, token):
+        # Best effort, a key may expire between the get and the delete
+        owned = [
+            key for key, value in self.cache.get_many(keys).items()
+            if value == token
+        ]
+        if owned:
+            self.cache.delete_many(owned)
+        return len(owned)
+
+    def _release(self):
+        if get_redis_client(self.cache) is not None:
+            released = multi_release_script(
+                self.cache,
+                keys=self.keys,
+                args=[self.token]
+            )
+        else:
+            released = self._delete_owned(self.keys, self.token)
+
+        if released < len(self.keys):
+            logger.warning(
+                'Lock {key} expired before being released'.format(
+                    key=self._key
+                )
+            )
+
+    def _notify_release(self):
+        for key in self.keys + [self._key]:
+            release_notifier.notify(key)
+
+
+class ReadWriteCacheLock(object):
+    """
+    A reader-writer lock using Django cache
+
+    Many readers hold the lock at the same time (`read()`), while a writer
+    holds it alone (`write()`). Writers are preferred: once a blocking
+    writer waits for the readers to leave, no new reader gets in
+
+    The lock is kept in the `<key>:readers` (reader count),
+    `<key>:writer` (writer owner token) and `<key>:writer_waiting` cache
+    keys. On Redis, each acquisition and release is a single script, other
+    backends are best effort
+    """
+
+    def __init__(
+        self,
+        key,
+        cache_alias='default',
+        expire=DEFAULT_TIMEOUT,
+        raise_exception=True,
+        blocking=False,
+        timeout=None,
+        retry_delay=0.01,
+        max_retry_delay=1,
+    ):
+        self._key = key
+        self._options = {
+            'cache_alias': cache_alias,
+            'expire': expire,
+            'raise_exception': raise_exception,
+            'blocking': blocking,
+            'timeout': timeout,
+            'retry_delay': retry_delay,
+            'max_retry_delay': max_retry_delay,
+        }
+
+    def read(self):
+        return ReadCacheLock(self._key, **self._options)
+
+    def write(self):
+        return WriteCacheLock(self._key, **self._options)
+
+
+class _ReadWriteCacheLock(SyncToAsyncCacheLockMixin, CacheLock):
+
+    def __init__(self, key, **kwargs):
+        super(_ReadWriteCacheLock, self).__init__(key, **kwargs)
+        self.readers_key = '{key}:readers'.format(key=key)
+        self.writer_key = '{key}:writer'.format(key=key)
+        self.writer_waiting_key = '{key}:writer_waiting'.format(key=key)
+
+    def _get_expire_milliseconds(self):
+        return int((self._get_expire_seconds() or 0) * 1000)
+
+
+class ReadCacheLock(_ReadWriteCacheLock):
+    """
+    The shared side of a `ReadWriteCacheLock`
+
+    The reader count expires `expire` seconds after the last reader got in,
+    so that the readers of a crashed worker don't keep writers out forever
+    """
+
+    def _acquire(self):
+        if get_redis_client(self.cache) is not None:
+            return bool(read_acquire_script(
+                self.cache,
+                keys=[
+                    self.writer_key,
+                    self.writer_waiting_key,
+                    self.readers_key,
+                ],
+                args=[self._get_expire_milliseconds()]
+            ))
+
+        if self.cache.get_many([self.writer_key, self.writer_waiting_key]):
+            return False
+
+        self._increase_readers()
+
+        # Back off when a writer got in before the reader was counted
+        if self.cache.get(self.writer_key) is not None:
+            self._decrease_readers()
+            return False
+
+        return True
+
+    def _increase_readers(self):
+        self.cache.add(self.readers_key, 0, self._expire)
+        try:
+            self.cache.incr(self.readers_key)
+        except ValueError:
+            self.cache.add(self.readers_key, 1, self._expire)
+        self.cache.touch(self.readers_key, self._get_expire_seconds())
+
+    def _decrease_readers(self):
+        # The count is not deleted when it gets to zero, as another reader
+        # may be counted in between
+        try:
+            self.cache.decr(self.readers_key)
+        except ValueError:
+            logger.warning(
+                'Lock {key} expired before being released'.format(
+                    key=self.readers_key
+                )
+            )
+
+    def _release(self):
+        if get_redis_client(self.cache) is not None:
+            read_release_script(self.cache, keys=[self.readers_key])
+        else:
+            self._decrease_readers()
+
+
+class WriteCacheLock(_ReadWriteCacheLock):
+    """
+    The exclusive side of a `ReadWriteCacheLock`
+
+    A blocking writer announces itself as waiting on each retry, for twice
+    the `max_retry_delay`, so the announcement is gone soon after the writer
+    gives up
+    """
+
+    def __init__(self, key, **kwargs):
+        super(WriteCacheLock, self).__init__(key, **kwargs)
+        # Identify the announcement of this writer across its retries
+        self.waiting_token = uuid.uuid4().int
+
+    def _acquire(self):
+        token = uuid.uuid4().int
+
+        if get_redis_client(self.cache) is not None:
+            acquired = write_acquire_script(
+                self.cache,
+                keys=[
+                    self.writer_key,
+                    self.writer_waiting_key,
+                    self.readers_key,
+                ],
+                args=[
+                    token,
+                    self._get_expire_milliseconds(),
+                    self.waiting_token,
+                    self._get_waiting_milliseconds(),
+                ]
+            )
+        else:
+            acquired = self._add_writer(token)
+
+        if not acquired:
+            return False
+
+        self.token = token
+        return True
+
+    def _add_writer(self, token):
+        if not self.cache.add(self.writer_key, token, self._expire):
+            return False
+
+        # Back off when a reader is still in
+        if self.cache.get(self.readers_key, 0) > 0:
+            self.cache.delete(self.writer_key)
+            if self.blocking:
+                self.cache.set(
+                    self.writer_waiting_key,
+                    self.waiting_token,
+                    self._get_waiting_milliseconds() / 1000.0
+                )
+            return False
+
+        if self.cache.get(self.writer_waiting_key) == self.waiting_token:
+            self.cache.delete(self.writer_waiting_key)
+
+        return True
+
+    def _get_waiting_milliseconds(self):
+        if not self.blocking:
+            return 0
+        return max(1, int(self.max_retry_delay * 2000))
+
+    def _get_lease_key(self):
+        return self.writer_key
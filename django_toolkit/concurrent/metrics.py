@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+from .signals import lock_acquired, lock_failed, lock_released
+
+logger = logging.getLogger(__name__)
+
+
+def get_key_prefix(key, separators=(':', '_')):
+    """
+    Return the part of a lock key before its first separator, so that the
+    locks of the same kind (as `sku_1` and `sku_2`) are aggregated together
+    """
+    if key is None:
+        return None
+
+    key = str(key)
+    positions = [key.find(separator) for separator in separators]
+    positions = [position for position in positions if position > 0]
+    if not positions:
+        return key
+
+    return key[:min(positions)]
+
+
+class LockExporter(object):
+    """
+    Base class of the exporters of the lock signals. Call `connect()` to
+    start receiving them, as in an `AppConfig.ready()`
+    """
+
+    def connect(self):
+        lock_acquired.connect(
+            self.on_acquired,
+            weak=False,
+            dispatch_uid=self._get_dispatch_uid('acquired')
+        )
+        lock_released.connect(
+            self.on_released,
+            weak=False,
+            dispatch_uid=self._get_dispatch_uid('released')
+        )
+        lock_failed.connect(
+            self.on_failed,
+            weak=False,
+            dispatch_uid=self._get_dispatch_uid('failed')
+        )
+
+    def disconnect(self):
+        lock_acquired.disconnect(
+            dispatch_uid=self._get_dispatch_uid('acquired')
+        )
+        lock_released.disconnect(
+            dispatch_uid=self._get_dispatch_uid('released')
+        )
+        lock_failed.disconnect(dispatch_uid=self._get_dispatch_uid('failed'))
+
+    def on_acquired(self, sender, key, wait_time, **kwargs):
+        pass
+
+    def on_released(self, sender, key, hold_time, **kwargs):
+        pass
+
+    def on_failed(self, sender, key, wait_time, **kwargs):
+        pass
+
+    def _get_dispatch_uid(self, name):
+        return '{name}_{id}'.format(name=name, id=id(self))
+
+
+class LoggingExporter(LockExporter):
+    """
+    Log each lock acquisition, release and failure
+    """
+
+    def __init__(self, level=logging.DEBUG):
+        self.level = level
+
+    def on_acquired(self, sender, key, wait_time, **kwargs):
+        logger.log(
+            self.level,
+            'Lock {key} acquired after {wait_time:.6f}s'.format(
+                key=key,
+                wait_time=wait_time
+            )
+        )
+
+    def on_released(self, sender, key, hold_time, **kwargs):
+        logger.log(
+            self.level,
+            'Lock {key} released after {hold_time:.6f}s'.format(
+                key=key,
+                hold_time=hold_time
+            )
+        )
+
+    def on_failed(self, sender, key, wait_time, **kwargs):
+        logger.log(
+            self.level,
+            'Lock {key} not acquired after {wait_time:.6f}s'.format(
+                key=key,
+                wait_time=wait_time
+            )
+        )
+
+
+class InMemoryExporter(LockExporter):
+    """
+    Aggregate the lock signals of this process by key prefix, to be scraped
+    with `get_stats()`
+    """
+
+    def __init__(self, get_key_prefix=get_key_prefix):
+        self.get_key_prefix = get_key_prefix
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def on_acquired(self, sender, key, wait_time, **kwargs):
+        with self._lock:
+            stats = self._get_prefix_stats(key)
+            stats['acquired'] += 1
+            stats['wait_time'] += wait_time
+            stats['max_wait_time'] = max(stats['max_wait_time'], wait_time)
+
+    def on_released(self, sender, key, hold_time, **kwargs):
+        with self._lock:
+            stats = self._get_prefix_stats(key)
+            stats['released'] += 1
+            stats['hold_time'] += hold_time
+            stats['max_hold_time'] = max(stats['max_hold_time'], hold_time)
+
+    def on_failed(self, sender, key, wait_time, **kwargs):
+        with self._lock:
+            stats = self._get_prefix_stats(key)
+            stats['failed'] += 1
+            stats['wait_time'] += wait_time
+            stats['max_wait_time'] = max(stats['max_wait_time'], wait_time)
+
+    def get_stats(self):
+        """
+        Return a copy of the stats, as {prefix: {stat: value}}. The wait
+        times include the failed acquisitions
+        """
+        with self._lock:
+            return dict(
+                (prefix, dict(stats))
+                for prefix, stats in self._stats.items()
+            )
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _get_prefix_stats(self, key):
+        prefix = self.get_key_prefix(key)
+        stats = self._stats.get(prefix)
+        if stats is None:
+            stats = self._stats[prefix] = {
+                'acquired': 0,
+                'released': 0,
+                'failed': 0,
+                'wait_time': 0.0,
+                'max_wait_time': 0.0,
+                'hold_time': 0.0,
+                'max_hold_time': 0.0,
+            }
+        return stats
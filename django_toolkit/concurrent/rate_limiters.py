@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import math
+import sys
+import time
+from functools import wraps
+
+from django.core.cache import caches
+
+from django_toolkit.cache_scripts import CacheScript, get_redis_client
+from django_toolkit.compat import is_coroutine_function
+from django_toolkit.local_cache import LocalCache
+
+from .exceptions import RateLimitExceededError
+
+if sys.version_info >= (3, 5):
+    from .aio import AsyncRateLimiterMixin
+else:
+    AsyncRateLimiterMixin = object
+
+MICROSECONDS = 1000000
+
+# Process-local times (in microseconds) until which keys are known to be
+# limited. It is bounded, so that a flood of distinct clients doesn't grow it
+# without limit, and its entries expire with the limit
+LOCAL_BLOCKED_KEYS_MAX_SIZE = 10000
+_local_blocked_until = LocalCache(max_size=LOCAL_BLOCKED_KEYS_MAX_SIZE)
+
+# The times are in microseconds, so that they are exact integers. The
+# theoretical arrival time expires once it is in the past, as it is then the
+# same as a missing one
+gcra_script = CacheScript("""
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local tolerance = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - tolerance
+if now < allow_at then
+    return allow_at - now
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil((new_tat - now) / 1000))
+return 0
+""")
+
+
+class RateLimiter(AsyncRateLimiterMixin):
+    """
+    Limit the calls of a key to `rate` calls every `period` seconds, across
+    all the processes sharing the cache, allowing bursts of up to `burst`
+    calls (`rate` by default)
+
+    It implements the generic cell rate algorithm (GCRA), which keeps a
+    single theoretical arrival time per key. On Redis, each check is a
+    single atomic script, other backends are best effort with a get and a
+    set
+
+    A key found limited is remembered by the process until it can be called
+    again, so that the following calls are limited without touching the
+    cache
+
+    It can be used as a context manager or decorator, which raise
+    `RateLimitExceededError` when the rate is exceeded, or checked with
+    `allow()`
+    """
+
+    def __init__(
+        self,
+        key,
+        rate,
+        period=1,
+        burst=None,
+        cache_alias='default',
+    ):
+        self._key = key
+        self.rate = rate
+        self.period = period
+        self.burst = burst or rate
+        self.cache = caches[cache_alias]
+        self.interval = int(round(period * MICROSECONDS / float(rate)))
+        self.tolerance = self.interval * self.burst
+
+    def __enter__(self):
+        retry_after = self.check()
+        if retry_after:
+            self._raise_exceeded(retry_after)
+
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, func):
+        if is_coroutine_function(func):
+            return self._wrap_coroutine_function(func)
+
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return inner
+
+    def allow(self):
+        return not self.check()
+
+    def check(self):
+        """
+        Count a call and return 0 when it is allowed, or the time in seconds
+        to wait before the next call is allowed
+        """
+        now = self._now()
+
+        retry_after = self._get_local_retry_after(now)
+        if retry_after:
+            return self._to_seconds(retry_after)
+
+        if get_redis_client(self.cache) is not None:
+            retry_after = gcra_script(
+                self.cache,
+                keys=[self._key],
+                args=[now, self.interval, self.tolerance]
+            )
+        else:
+            retry_after, tat = self._update(self.cache.get(self._key), now)
+            if not retry_after:
+                self.cache.set(self._key, tat, self._get_timeout(tat, now))
+
+        self._set_local_retry_after(now, retry_after)
+        return self._to_seconds(retry_after)
+
+    def reset(self):
+        self.cache.delete(self._key)
+        _local_blocked_until.delete(self._key)
+
+    def _now(self):
+        return int(time.time() * MICROSECONDS)
+
+    def _to_seconds(self, microseconds):
+        return microseconds / float(MICROSECONDS)
+
+    def _update(self, tat, now):
+        """
+        Return the time to wait before a call is allowed (0 when it is) and
+        the theoretical arrival time to store when it is allowed, both in
+        microseconds
+        """
+        new_tat = max(tat or now, now) + self.interval
+        allow_at = new_tat - self.tolerance
+        if now < allow_at:
+            return allow_at - now, tat
+
+        return 0, new_tat
+
+    def _get_timeout(self, tat, now):
+        # The theoretical arrival time in the past is the same as a missing
+        # one, so it is kept only until then
+        return int(math.ceil(self._to_seconds(tat - now)))
+
+    def _get_local_retry_after(self, now):
+        blocked_until = _local_blocked_until.get(self._key)
+        if blocked_until is None:
+            return 0
+
+        if blocked_until > now:
+            return blocked_until - now
+
+        _local_blocked_until.delete(self._key)
+        return 0
+
+    def _set_local_retry_after(self, now, retry_after):
+        if retry_after:
+            _local_blocked_until.set(
+                self._key,
+                now + retry_after,
+                self._to_seconds(retry_after)
+            )
+
+    def _raise_exceeded(self, retry_after):
+        raise RateLimitExceededError(
+            'Rate limit exceeded for key {key}'.format(key=self._key),
+            retry_after=retry_after
+        )
+
+
+rate_limiter = RateLimiter
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import random
+import sys
+import uuid
+from functools import wraps
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from django_toolkit.cache_scripts import CacheScript, get_redis_client
+from django_toolkit.compat import is_coroutine_function
+
+from .locks import CacheLock
+
+if sys.version_info >= (3, 5):
+    from .aio import AsyncCacheSemaphoreMixin
+else:
+    AsyncCacheSemaphoreMixin = object
+
+# Take the first free slot, so that the acquisition is a single round trip
+acquire_slot_script = CacheScript("""
+for i, key in ipairs(KEYS) do
+    local acquired
+    if ARGV[2] == '0' then
+        acquired = redis.call('SET', key, ARGV[1], 'NX')
+    else
+        acquired = redis.call('SET', key, ARGV[1], 'NX', 'PX', ARGV[2])
+    end
+    if acquired then
+        return i
+    end
+end
+return 0
+""")
+
+
+class CacheSemaphore(AsyncCacheSemaphoreMixin, CacheLock):
+    """
+    A context manager (or decorator) to limit the number of concurrent
+    holders of a key to `value`, using Django cache
+
+    Each holder takes a slot, stored in the `<key>:<slot>` cache key with
+    its owner token and `expire` timeout, so that the slot of a crashed
+    holder is freed when it expires. The slots are released and renewed as
+    a `CacheLock`
+
+    When used as a decorator, each call acquires its own slot
+    """
+
+    def __init__(
+        self,
+        key,
+        value,
+        cache_alias='default',
+        expire=DEFAULT_TIMEOUT,
+        raise_exception=True,
+        blocking=False,
+        timeout=None,
+        retry_delay=0.01,
+        max_retry_delay=1,
+        renew_interval=None,
+        on_renew_failure=None,
+    ):
+        self.value = value
+        self._options = {
+            'key': key,
+            'value': value,
+            'cache_alias': cache_alias,
+            'expire': expire,
+            'raise_exception': raise_exception,
+            'blocking': blocking,
+            'timeout': timeout,
+            'retry_delay': retry_delay,
+            'max_retry_delay': max_retry_delay,
+            'renew_interval': renew_interval,
+            'on_renew_failure': on_renew_failure,
+        }
+        super(CacheSemaphore, self).__init__(
+            key=key,
+            cache_alias=cache_alias,
+            expire=expire,
+            raise_exception=raise_exception,
+            blocking=blocking,
+            timeout=timeout,
+            retry_delay=retry_delay,
+            max_retry_delay=max_retry_delay,
+            renew_interval=renew_interval,
+            on_renew_failure=on_renew_failure,
+        )
+        self.slot_key = None
+
+    def __call__(self, func):
+        if is_coroutine_function(func):
+            return self._wrap_coroutine_function(func)
+
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with self._copy():
+                return func(*args, **kwargs)
+        return inner
+
+    def _copy(self):
+        return self.__class__(**self._options)
+
+    def _get_slot_keys(self):
+        keys = [
+            '{key}:{slot}'.format(key=self._key, slot=slot)
+            for slot in range(self.value)
+        ]
+
+        # Start from a random slot to spread the holders over the slots
+        start = random.randrange(self.value) if self.value else 0
+        return keys[start:] + keys[:start]
+
+    def _acquire(self):
+        token = uuid.uuid4().int
+        keys = self._get_slot_keys()
+
+        if get_redis_client(self.cache) is not None:
+            slot = acquire_slot_script(
+                self.cache,
+                keys=keys,
+                args=[token, int((self._get_expire_seconds() or 0) * 1000)]
+            )
+            slot_key = keys[slot - 1] if slot else None
+        else:
+            slot_key = next(
+                (
+                    key for key in keys
+                    if self.cache.add(key, token, self._expire)
+                ),
+                None
+            )
+
+        if slot_key is None:
+            return False
+
+        self.token = token
+        self.slot_key = slot_key
+        return True
+
+    def _get_lease_key(self):
+        return self.slot_key
+
+
+cache_semaphore = CacheSemaphore
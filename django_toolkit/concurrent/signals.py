@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from django.dispatch import Signal
+
+# Sent when a lock is acquired, with the `lock`, its `key` and the
+# `wait_time` in seconds it took to acquire it (including the retries)
+lock_acquired = Signal()
+
+# Sent when a lock is released, with the `lock`, its `key` and the
+# `hold_time` in seconds it was held
+lock_released = Signal()
+
+# Sent when a lock could not be acquired because it is held by another
+# owner, with the `lock`, its `key` and the `wait_time` in seconds it took
+# to give up
+lock_failed = Signal()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight(object):
+    """
+    Coalesce concurrent calls sharing the same key, so that only the first
+    one runs and the others wait for its result (or exception).
+
+    A waiting call runs by itself when the running one takes more than
+    `timeout` seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, timeout=None):
+        call, is_leader = self._get_call(key)
+
+        if not is_leader:
+            if not call.done.wait(timeout):
+                return func()
+
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+
+        return self._run(key, call, func)
+
+    def try_do(self, key, func, default=None):
+        """
+        Run `func` unless a call of the same key is already running, in which
+        case `default` is returned right away instead of waiting for it (as
+        for a refresh of a value that is still valid)
+        """
+        call, is_leader = self._get_call(key)
+        if not is_leader:
+            return default
+
+        return self._run(key, call, func)
+
+    def _get_call(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+
+        return call, is_leader
+
+    def _run(self, key, call, func):
+        try:
+            call.result = func()
+        except Exception as e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
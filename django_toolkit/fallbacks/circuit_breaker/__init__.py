@@ -1,2 +1,8 @@
 # -*- coding: utf-8 -*-
-from .circuit_breaker import CircuitBreaker, circuit_breaker  # noqa
+from .circuit_breaker import (  # noqa
+    CircuitBreaker,
+    circuit_breaker,
+    invalidate_local_circuit_state
+)
+from .signals import circuit_closed, circuit_opened  # noqa
+from .states import CLOSED, HALF_OPEN, OPEN  # noqa
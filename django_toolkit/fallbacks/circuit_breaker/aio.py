@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+import logging
+from functools import wraps
+
+from django_toolkit.cache_scripts import get_redis_client
+from django_toolkit.timing import timed_phase
+
+from .counters import increase_counters
+from .states import CLOSED, HALF_OPEN, OPEN
+
+logger = logging.getLogger(__name__)
+
+
+async def aincrease_counters(cache, increments, timeout=None, read_keys=()):
+    """
+    Asynchronous version of `increase_counters` using the Django's async
+    cache API
+    """
+    read_keys = [
+        key for key in read_keys
+        if key not in dict(increments)
+    ]
+
+    if get_redis_client(cache) is not None:
+        # The Django's async cache API runs the sync methods in a thread,
+        # so the whole batch is sent from a single thread hop
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(increase_counters)(
+            cache,
+            increments,
+            timeout,
+            read_keys
+        )
+
+    for key, amount in increments:
+        await cache.aadd(key, 0, timeout)
+
+    totals = {}
+    for key, amount in increments:
+        if not amount:
+            continue
+
+        try:
+            totals[key] = await cache.aincr(key, amount)
+        except ValueError:
+            logger.warning('Key {key} expired!'.format(key=key))
+            await cache.aadd(key, amount, timeout)
+            totals[key] = amount
+
+    missing_keys = [
+        key for key, amount in increments
+        if key not in totals
+    ] + read_keys
+    if missing_keys:
+        totals.update(await cache.aget_many(missing_keys))
+
+    return totals
+
+
+class AsyncCircuitBreakerMixin(object):
+    """
+    Add `async with` support to the circuit breaker, performing its cache
+    operations with the Django's async cache API (Django 4.0+)
+    """
+
+    async def acircuit_state(self):
+        state = self._get_local_state()
+        if state is None:
+            state = self._get_state_from_cache(
+                await self.cache.aget_many(self._get_state_keys())
+            )
+            self._set_local_state(state)
+
+        return state
+
+    async def ais_circuit_open(self):
+        return await self.acircuit_state() == OPEN
+
+    async def aopen_circuit(self):
+        await self.cache.aset(
+            self.circuit_cache_key,
+            True,
+            self.circuit_timeout
+        )
+        if self.half_open_max_calls:
+            await self.cache.aset(self.half_open_cache_key, True, None)
+        self._set_local_state(OPEN)
+
+        await self.cache.adelete_many(self._get_reset_keys())
+
+        self._log_open_circuit()
+        self._send_opened()
+
+    async def aclose_circuit(self):
+        await self.cache.adelete_many(
+            [self.circuit_cache_key, self.half_open_cache_key] +
+            self._get_reset_keys()
+        )
+        self._set_local_state(CLOSED)
+
+        self._log_close_circuit()
+        self._send_closed()
+
+    async def __aenter__(self):
+        with timed_phase('circuit_breaker'):
+            return await self._aenter()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        with timed_phase('circuit_breaker'):
+            return await self._aexit(exc_type)
+
+    async def _aenter(self):
+        state = await self.acircuit_state()
+        if state == OPEN:
+            raise self.failure_exception
+
+        if state == HALF_OPEN and not self._is_half_open_call_allowed(
+            await aincrease_counters(
+                self.cache,
+                [(self.half_open_calls_cache_key, 1)],
+                self.half_open_timeout
+            )
+        ):
+            raise self.failure_exception
+
+        return self
+
+    async def _aexit(self, exc_type):
+        is_failure = self._is_failure(exc_type)
+        state = await self.acircuit_state()
+
+        if state == HALF_OPEN:
+            if is_failure:
+                await self.aopen_circuit()
+                raise self.failure_exception
+
+            if self._should_close_circuit(
+                await aincrease_counters(
+                    self.cache,
+                    [(self.half_open_successes_cache_key, 1)],
+                    self.half_open_timeout
+                )
+            ):
+                await self.aclose_circuit()
+            return
+
+        totals = await self._aincrease_counts(is_failure, state)
+
+        if is_failure:
+            if totals is None:
+                totals = self._get_totals(
+                    False,
+                    await self.cache.aget_many(self._get_window_keys())
+                )
+            total_failures, total_requests = totals
+
+            if self.rule.should_open_circuit(
+                total_failures=total_failures,
+                total_requests=total_requests
+            ):
+                await self.aopen_circuit()
+                self._log_max_failures_exceeded()
+
+                raise self.failure_exception
+
+    def _wrap_coroutine_function(self, func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            async with self:
+                return await func(*args, **kwargs)
+        return inner
+
+    async def _aincrease_counts(self, is_failure, state):
+        increments = self._get_increments(is_failure)
+        if not increments or state == OPEN:
+            return None
+
+        totals = await aincrease_counters(
+            self.cache,
+            increments,
+            self.rule.get_counter_timeout(self.failure_timeout),
+            read_keys=self._get_window_keys()
+        )
+
+        return self._get_totals(is_failure, totals)
@@ -1,12 +1,44 @@
 # -*- coding: utf-8 -*-
 import inspect
 import logging
+import sys
+import time
 from functools import wraps
 
+from django_toolkit.compat import is_coroutine_function
+from django_toolkit.timing import timed_phase
+
+from .counters import increase_counters
+from .signals import circuit_closed, circuit_opened
+from .states import CLOSED, HALF_OPEN, OPEN
+
+if sys.version_info >= (3, 5):
+    from .aio import AsyncCircuitBreakerMixin
+else:
+    AsyncCircuitBreakerMixin = object
+
 logger = logging.getLogger(__name__)
 
+# Process-local snapshots of circuit states, as
+# {circuit_cache_key: (state, expires_at)}
+_local_circuit_states = {}
+
+
+def invalidate_local_circuit_state(circuit_cache_key=None):
+    """
+    Drop the process-local snapshot of a circuit state (or of all circuits
+    when no key is given), so that the next check reads it from the cache.
+
+    It can be connected to a pub/sub subscriber to propagate circuit
+    openings between processes before the local snapshots expire.
+    """
+    if circuit_cache_key is None:
+        _local_circuit_states.clear()
+    else:
+        _local_circuit_states.pop(circuit_cache_key, None)
 
-class CircuitBreaker:
+
+class CircuitBreaker(AsyncCircuitBreakerMixin):
 
     def __init__(
         self,
@@ -16,6 +48,9 @@ class CircuitBreaker:
         failure_timeout=None,
         circuit_timeout=None,
         catch_exceptions=None,
+        local_state_timeout=None,
+        half_open_max_calls=None,
+        half_open_timeout=None,
     ):
         self.rule = rule
         self.cache = cache
@@ -24,28 +59,154 @@ class CircuitBreaker:
         self.circuit_cache_key = 'circuit_{}'.format(rule.failure_cache_key)
         self.failure_exception = failure_exception
         self.catch_exceptions = catch_exceptions or (Exception,)
+        self.local_state_timeout = local_state_timeout
+        self.half_open_max_calls = half_open_max_calls
+        # The admitted probe calls must be forgotten at some point, so that
+        # a probe that never exits (e.g. a crashed worker) doesn't keep the
+        # circuit failing fast forever
+        if half_open_max_calls and half_open_timeout is None:
+            half_open_timeout = circuit_timeout
+        self.half_open_timeout = half_open_timeout
+        self.half_open_cache_key = 'half_open_{}'.format(
+            rule.failure_cache_key
+        )
+        self.half_open_calls_cache_key = 'half_open_calls_{}'.format(
+            rule.failure_cache_key
+        )
+        self.half_open_successes_cache_key = 'half_open_successes_{}'.format(
+            rule.failure_cache_key
+        )
+
+    @property
+    def circuit_state(self):
+        state = self._get_local_state()
+        if state is None:
+            state = self._get_state_from_cache(
+                self.cache.get_many(self._get_state_keys())
+            )
+            self._set_local_state(state)
+
+        return state
 
     @property
     def is_circuit_open(self):
-        return self.cache.get(self.circuit_cache_key) or False
+        return self.circuit_state == OPEN
+
+    @property
+    def is_circuit_half_open(self):
+        return self.circuit_state == HALF_OPEN
+
+    def _get_state_keys(self):
+        if self.half_open_max_calls:
+            return [self.circuit_cache_key, self.half_open_cache_key]
+        return [self.circuit_cache_key]
+
+    def _get_state_from_cache(self, values):
+        if values.get(self.circuit_cache_key):
+            return OPEN
+        if values.get(self.half_open_cache_key):
+            return HALF_OPEN
+        return CLOSED
+
+    def _get_local_state(self):
+        if not self.local_state_timeout:
+            return None
+
+        state = _local_circuit_states.get(self.circuit_cache_key)
+        if state is not None and state[1] > time.time():
+            return state[0]
+
+        return None
+
+    def _set_local_state(self, state):
+        # The half-open state is never kept locally, so that every process
+        # sees the circuit closing as soon as the probe calls succeed
+        if not self.local_state_timeout or state == HALF_OPEN:
+            return
+
+        timeout = self.local_state_timeout
+        # An open circuit isn't kept locally past its opening, so that this
+        # process doesn't fail fast longer than the other ones
+        if state == OPEN and self.circuit_timeout is not None:
+            timeout = min(timeout, self.circuit_timeout)
+
+        _local_circuit_states[self.circuit_cache_key] = (
+            state,
+            time.time() + timeout
+        )
 
     @property
     def total_failures(self):
-        return self.cache.get(self.rule.failure_cache_key) or 0
+        return self._sum_counters(
+            self.cache.get_many(self.rule.get_failure_window_keys()),
+            self.rule.get_failure_window_keys()
+        )
 
     @property
     def total_requests(self):
-        return self.cache.get(self.rule.request_cache_key) or 0
+        return self._sum_counters(
+            self.cache.get_many(self.rule.get_request_window_keys()),
+            self.rule.get_request_window_keys()
+        )
 
     def open_circuit(self):
         self.cache.set(self.circuit_cache_key, True, self.circuit_timeout)
+        if self.half_open_max_calls:
+            # The circuit stays half-open after the circuit timeout until
+            # the probe calls succeed
+            self.cache.set(self.half_open_cache_key, True, None)
+        self._set_local_state(OPEN)
 
         # Delete the cache key to mitigate multiple sequentials openings
         # when a key is created accidentally without timeout (from an incr
         # operation)
-        self.cache.delete(self.rule.failure_cache_key)
-        self.cache.delete(self.rule.request_cache_key)
+        self.cache.delete_many(self._get_reset_keys())
+
+        self._log_open_circuit()
+        self._send_opened()
+
+    def close_circuit(self):
+        self.cache.delete_many(
+            [self.circuit_cache_key, self.half_open_cache_key] +
+            self._get_reset_keys()
+        )
+        self._set_local_state(CLOSED)
+
+        self._log_close_circuit()
+        self._send_closed()
+
+    def _send_opened(self):
+        circuit_opened.send(
+            sender=self.__class__,
+            circuit_breaker=self,
+            circuit_cache_key=self.circuit_cache_key
+        )
+
+    def _send_closed(self):
+        circuit_closed.send(
+            sender=self.__class__,
+            circuit_breaker=self,
+            circuit_cache_key=self.circuit_cache_key
+        )
 
+    def _log_close_circuit(self):
+        logger.info(
+            'Close circuit for {failure_cache_key} {cicuit_cache_key}'.format(
+                failure_cache_key=self.rule.failure_cache_key,
+                cicuit_cache_key=self.circuit_cache_key
+            )
+        )
+
+    def _get_reset_keys(self):
+        keys = self._get_window_keys()
+        if self.half_open_max_calls:
+            keys += [
+                self.half_open_calls_cache_key,
+                self.half_open_successes_cache_key,
+            ]
+        return keys
+
+    def _log_open_circuit(self):
         logger.critical(
             'Open circuit for {failure_cache_key} {cicuit_cache_key}'.format(
                 failure_cache_key=self.rule.failure_cache_key,
@@ -54,83 +215,161 @@ class CircuitBreaker:
         )
 
     def __enter__(self):
-        if self.is_circuit_open:
+        with timed_phase('circuit_breaker'):
+            return self._enter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with timed_phase('circuit_breaker'):
+            return self._exit(exc_type)
+
+    def _enter(self):
+        state = self.circuit_state
+        if state == OPEN:
+            raise self.failure_exception
+
+        if state == HALF_OPEN and not self._is_half_open_call_allowed(
+            increase_counters(
+                self.cache,
+                [(self.half_open_calls_cache_key, 1)],
+                self.half_open_timeout
+            )
+        ):
             raise self.failure_exception
 
         return self
 
-    def __exit__(self, exc_type, exc_value, traceback):
-        self._increase_request_count()
-        if inspect.isclass(exc_type) and any(
-            issubclass(exc_type, exception_class)
-            for exception_class in self.catch_exceptions
-        ):
+    def _exit(self, exc_type):
+        is_failure = self._is_failure(exc_type)
+        state = self.circuit_state
 
-            self._increase_failure_count()
+        if state == HALF_OPEN:
+            if is_failure:
+                self.open_circuit()
+                raise self.failure_exception
+
+            if self._should_close_circuit(
+                increase_counters(
+                    self.cache,
+                    [(self.half_open_successes_cache_key, 1)],
+                    self.half_open_timeout
+                )
+            ):
+                self.close_circuit()
+            return
+
+        totals = self._increase_counts(is_failure, state)
+
+        if is_failure:
+            total_failures, total_requests = totals or (
+                self.total_failures,
+                self.total_requests
+            )
 
             if self.rule.should_open_circuit(
-                total_failures=self.total_failures,
-                total_requests=self.total_requests
+                total_failures=total_failures,
+                total_requests=total_requests
             ):
                 self.open_circuit()
-
-                logger.info(
-                    'Max failures exceeded by: {}'.format(
-                        self.rule.failure_cache_key
-                    )
-                )
+                self._log_max_failures_exceeded()
 
                 raise self.failure_exception
 
     def __call__(self, func):
+        if is_coroutine_function(func):
+            return self._wrap_coroutine_function(func)
+
         @wraps(func)
         def inner(*args, **kwargs):
             with self:
                 return func(*args, **kwargs)
         return inner
 
-    def _increase_failure_count(self):
-        if (
-            self.is_circuit_open or
-            not self.rule.should_increase_failure_count()
-        ):
-            return
+    def _is_failure(self, exc_type):
+        return inspect.isclass(exc_type) and any(
+            issubclass(exc_type, exception_class)
+            for exception_class in self.catch_exceptions
+        )
 
-        # Between the cache.add and cache.incr, the cache MAY expire,
-        # which will lead to a circuit that will eventually open
-        self.cache.add(self.rule.failure_cache_key, 0, self.failure_timeout)
-        total = 0
-        try:
-            total = self.cache.incr(self.rule.failure_cache_key)
-        except ValueError:
-            logger.warning('Key {key} expired!'
-                           .format(key=self.rule.failure_cache_key))
-
-        self.rule.log_increase_failures(
-            total_failures=total,
-            total_requests=self.total_requests
-        )
-
-    def _increase_request_count(self):
-        if (
-            self.is_circuit_open or
-            not self.rule.should_increase_request_count()
-        ):
-            return
+    def _log_max_failures_exceeded(self):
+        logger.info(
+            'Max failures exceeded by: {}'.format(
+                self.rule.failure_cache_key
+            )
+        )
+
+    def _is_half_open_call_allowed(self, totals):
+        return totals[self.half_open_calls_cache_key] <= (
+            self.half_open_max_calls
+        )
+
+    def _should_close_circuit(self, totals):
+        return totals[self.half_open_successes_cache_key] >= (
+            self.half_open_max_calls
+        )
+
+    def _increase_counts(self, is_failure, state):
+        """
+        Increase the request count and, on failures, the failure count in a
+        single batch, returning the (total_failures, total_requests) pair or
+        None when nothing was counted
+        """
+        increments = self._get_increments(is_failure)
+        if not increments or state == OPEN:
+            return None
+
+        totals = increase_counters(
+            self.cache,
+            increments,
+            self.rule.get_counter_timeout(self.failure_timeout),
+            read_keys=self._get_window_keys()
+        )
+
+        return self._get_totals(is_failure, totals)
+
+    def _get_increments(self, is_failure):
+        increase_requests = self.rule.should_increase_request_count()
+        increase_failures = self.rule.should_increase_failure_count()
+
+        increments = []
+        if increase_requests:
+            increments.append((self.rule.get_request_counter_key(), 1))
 
-        self.cache.add(self.rule.request_cache_key, 0, self.failure_timeout)
         # To calculate the exact percentage, the cache of requests and the
-        # cache of failures must expire at the same time.
-        if self.rule.should_increase_failure_count():
-            self.cache.add(
-                self.rule.failure_cache_key, 0, self.failure_timeout
+        # cache of failures must expire at the same time, so the failure
+        # counter is also created when a request is counted.
+        if increase_failures and (is_failure or increase_requests):
+            increments.append(
+                (self.rule.get_failure_counter_key(), int(is_failure))
+            )
+
+        return increments
+
+    def _get_window_keys(self):
+        return (
+            self.rule.get_failure_window_keys() +
+            self.rule.get_request_window_keys()
+        )
+
+    def _sum_counters(self, totals, keys):
+        return sum(totals.get(key) or 0 for key in keys)
+
+    def _get_totals(self, is_failure, totals):
+        total_failures = self._sum_counters(
+            totals,
+            self.rule.get_failure_window_keys()
+        )
+        total_requests = self._sum_counters(
+            totals,
+            self.rule.get_request_window_keys()
+        )
+
+        if is_failure and self.rule.should_increase_failure_count():
+            self.rule.log_increase_failures(
+                total_failures=total_failures,
+                total_requests=total_requests
             )
 
-        try:
-            self.cache.incr(self.rule.request_cache_key)
-        except ValueError:
-            logger.warning('Key {key} expired!'
-                           .format(key=self.rule.request_cache_key))
+        return total_failures, total_requests
 
 
 circuit_breaker = CircuitBreaker
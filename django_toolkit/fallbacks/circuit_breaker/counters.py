@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+
+from django_toolkit.cache_scripts import CacheScript, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+increase_counters_script = CacheScript("""
+local timeout = tonumber(ARGV[1])
+local totals = {}
+for index, key in ipairs(KEYS) do
+    local amount = ARGV[index + 1]
+    if amount == nil then
+        totals[index] = tonumber(redis.call('GET', key)) or 0
+    else
+        if timeout > 0 then
+            redis.call('SET', key, 0, 'EX', timeout, 'NX')
+        else
+            redis.call('SET', key, 0, 'NX')
+        end
+        totals[index] = redis.call('INCRBY', key, amount)
+    end
+end
+return totals
+""")
+
+
+def increase_counters(cache, increments, timeout=None, read_keys=()):
+    """
+    Create the missing counters with the given timeout, increase them and
+    return a dict with the resulting totals, including the current value of
+    the counters in `read_keys`.
+
+    `increments` is a list of (key, amount) pairs, an amount of 0 only
+    creates the counter. On Redis this runs as a single atomic script,
+    other backends fall back to one add and one incr call per counter.
+    """
+    read_keys = [
+        key for key in read_keys
+        if key not in dict(increments)
+    ]
+
+    if get_redis_client(cache) is not None:
+        keys = [key for key, amount in increments] + read_keys
+        totals = increase_counters_script(
+            cache,
+            keys=keys,
+            # Redis expires keys in whole seconds, a fractional timeout is
+            # rounded up so that it doesn't become no expiration
+            args=[int(math.ceil(timeout or 0))] + [
+                amount for key, amount in increments
+            ]
+        )
+        return dict(zip(keys, [int(total) for total in totals]))
+
+    for key, amount in increments:
+        cache.add(key, 0, timeout)
+
+    totals = {}
+    for key, amount in increments:
+        if not amount:
+            continue
+
+        # Between the cache.add and cache.incr, the cache MAY expire,
+        # which will lead to a circuit that will eventually open
+        try:
+            totals[key] = cache.incr(key, amount)
+        except ValueError:
+            logger.warning('Key {key} expired!'.format(key=key))
+            cache.add(key, amount, timeout)
+            totals[key] = amount
+
+    missing_keys = [
+        key for key, amount in increments
+        if key not in totals
+    ] + read_keys
+    if missing_keys:
+        totals.update(cache.get_many(missing_keys))
+
+    return totals
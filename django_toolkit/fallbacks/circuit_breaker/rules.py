@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import abc
 import logging
+import math
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,37 @@ class Rule(object):
     def should_increase_request_count(self):
         return self.request_cache_key is not None
 
+    def get_failure_counter_key(self):
+        """
+        Return the cache key where the current failure is counted
+        """
+        return self.failure_cache_key
+
+    def get_request_counter_key(self):
+        """
+        Return the cache key where the current request is counted
+        """
+        return self.request_cache_key
+
+    def get_failure_window_keys(self):
+        """
+        Return the cache keys whose counters sum the total failures
+        """
+        return [self.failure_cache_key] if self.failure_cache_key else []
+
+    def get_request_window_keys(self):
+        """
+        Return the cache keys whose counters sum the total requests
+        """
+        return [self.request_cache_key] if self.request_cache_key else []
+
+    def get_counter_timeout(self, failure_timeout):
+        """
+        Return the timeout of the counters, the circuit breaker
+        `failure_timeout` by default
+        """
+        return failure_timeout
+
     @abc.abstractmethod
     def log_increase_failures(self, total_failures, total_requests):
         pass
@@ -102,3 +135,70 @@ class PercentageFailuresRule(Rule):
                 ),
             )
         )
+
+
+class SlidingWindowFailuresRule(PercentageFailuresRule):
+    """
+    Rule to open circuit based on a percentage of failures over a sliding
+    window of time.
+
+    Failures and requests are counted in `window_size` buckets of
+    `bucket_seconds` each, so that old buckets leave the window one at a time
+    instead of all counters expiring at once.
+    """
+
+    def __init__(
+        self,
+        max_failures_percentage,
+        failure_cache_key,
+        min_accepted_requests,
+        request_cache_key,
+        window_size=10,
+        bucket_seconds=1,
+    ):
+        super(SlidingWindowFailuresRule, self).__init__(
+            max_failures_percentage=max_failures_percentage,
+            failure_cache_key=failure_cache_key,
+            min_accepted_requests=min_accepted_requests,
+            request_cache_key=request_cache_key,
+        )
+        self.window_size = window_size
+        self.bucket_seconds = bucket_seconds
+
+    def _get_current_bucket(self):
+        return int(time.time() // self.bucket_seconds)
+
+    def _get_bucket_key(self, key, bucket):
+        return '{key}_{bucket}'.format(key=key, bucket=bucket)
+
+    def _get_window_keys(self, key):
+        current_bucket = self._get_current_bucket()
+        return [
+            self._get_bucket_key(key, bucket)
+            for bucket in range(
+                current_bucket - self.window_size + 1,
+                current_bucket + 1
+            )
+        ]
+
+    def get_failure_counter_key(self):
+        return self._get_bucket_key(
+            self.failure_cache_key,
+            self._get_current_bucket()
+        )
+
+    def get_request_counter_key(self):
+        return self._get_bucket_key(
+            self.request_cache_key,
+            self._get_current_bucket()
+        )
+
+    def get_failure_window_keys(self):
+        return self._get_window_keys(self.failure_cache_key)
+
+    def get_request_window_keys(self):
+        return self._get_window_keys(self.request_cache_key)
+
+    def get_counter_timeout(self, failure_timeout):
+        # A bucket must live while it is part of the window
+        return int(math.ceil(self.window_size * self.bucket_seconds))
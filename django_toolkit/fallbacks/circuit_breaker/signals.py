@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+from django.dispatch import Signal
+
+# Sent when a process opens a circuit, with the `circuit_breaker` and its
+# `circuit_cache_key`, so that it can be published to the other processes
+circuit_opened = Signal()
+
+# Sent when a process closes a circuit, with the `circuit_breaker` and its
+# `circuit_cache_key`
+circuit_closed = Signal()
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
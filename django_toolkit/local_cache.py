@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache(object):
+    """
+    A thread-safe in-memory LRU cache with expiration per entry.
+
+    Keys are spread over `shards` LRU dicts, each one with its own lock, so
+    that concurrent threads rarely wait for each other.
+    """
+
+    def __init__(self, max_size, shards=16):
+        self.shard_size = max(1, -(-max_size // shards))
+        self._shards = [
+            (threading.Lock(), OrderedDict())
+            for _ in range(shards)
+        ]
+
+    def _get_shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def get(self, key, default=None):
+        lock, entries = self._get_shard(key)
+        now = time.time()
+
+        with lock:
+            entry = entries.pop(key, None)
+            if entry is None:
+                return default
+
+            if entry[1] <= now:
+                return default
+
+            # Reinsert the entry to mark it as the most recently used
+            entries[key] = entry
+            return entry[0]
+
+    def set(self, key, value, timeout):
+        if timeout <= 0:
+            self.delete(key)
+            return
+
+        lock, entries = self._get_shard(key)
+        expires_at = time.time() + timeout
+
+        with lock:
+            entries.pop(key, None)
+            entries[key] = (value, expires_at)
+
+            while len(entries) > self.shard_size:
+                entries.popitem(last=False)
+
+    def delete(self, key):
+        lock, entries = self._get_shard(key)
+
+        with lock:
+            entries.pop(key, None)
+
+    def clear(self):
+        for lock, entries in self._shards:
+            with lock:
+                entries.clear()
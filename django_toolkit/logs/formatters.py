@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import string
+from operator import attrgetter, itemgetter
+
+try:
+    _ascii = ascii
+except NameError:  # Python 2
+    _ascii = repr
+
+_formatter = string.Formatter()
+
+_conversions = {
+    'r': repr,
+    's': str,
+    'a': _ascii,
+}
+
+
+def compile_format(format_string):
+    """
+    Compile a `str.format` format string into a callable taking the same
+    keyword arguments, so that the format string is parsed once instead of
+    on every call.
+
+    The fields are looked up with precompiled getters, as `{request.path}`
+    with `attrgetter('path')` over the `request` argument. Format strings
+    with fields that can't be precompiled (positional, indexed or with
+    nested fields) fall back to `str.format`.
+    """
+    parts = []
+    for literal, field_name, format_spec, conversion in _formatter.parse(
+        format_string
+    ):
+        if literal:
+            parts.append(literal)
+
+        if field_name is None:
+            continue
+
+        if not _is_simple_field(field_name, format_spec):
+            return format_string.format
+
+        parts.append(_compile_field(field_name, format_spec, conversion))
+
+    empty = format_string[:0]
+    text_type = type(empty)
+
+    def render(**kwargs):
+        return empty.join(
+            part if isinstance(part, text_type) else part(kwargs)
+            for part in parts
+        )
+
+    return render
+
+
+def _is_simple_field(field_name, format_spec):
+    name = field_name.split('.', 1)[0]
+    return (
+        name and
+        not name.isdigit() and
+        '[' not in field_name and
+        '{' not in format_spec
+    )
+
+
+def _compile_field(field_name, format_spec, conversion):
+    name, _, attributes = field_name.partition('.')
+    get_argument = itemgetter(name)
+    get_attributes = attrgetter(attributes) if attributes else None
+    convert = _conversions.get(conversion)
+
+    def render_field(kwargs):
+        value = get_argument(kwargs)
+        if get_attributes is not None:
+            value = get_attributes(value)
+        if convert is not None:
+            value = convert(value)
+        return format(value, format_spec)
+
+    return render_field
+
+
+# The attributes of every log record, so that the ones given with `extra`
+# can be told apart
+_record_attributes = frozenset(
+    vars(logging.LogRecord('', logging.INFO, '', 0, '', (), None))
+) | frozenset(['message', 'asctime'])
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Format a log record as a single line JSON object with its `timestamp`,
+    `level`, `logger` and `message`, plus the attributes given to the record
+    with `extra` (as the fields of the structured access logs) or added by
+    a filter (as `hostname`), so that it can be indexed without parsing.
+
+    With `fields`, only the given record attributes are included (besides
+    the timestamp, level, logger and message).
+    """
+
+    def __init__(self, fields=None, datefmt=None):
+        super(JSONFormatter, self).__init__(datefmt=datefmt)
+        self.fields = fields
+
+    def format(self, record):
+        data = {
+            'timestamp': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+
+        if self.fields is None:
+            data.update(
+                (key, value) for key, value in vars(record).items()
+                if key not in _record_attributes
+            )
+        else:
+            data.update(
+                (field, getattr(record, field, None))
+                for field in self.fields
+            )
+
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+
+        return json.dumps(data, separators=(',', ':'), default=str)
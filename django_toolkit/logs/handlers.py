@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import atexit
+import os
+import threading
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+_STOP = object()
+
+
+class QueueLogDispatcher(object):
+    """
+    Hand the log records of a logger to its handlers from a background
+    thread, through a bounded queue, so that a slow handler (as syslog or a
+    network handler) doesn't delay the caller.
+
+    When the queue is full, a record is dropped and counted in `dropped`, or
+    waited for up to `timeout` seconds when `block` is True (dropping it
+    after the timeout).
+
+    The thread is started on the first record of each process, so that it
+    runs in the workers of a forking server, and the queued records are
+    handled on exit.
+    """
+
+    def __init__(self, logger, maxsize=1000, block=False, timeout=None):
+        self.logger = logger
+        self.maxsize = maxsize
+        self.block = block
+        self.timeout = timeout
+        self.dropped = 0
+        self.queue = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def log(self, level, message, extra=None):
+        if not self.logger.isEnabledFor(level):
+            return True
+
+        return self.dispatch(self.logger.makeRecord(
+            self.logger.name,
+            level,
+            '(unknown file)',
+            0,
+            message,
+            (),
+            None,
+            extra=extra
+        ))
+
+    def dispatch(self, record):
+        if self._pid != os.getpid():
+            self.start()
+
+        try:
+            self.queue.put(record, self.block, self.timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+        return True
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            # A forked process doesn't inherit the thread of its parent, so
+            # it starts its own with a new queue
+            self.queue = queue.Queue(self.maxsize)
+            self._thread = threading.Thread(
+                target=self._handle_records,
+                args=(self.queue,),
+                name='QueueLogDispatcher for {}'.format(self.logger.name)
+            )
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = os.getpid()
+
+        atexit.register(self.stop)
+
+    def stop(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+
+            self.queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+            self._pid = None
+
+    def _handle_records(self, records):
+        while True:
+            record = records.get()
+            if record is _STOP:
+                return
+
+            self.logger.handle(record)
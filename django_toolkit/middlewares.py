@@ -1,10 +1,38 @@
 # -*- coding: utf-8 -*-
 import logging
+import math
+import random
 
+from django.http import HttpResponse
 from django.utils.deprecation import MiddlewareMixin
 
+from .concurrent.rate_limiters import RateLimiter
+from .logs.filters import AddHostName
+from .logs.formatters import compile_format
+from .logs.handlers import QueueLogDispatcher
 from .shortcuts import get_oauth2_app
-from .toolkit_settings import API_VERSION, MIDDLEWARE_ACCESS_LOG_FORMAT
+from .timing import (
+    get_request_timing,
+    start_request_timing,
+    stop_request_timing,
+    to_milliseconds
+)
+from .toolkit_settings import (
+    API_VERSION,
+    MIDDLEWARE_ACCESS_LOG_EXCLUDE_PATHS,
+    MIDDLEWARE_ACCESS_LOG_FORMAT,
+    MIDDLEWARE_ACCESS_LOG_QUEUE_BLOCK,
+    MIDDLEWARE_ACCESS_LOG_QUEUE_SIZE,
+    MIDDLEWARE_ACCESS_LOG_QUEUE_TIMEOUT,
+    MIDDLEWARE_ACCESS_LOG_SAMPLE_RATES,
+    MIDDLEWARE_ACCESS_LOG_SLOW_THRESHOLD,
+    MIDDLEWARE_ACCESS_LOG_STRUCTURED,
+    MIDDLEWARE_RATE_LIMIT_BURST,
+    MIDDLEWARE_RATE_LIMIT_CACHE_ALIAS,
+    MIDDLEWARE_RATE_LIMIT_PERIOD,
+    MIDDLEWARE_RATE_LIMIT_RATE,
+    MIDDLEWARE_SERVER_TIMING
+)
 
 logger = logging.getLogger(__name__)
 
@@ -21,19 +49,189 @@ class VersionHeaderMiddleware(MiddlewareMixin):
 
 
 class AccessLogMiddleware(MiddlewareMixin):
+    """
+    Log each response with the TOOLKIT['MIDDLEWARE_ACCESS_LOG_FORMAT']
+    format, compiled once when the middleware is created. With
+    TOOLKIT['MIDDLEWARE_ACCESS_LOG_QUEUE_SIZE'] set, the logs are handled by
+    a background thread. With TOOLKIT['MIDDLEWARE_ACCESS_LOG_STRUCTURED']
+    set, the log fields are included as record attributes.
+
+    The request is timed from `process_request`, so the middleware should
+    come first in the settings to time the whole request. With
+    TOOLKIT['MIDDLEWARE_SERVER_TIMING'] set, the timing is added to the
+    response in a Server-Timing header.
+
+    The logs can be sampled by status class with
+    TOOLKIT['MIDDLEWARE_ACCESS_LOG_SAMPLE_RATES'], the errors and the
+    requests slower than TOOLKIT['MIDDLEWARE_ACCESS_LOG_SLOW_THRESHOLD'] are
+    always logged, and the paths starting with one of
+    TOOLKIT['MIDDLEWARE_ACCESS_LOG_EXCLUDE_PATHS'] are never logged.
+    """
 
     LOG_FORMAT = MIDDLEWARE_ACCESS_LOG_FORMAT
     UNKNOWN_APP_NAME = 'unknown'
+    QUEUE_SIZE = MIDDLEWARE_ACCESS_LOG_QUEUE_SIZE
+    QUEUE_BLOCK = MIDDLEWARE_ACCESS_LOG_QUEUE_BLOCK
+    QUEUE_TIMEOUT = MIDDLEWARE_ACCESS_LOG_QUEUE_TIMEOUT
+    STRUCTURED = MIDDLEWARE_ACCESS_LOG_STRUCTURED
+    SERVER_TIMING = MIDDLEWARE_SERVER_TIMING
+    SAMPLE_RATES = MIDDLEWARE_ACCESS_LOG_SAMPLE_RATES
+    SLOW_THRESHOLD = MIDDLEWARE_ACCESS_LOG_SLOW_THRESHOLD
+    EXCLUDE_PATHS = MIDDLEWARE_ACCESS_LOG_EXCLUDE_PATHS
+
+    def __init__(self, *args, **kwargs):
+        super(AccessLogMiddleware, self).__init__(*args, **kwargs)
+        self.render_log = compile_format(self.LOG_FORMAT)
+        # `str.startswith` checks all the prefixes of a tuple at once
+        self.exclude_paths = tuple(self.EXCLUDE_PATHS)
+        self.log_dispatcher = None
+        if self.QUEUE_SIZE:
+            self.log_dispatcher = QueueLogDispatcher(
+                logger,
+                maxsize=self.QUEUE_SIZE,
+                block=self.QUEUE_BLOCK,
+                timeout=self.QUEUE_TIMEOUT
+            )
+
+    def process_request(self, request):
+        start_request_timing()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = get_request_timing()
+        if timing is not None:
+            timing.start('view')
 
     def process_response(self, request, response):
+        duration = None
+        timing = get_request_timing()
+        if timing is not None:
+            stop_request_timing()
+            timing.stop('view')
+            duration_ns = timing.duration
+            duration = round(to_milliseconds(duration_ns), 3)
+
+            if self.SERVER_TIMING:
+                response['Server-Timing'] = timing.get_server_timing(
+                    duration_ns
+                )
+
+        if not logger.isEnabledFor(logging.INFO):
+            return response
+
+        sample_weight = self.get_sample_weight(request, response, duration)
+        if sample_weight is None:
+            return response
+
         app = get_oauth2_app(request)
 
         app_name = getattr(app, 'name', self.UNKNOWN_APP_NAME)
 
-        logger.info(
-            self.LOG_FORMAT.format(app_name=app_name,
-                                   request=request,
-                                   response=response)
+        # The sample weight is always given, so that the request counts can
+        # be computed from the sampled logs
+        extra = {'sample_weight': sample_weight}
+        if self.STRUCTURED:
+            extra.update(self.get_log_extra(app, app_name, request, response))
+            extra['duration'] = duration
+
+        self.log(
+            self.render_log(app_name=app_name,
+                            request=request,
+                            response=response,
+                            duration=(
+                                '-' if duration is None else duration
+                            ),
+                            sample_weight=sample_weight),
+            extra
         )
 
         return response
+
+    def get_sample_weight(self, request, response, duration):
+        """
+        Return the number of requests the access log of the request stands
+        for (the inverse of its sample rate), or None when it isn't logged
+        """
+        if self.exclude_paths and request.path.startswith(
+            self.exclude_paths
+        ):
+            return None
+
+        status_code = response.status_code
+        if status_code >= 400 or (
+            self.SLOW_THRESHOLD is not None and
+            duration is not None and
+            duration >= self.SLOW_THRESHOLD
+        ):
+            return 1.0
+
+        sample_rate = self.SAMPLE_RATES.get(
+            '{}xx'.format(status_code // 100),
+            1.0
+        )
+        if sample_rate >= 1:
+            return 1.0
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return None
+
+        return 1.0 / sample_rate
+
+    def get_log_extra(self, app, app_name, request, response):
+        return {
+            'app_name': app_name,
+            'client_id': getattr(app, 'client_id', None),
+            'status_code': response.status_code,
+            'method': request.method,
+            'path': request.path,
+            'response_size': get_response_size(response),
+            'hostname': AddHostName.hostname,
+        }
+
+    def log(self, message, extra=None):
+        if self.log_dispatcher is None:
+            logger.info(message, extra=extra)
+        else:
+            self.log_dispatcher.log(logging.INFO, message, extra)
+
+
+def get_response_size(response):
+    if getattr(response, 'streaming', False):
+        return None
+    return len(response.content)
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """
+    Limit the requests of each client, identified by its address, to
+    TOOLKIT['MIDDLEWARE_RATE_LIMIT_RATE'] requests every
+    TOOLKIT['MIDDLEWARE_RATE_LIMIT_PERIOD'] seconds, responding with a
+    429 status code and a Retry-After header when it is exceeded.
+    """
+
+    RATE = MIDDLEWARE_RATE_LIMIT_RATE
+    PERIOD = MIDDLEWARE_RATE_LIMIT_PERIOD
+    BURST = MIDDLEWARE_RATE_LIMIT_BURST
+    CACHE_ALIAS = MIDDLEWARE_RATE_LIMIT_CACHE_ALIAS
+
+    def process_request(self, request):
+        if not self.RATE:
+            return None
+
+        retry_after = self.get_rate_limiter(request).check()
+        if not retry_after:
+            return None
+
+        response = HttpResponse(status=429)
+        response['Retry-After'] = int(math.ceil(retry_after))
+        return response
+
+    def get_rate_limiter(self, request):
+        return RateLimiter(
+            key=self.get_rate_limit_key(request),
+            rate=self.RATE,
+            period=self.PERIOD,
+            burst=self.BURST,
+            cache_alias=self.CACHE_ALIAS
+        )
+
+    def get_rate_limit_key(self, request):
+        return 'rate_limit_{}'.format(request.META.get('REMOTE_ADDR'))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from django.contrib.auth import get_user_model
+from oauth2_provider.models import (
+    get_access_token_model,
+    get_application_model
+)
+
+AccessToken = get_access_token_model()
+Application = get_application_model()
+
+APPLICATION_FIELDS = ('id', 'name', 'client_id')
+
+# The user fields checked on most requests (as by `has_perm` and the
+# permissions of django rest framework), when the user model has them
+USER_FIELDS = ('is_active', 'is_staff', 'is_superuser')
+
+
+def dump_access_token(access_token):
+    """
+    Return a compact payload of an access token, with only the fields needed
+    to validate it and to identify its application and user
+    """
+    application = access_token.application
+    user = access_token.user
+
+    return {
+        'id': access_token.pk,
+        'token': access_token.token,
+        'expires': access_token.expires,
+        'scope': access_token.scope,
+        'application': application and {
+            field: getattr(application, field)
+            for field in APPLICATION_FIELDS
+        },
+        'user': user and _dump_user(user),
+    }
+
+
+def _dump_user(user):
+    values = {
+        user._meta.pk.attname: user.pk,
+        user.USERNAME_FIELD: user.get_username(),
+    }
+
+    field_names = set(field.attname for field in user._meta.concrete_fields)
+    values.update(
+        (field_name, getattr(user, field_name))
+        for field_name in USER_FIELDS
+        if field_name in field_names
+    )
+
+    return values
+
+
+def load_access_token(payload):
+    """
+    Build an access token from its payload. The fields that are not in the
+    payload are deferred, so they are only loaded from the database when
+    accessed.
+    """
+    access_token = _from_db(AccessToken, {
+        'id': payload['id'],
+        'token': payload['token'],
+        'expires': payload['expires'],
+        'scope': payload['scope'],
+    })
+
+    application = payload['application']
+    access_token.application = application and _from_db(
+        Application,
+        application
+    )
+
+    user = payload['user']
+    access_token.user = user and _from_db(get_user_model(), user)
+
+    return access_token
+
+
+def _from_db(model, values):
+    field_names = [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.attname in values
+    ]
+    return model.from_db(
+        None,
+        field_names,
+        [values[field_name] for field_name in field_names]
+    )
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 from django.core.cache import caches
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from oauth2_provider.models import get_access_token_model
 
 from django_toolkit import toolkit_settings
 
+from . import validators
+
 cache = caches[toolkit_settings.ACCESS_TOKEN_CACHE_BACKEND]
 AccessToken = get_access_token_model()
 
@@ -13,3 +15,13 @@ AccessToken = get_access_token_model()
 @receiver(post_delete, sender=AccessToken)
 def invalidate_token_cache(sender, instance, **kwargs):
     cache.delete(instance.token)
+
+    if validators.local_cache is not None:
+        validators.local_cache.delete(instance.token)
+
+
+@receiver(post_save, sender=AccessToken)
+def invalidate_negative_token_cache(sender, instance, **kwargs):
+    # A token may have been looked up before being saved
+    if validators.negative_cache is not None:
+        validators.negative_cache.delete(instance.token)
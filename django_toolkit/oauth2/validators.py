@@ -1,21 +1,53 @@
 # -*- coding: utf-8 -*-
+import math
+import random
+import time
+
 from django.core.cache import caches
 from django.utils import timezone
 from oauth2_provider.models import get_access_token_model
 from oauth2_provider.oauth2_validators import OAuth2Validator
 
 from django_toolkit import toolkit_settings
+from django_toolkit.concurrent.locks import CacheLock
+from django_toolkit.concurrent.single_flight import SingleFlight
+from django_toolkit.local_cache import LocalCache
+from django_toolkit.timing import timed_phase
+
+from .payloads import dump_access_token, load_access_token
 
 cache = caches[toolkit_settings.ACCESS_TOKEN_CACHE_BACKEND]
 AccessToken = get_access_token_model()
 
+local_cache = None
+if toolkit_settings.ACCESS_TOKEN_LOCAL_CACHE_SIZE:
+    local_cache = LocalCache(
+        max_size=toolkit_settings.ACCESS_TOKEN_LOCAL_CACHE_SIZE,
+        shards=toolkit_settings.ACCESS_TOKEN_LOCAL_CACHE_SHARDS
+    )
+
+single_flight = SingleFlight()
+
+negative_cache = None
+if toolkit_settings.ACCESS_TOKEN_NEGATIVE_CACHE_TIMEOUT:
+    negative_cache = LocalCache(
+        max_size=toolkit_settings.ACCESS_TOKEN_NEGATIVE_CACHE_SIZE,
+        shards=toolkit_settings.ACCESS_TOKEN_LOCAL_CACHE_SHARDS
+    )
+
 
 class CachedOAuth2Validator(OAuth2Validator):
 
+    coalesce_poll_interval = 0.05
+
     def get_queryset(self):
         return AccessToken.objects.select_related('application', 'user')
 
     def validate_bearer_token(self, token, scopes, request):
+        with timed_phase('auth'):
+            return self._validate_bearer_token(token, scopes, request)
+
+    def _validate_bearer_token(self, token, scopes, request):
         if not token:
             return False
 
@@ -34,16 +66,147 @@ class CachedOAuth2Validator(OAuth2Validator):
             return False
 
     def _get_access_token(self, token):
-        access_token = cache.get(token)
+        if negative_cache is None:
+            return self._get_cached_access_token(token)
+
+        if negative_cache.get(token):
+            raise AccessToken.DoesNotExist(
+                'Access token {} is unknown'.format(token)
+            )
+
+        try:
+            return self._get_cached_access_token(token)
+        except AccessToken.DoesNotExist:
+            negative_cache.set(
+                token,
+                True,
+                toolkit_settings.ACCESS_TOKEN_NEGATIVE_CACHE_TIMEOUT
+            )
+            raise
+
+    def _get_cached_access_token(self, token):
+        # The access token is built from its payload on every request, so
+        # that requests don't share (and mutate) the same model instances
+        return load_access_token(self._get_payload(token))
+
+    def _get_payload(self, token):
+        if local_cache is None:
+            return self._get_shared_payload(token)
+
+        payload = local_cache.get(token)
+        if payload is None:
+            payload = self._get_shared_payload(token)
+            local_cache.set(
+                token,
+                payload,
+                min(
+                    (payload['expires'] - timezone.now()).total_seconds(),
+                    toolkit_settings.ACCESS_TOKEN_LOCAL_CACHE_TIMEOUT
+                )
+            )
+
+        return payload
+
+    def _get_shared_payload(self, token):
+        payload = self._to_payload(cache.get(token))
 
-        if access_token is None:
-            access_token = self.get_queryset().get(
-                token=token
+        if payload is None:
+            # Concurrent requests of the same token run a single query
+            return single_flight.do(
+                token,
+                lambda: self._fetch_payload(token),
+                timeout=toolkit_settings.ACCESS_TOKEN_COALESCE_TIMEOUT
             )
-            now = timezone.now()
-            if (access_token.expires > now):
-                timeout = (access_token.expires - now).seconds
 
-                cache.set(token, access_token, timeout)
+        if self._should_refresh_early(payload):
+            # The cached payload is still valid, so the requests don't wait
+            # for an early refresh already run by another thread
+            return single_flight.try_do(
+                token,
+                lambda: self._fetch_payload(token, payload),
+                default=payload
+            )
+
+        return payload
+
+    def _should_refresh_early(self, payload):
+        """
+        Probabilistic early expiration (XFetch): the closer the cache entry is
+        to expire and the longer the query takes, the likelier a request
+        refreshes it, so that entries are refreshed before they expire
+        """
+        beta = toolkit_settings.ACCESS_TOKEN_CACHE_EARLY_REFRESH_BETA
+        if not beta:
+            return False
+
+        cache_expires = payload.get('cache_expires')
+        if cache_expires is None:
+            return False
+
+        return time.time() - (
+            payload['delta'] * beta * math.log(1 - random.random())
+        ) >= cache_expires
+
+    def _to_payload(self, value):
+        # Entries cached before the compact payload hold the whole model
+        if isinstance(value, AccessToken):
+            return dump_access_token(value)
+
+        return value
+
+    def _fetch_payload(self, token, cached_payload=None):
+        lock_expire = toolkit_settings.ACCESS_TOKEN_COALESCE_LOCK_EXPIRE
+        if not lock_expire:
+            return self._query_payload(token)
+
+        lock_key = 'coalesce_{}'.format(token)
+        with CacheLock(
+            key=lock_key,
+            cache_alias=toolkit_settings.ACCESS_TOKEN_CACHE_BACKEND,
+            expire=lock_expire,
+            raise_exception=False
+        ) as lock:
+            if lock.active:
+                return self._query_payload(token)
+
+        # An early refresh is already run by another process, so the cached
+        # payload, still valid, is used without waiting for it
+        if cached_payload is not None:
+            return cached_payload
+
+        # Another process is querying the token, so wait for it to be cached
+        # while the other process holds the lock
+        deadline = time.time() + lock_expire
+        while time.time() < deadline:
+            time.sleep(self.coalesce_poll_interval)
+
+            values = cache.get_many([token, lock_key])
+            if token in values:
+                return self._to_payload(values[token])
+            if lock_key not in values:
+                break
+
+        return self._query_payload(token)
+
+    def _query_payload(self, token):
+        started_at = time.time()
+        access_token = self.get_queryset().get(
+            token=token
+        )
+        delta = time.time() - started_at
+
+        timeout = (access_token.expires - timezone.now()).total_seconds()
+        max_timeout = toolkit_settings.ACCESS_TOKEN_CACHE_MAX_TIMEOUT
+        if max_timeout:
+            timeout = min(timeout, max_timeout)
+
+        payload = dump_access_token(access_token)
+        if timeout > 0:
+            payload.update({
+                'cache_expires': time.time() + timeout,
+                'delta': delta,
+            })
+
+            cache.set(token, payload, int(timeout))
 
-        return access_token
+        return payload
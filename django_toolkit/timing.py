@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
+if hasattr(time, 'perf_counter_ns'):
+    perf_counter_ns = time.perf_counter_ns
+else:  # Python < 3.7
+    _perf_counter = getattr(time, 'perf_counter', time.time)
+
+    def perf_counter_ns():
+        return int(_perf_counter() * 1000000000)
+
+
+class RequestTiming(object):
+    """
+    The elapsed time of a request and the total time of each of its phases
+    (as the access token validation), in nanoseconds
+
+    The timing of the current request is kept in a context variable (a
+    thread local before Python 3.7), so that the phases can be timed
+    without access to the request
+    """
+
+    def __init__(self):
+        self.started_at = perf_counter_ns()
+        self.phases = {}
+        self._started_phases = {}
+
+    @property
+    def duration(self):
+        return perf_counter_ns() - self.started_at
+
+    def add(self, phase, duration):
+        self.phases[phase] = self.phases.get(phase, 0) + duration
+
+    def start(self, phase):
+        self._started_phases[phase] = perf_counter_ns()
+
+    def stop(self, phase):
+        started_at = self._started_phases.pop(phase, None)
+        if started_at is not None:
+            self.add(phase, perf_counter_ns() - started_at)
+
+    def get_server_timing(self, duration):
+        """
+        Return the Server-Timing header value of the request, in
+        milliseconds
+        """
+        metrics = [('total', duration)] + sorted(self.phases.items())
+        return ', '.join(
+            '{name};dur={duration:.3f}'.format(
+                name=name,
+                duration=to_milliseconds(duration)
+            )
+            for name, duration in metrics
+        )
+
+    @contextmanager
+    def phase(self, phase):
+        started_at = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(phase, perf_counter_ns() - started_at)
+
+
+if contextvars is not None:
+    _current_timing = contextvars.ContextVar('request_timing', default=None)
+
+    def get_request_timing():
+        return _current_timing.get()
+
+    def _set_request_timing(timing):
+        _current_timing.set(timing)
+else:
+    _local = threading.local()
+
+    def get_request_timing():
+        return getattr(_local, 'timing', None)
+
+    def _set_request_timing(timing):
+        _local.timing = timing
+
+
+def start_request_timing():
+    timing = RequestTiming()
+    _set_request_timing(timing)
+    return timing
+
+
+def stop_request_timing():
+    _set_request_timing(None)
+
+
+@contextmanager
+def timed_phase(phase):
+    """
+    Add the time spent in the block to the `phase` of the current request
+    timing, if any
+    """
+    timing = get_request_timing()
+    if timing is None:
+        yield
+        return
+
+    with timing.phase(phase):
+        yield
+
+
+def to_milliseconds(nanoseconds):
+    return nanoseconds / 1000000.0
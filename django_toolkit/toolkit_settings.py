@@ -7,9 +7,147 @@ ACCESS_TOKEN_CACHE_BACKEND = _toolkit_settings.get(
     'access_token'
 )
 
+# Size of the in-memory cache of access tokens kept by each process, it is
+# disabled when 0
+ACCESS_TOKEN_LOCAL_CACHE_SIZE = _toolkit_settings.get(
+    'ACCESS_TOKEN_LOCAL_CACHE_SIZE',
+    0
+)
+
+ACCESS_TOKEN_LOCAL_CACHE_SHARDS = _toolkit_settings.get(
+    'ACCESS_TOKEN_LOCAL_CACHE_SHARDS',
+    16
+)
+
+# Maximum time in seconds an access token is kept in the in-memory cache,
+# which bounds how long a revoked token is accepted by other processes
+ACCESS_TOKEN_LOCAL_CACHE_TIMEOUT = _toolkit_settings.get(
+    'ACCESS_TOKEN_LOCAL_CACHE_TIMEOUT',
+    30
+)
+
+# Time in seconds an unknown access token is remembered by each process to
+# avoid querying the database again, it is disabled when 0
+ACCESS_TOKEN_NEGATIVE_CACHE_TIMEOUT = _toolkit_settings.get(
+    'ACCESS_TOKEN_NEGATIVE_CACHE_TIMEOUT',
+    0
+)
+
+ACCESS_TOKEN_NEGATIVE_CACHE_SIZE = _toolkit_settings.get(
+    'ACCESS_TOKEN_NEGATIVE_CACHE_SIZE',
+    10000
+)
+
+# Time in seconds a request waits for a concurrent database query of the same
+# access token, in the same process, before querying it by itself
+ACCESS_TOKEN_COALESCE_TIMEOUT = _toolkit_settings.get(
+    'ACCESS_TOKEN_COALESCE_TIMEOUT',
+    5
+)
+
+# Expiration in seconds of the cache lock that coalesces the database queries
+# of an access token across processes, it is disabled when 0
+ACCESS_TOKEN_COALESCE_LOCK_EXPIRE = _toolkit_settings.get(
+    'ACCESS_TOKEN_COALESCE_LOCK_EXPIRE',
+    0
+)
+
+# Maximum time in seconds an access token is kept in the cache backend, by
+# default it is kept until it expires
+ACCESS_TOKEN_CACHE_MAX_TIMEOUT = _toolkit_settings.get(
+    'ACCESS_TOKEN_CACHE_MAX_TIMEOUT',
+    None
+)
+
+# Beta of the probabilistic early refresh of cached access tokens, higher
+# values refresh earlier and 0 disables it
+ACCESS_TOKEN_CACHE_EARLY_REFRESH_BETA = _toolkit_settings.get(
+    'ACCESS_TOKEN_CACHE_EARLY_REFRESH_BETA',
+    1.0
+)
+
 API_VERSION = _toolkit_settings.get('API_VERSION')
 
 MIDDLEWARE_ACCESS_LOG_FORMAT = _toolkit_settings.get(
     'MIDDLEWARE_ACCESS_LOG_FORMAT',
     u'[{app_name}] {response.status_code} {request.method} {request.path}'
 )
+
+# Maximum number of requests of a client every
+# MIDDLEWARE_RATE_LIMIT_PERIOD seconds, the rate limit is disabled when None
+MIDDLEWARE_RATE_LIMIT_RATE = _toolkit_settings.get(
+    'MIDDLEWARE_RATE_LIMIT_RATE',
+    None
+)
+
+MIDDLEWARE_RATE_LIMIT_PERIOD = _toolkit_settings.get(
+    'MIDDLEWARE_RATE_LIMIT_PERIOD',
+    1
+)
+
+# Maximum number of requests of a client at once, it defaults to the rate
+MIDDLEWARE_RATE_LIMIT_BURST = _toolkit_settings.get(
+    'MIDDLEWARE_RATE_LIMIT_BURST',
+    None
+)
+
+MIDDLEWARE_RATE_LIMIT_CACHE_ALIAS = _toolkit_settings.get(
+    'MIDDLEWARE_RATE_LIMIT_CACHE_ALIAS',
+    'default'
+)
+
+# Size of the queue of access log records handled by a background thread, so
+# that a slow log handler doesn't delay the responses. The access logs are
+# handled by the request thread when 0
+MIDDLEWARE_ACCESS_LOG_QUEUE_SIZE = _toolkit_settings.get(
+    'MIDDLEWARE_ACCESS_LOG_QUEUE_SIZE',
+    0
+)
+
+# When True, a request waits up to MIDDLEWARE_ACCESS_LOG_QUEUE_TIMEOUT
+# seconds for room in a full queue, otherwise its access log is dropped
+MIDDLEWARE_ACCESS_LOG_QUEUE_BLOCK = _toolkit_settings.get(
+    'MIDDLEWARE_ACCESS_LOG_QUEUE_BLOCK',
+    False
+)
+
+MIDDLEWARE_ACCESS_LOG_QUEUE_TIMEOUT = _toolkit_settings.get(
+    'MIDDLEWARE_ACCESS_LOG_QUEUE_TIMEOUT',
+    0.1
+)
+
+# When True, the access logs include their fields as record attributes (as
+# `status_code` and `path`), to be rendered by a structured formatter as
+# django_toolkit.logs.formatters.JSONFormatter
+MIDDLEWARE_ACCESS_LOG_STRUCTURED = _toolkit_settings.get(
+    'MIDDLEWARE_ACCESS_LOG_STRUCTURED',
+    False
+)
+
+# When True, the AccessLogMiddleware adds a Server-Timing header with the
+# request duration broken down in phases (as auth, view and circuit_breaker)
+MIDDLEWARE_SERVER_TIMING = _toolkit_settings.get(
+    'MIDDLEWARE_SERVER_TIMING',
+    False
+)
+
+# Fraction of the access logs of each status class (as {'2xx': 0.01}) that is
+# logged, the classes not given are fully logged. The client (4xx) and server
+# (5xx) errors and the slow requests are always logged
+MIDDLEWARE_ACCESS_LOG_SAMPLE_RATES = _toolkit_settings.get(
+    'MIDDLEWARE_ACCESS_LOG_SAMPLE_RATES',
+    {}
+)
+
+# Duration in milliseconds from which a request is always logged, regardless
+# of the sample rates, it is disabled when None
+MIDDLEWARE_ACCESS_LOG_SLOW_THRESHOLD = _toolkit_settings.get(
+    'MIDDLEWARE_ACCESS_LOG_SLOW_THRESHOLD',
+    None
+)
+
+# Path prefixes (as '/healthcheck') of the requests that are never logged
+MIDDLEWARE_ACCESS_LOG_EXCLUDE_PATHS = _toolkit_settings.get(
+    'MIDDLEWARE_ACCESS_LOG_EXCLUDE_PATHS',
+    ()
+)
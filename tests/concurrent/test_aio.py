@@ -0,0 +1,401 @@
+import asyncio
+import time
+
+import mock
+import pytest
+from django.core.cache import caches
+
+from django_toolkit.concurrent.aio import LocalAsyncLock
+from django_toolkit.concurrent.locks import (
+    CacheLock,
+    LocalMemoryLock,
+    LockAcquireError,
+    LockActiveError,
+    LockReleaseError,
+    MultiCacheLock,
+    ReadWriteCacheLock
+)
+from django_toolkit.concurrent.rate_limiters import (
+    RateLimiter,
+    RateLimitExceededError,
+    _local_blocked_until
+)
+from django_toolkit.concurrent.semaphores import CacheSemaphore
+
+cache = caches['default']
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(cache, 'aget'),
+    reason='The async cache API requires Django 4.0+'
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+class TestAsyncLocalMemoryLock:
+
+    def test_should_be_active_on_async_enter(self, run_async):
+        lock = LocalMemoryLock()
+
+        async def run():
+            async with lock:
+                assert lock.active
+            assert not lock.active
+
+        run_async(run())
+
+    def test_should_raise_exception_when_lock_is_already_active(
+        self,
+        run_async
+    ):
+        lock = LocalMemoryLock()
+
+        async def run():
+            async with lock:
+                async with lock:
+                    pass
+
+        with pytest.raises(LockActiveError):
+            run_async(run())
+
+
+class TestAsyncCacheLock:
+
+    def test_should_acquire_and_release_lock(self, run_async):
+        async def run():
+            async with CacheLock(key='async_test') as lock:
+                assert lock.active
+                assert cache.get('async_test') == lock.token
+            return lock
+
+        lock = run_async(run())
+
+        assert not lock.active
+        assert cache.get('async_test') is None
+
+    def test_should_raise_exception_when_lock_is_already_active(
+        self,
+        run_async
+    ):
+        async def run():
+            async with CacheLock(key='async_test'):
+                async with CacheLock(key='async_test'):
+                    pass
+
+        with pytest.raises(LockActiveError):
+            run_async(run())
+
+    def test_should_not_raise_exception_when_disabled(self, run_async):
+        async def run():
+            async with CacheLock(key='async_test'):
+                async with CacheLock(
+                    key='async_test',
+                    raise_exception=False
+                ) as lock:
+                    return lock.active
+
+        assert run_async(run()) is False
+
+    def test_should_not_release_lock_of_another_owner(self, run_async):
+        async def run():
+            async with CacheLock(key='async_test'):
+                await cache.aset('async_test', 1)
+
+        run_async(run())
+
+        assert cache.get('async_test') == 1
+
+    def test_should_wait_until_lock_is_released(self, run_async):
+        async def hold():
+            async with CacheLock(key='async_test'):
+                await asyncio.sleep(0.05)
+
+        async def wait():
+            await asyncio.sleep(0.01)
+            async with CacheLock(
+                key='async_test',
+                blocking=True,
+                timeout=1,
+                retry_delay=0.01,
+                max_retry_delay=0.02
+            ) as lock:
+                return lock.active
+
+        async def run():
+            return await asyncio.gather(hold(), wait())
+
+        assert run_async(run())[1] is True
+
+    def test_should_give_up_waiting_after_timeout(self, run_async):
+        cache.set('async_test', 1)
+
+        async def run():
+            async with CacheLock(
+                key='async_test',
+                blocking=True,
+                timeout=0.05,
+                raise_exception=False
+            ) as lock:
+                return lock.active
+
+        assert run_async(run()) is False
+
+    def test_should_increase_fencing_token(self, run_async):
+        async def run():
+            tokens = []
+            for _ in range(2):
+                async with CacheLock(key='async_test', fencing=True) as lock:
+                    tokens.append(lock.fencing_token)
+            return tokens
+
+        first, second = run_async(run())
+
+        assert second == first + 1
+
+    def test_should_renew_lock_while_active(self, run_async):
+        async def run():
+            async with CacheLock(
+                key='async_test',
+                expire=1,
+                renew_interval=0.01
+            ) as lock:
+                with mock.patch.object(
+                    lock,
+                    '_arenew',
+                    wraps=lock._arenew
+                ) as arenew:
+                    await asyncio.sleep(0.05)
+            return lock, arenew
+
+        lock, arenew = run_async(run())
+
+        assert arenew.called
+        assert lock._renewal is None
+        assert not lock.lease_lost.is_set()
+
+    def test_should_set_lease_lost_when_lock_is_lost(self, run_async):
+        on_renew_failure = mock.Mock()
+
+        async def run():
+            async with CacheLock(
+                key='async_test',
+                renew_interval=0.01,
+                on_renew_failure=on_renew_failure
+            ) as lock:
+                await cache.aset('async_test', 1)
+                await asyncio.sleep(0.05)
+            return lock
+
+        lock = run_async(run())
+
+        assert lock.lease_lost.is_set()
+        on_renew_failure.assert_called_once_with(lock)
+
+    def test_should_raise_acquire_error_when_cache_fails(self, run_async):
+        lock = CacheLock(key='async_test')
+
+        async def run():
+            async with lock:
+                pass
+
+        with mock.patch.object(
+            lock.cache,
+            'aadd',
+            side_effect=Exception('boom')
+        ):
+            with pytest.raises(LockAcquireError):
+                run_async(run())
+
+    def test_should_raise_release_error_when_cache_fails(self, run_async):
+        lock = CacheLock(key='async_test')
+
+        async def run():
+            async with lock:
+                lock.cache.aget = mock.Mock(side_effect=Exception('boom'))
+
+        try:
+            with pytest.raises(LockReleaseError):
+                run_async(run())
+        finally:
+            del lock.cache.aget
+
+
+class TestAsyncMultiCacheLock:
+
+    def test_should_acquire_and_release_all_keys(self, run_async):
+        async def run():
+            async with MultiCacheLock(keys=['sku_2', 'sku_1']) as lock:
+                assert lock.active
+                assert await cache.aget_many(['sku_1', 'sku_2']) == {
+                    'sku_1': lock.token,
+                    'sku_2': lock.token,
+                }
+
+        run_async(run())
+
+        assert cache.get_many(['sku_1', 'sku_2']) == {}
+
+    def test_should_not_keep_any_key_when_one_is_locked(self, run_async):
+        cache.set('sku_2', 1)
+
+        async def run():
+            async with MultiCacheLock(keys=['sku_1', 'sku_2']):
+                pass
+
+        with pytest.raises(LockActiveError):
+            run_async(run())
+
+        assert cache.get_many(['sku_1', 'sku_2']) == {'sku_2': 1}
+
+
+class TestLocalAsyncLock:
+
+    def test_should_be_active_on_enter(self, run_async):
+        async def run():
+            async with LocalAsyncLock(key='task') as lock:
+                assert lock.active
+            return lock
+
+        assert not run_async(run()).active
+
+    def test_should_raise_exception_when_held_by_another_task(
+        self,
+        run_async
+    ):
+        async def run():
+            async with LocalAsyncLock(key='task'):
+                async with LocalAsyncLock(key='task'):
+                    pass
+
+        with pytest.raises(LockActiveError):
+            run_async(run())
+
+    def test_should_wait_until_lock_is_released(self, run_async):
+        async def hold():
+            async with LocalAsyncLock(key='task'):
+                await asyncio.sleep(0.02)
+
+        async def wait():
+            await asyncio.sleep(0)
+            async with LocalAsyncLock(
+                key='task',
+                blocking=True,
+                timeout=1
+            ) as lock:
+                return lock.active
+
+        async def run():
+            return await asyncio.gather(hold(), wait())
+
+        assert run_async(run())[1] is True
+
+    def test_should_not_wait_behind_a_pending_waiter(self, run_async):
+        async def run():
+            holder = LocalAsyncLock(key='task')
+            await holder.__aenter__()
+
+            async def wait():
+                async with LocalAsyncLock(key='task', blocking=True):
+                    await asyncio.sleep(1)
+
+            waiter = asyncio.ensure_future(wait())
+            await asyncio.sleep(0)
+
+            # The lock is released to the pending waiter, which hasn't run yet
+            await holder.__aexit__(None, None, None)
+            try:
+                lock = LocalAsyncLock(key='task', raise_exception=False)
+                started_at = time.time()
+                await lock.__aenter__()
+                return lock.active, time.time() - started_at
+            finally:
+                waiter.cancel()
+
+        active, elapsed = run_async(run())
+        assert active is False
+        assert elapsed < 0.5
+
+    def test_should_give_up_waiting_after_timeout(self, run_async):
+        async def run():
+            async with LocalAsyncLock(key='task'):
+                async with LocalAsyncLock(
+                    key='task',
+                    blocking=True,
+                    timeout=0.01,
+                    raise_exception=False
+                ) as lock:
+                    return lock.active
+
+        assert run_async(run()) is False
+
+
+class TestAsyncReadWriteCacheLock:
+
+    def test_should_let_readers_in_and_keep_writers_out(self, run_async):
+        lock = ReadWriteCacheLock(key='rw')
+
+        async def run():
+            async with lock.read() as first, lock.read() as second:
+                assert first.active
+                assert second.active
+                async with lock.write():
+                    pass
+
+        with pytest.raises(LockActiveError):
+            run_async(run())
+
+        assert cache.get('rw:readers') == 0
+
+
+class TestAsyncCacheSemaphore:
+
+    def test_should_let_up_to_value_holders_in(self, run_async):
+        async def run():
+            async with CacheSemaphore(key='partner', value=1) as semaphore:
+                assert semaphore.active
+                async with CacheSemaphore(key='partner', value=1):
+                    pass
+
+        with pytest.raises(LockActiveError):
+            run_async(run())
+
+        assert cache.get('partner:0') is None
+
+    def test_should_decorate_coroutine_functions(self, run_async):
+        @CacheSemaphore(key='partner', value=1)
+        async def call_partner():
+            return await cache.aget('partner:0')
+
+        assert run_async(call_partner()) is not None
+        assert cache.get('partner:0') is None
+
+
+class TestAsyncRateLimiter:
+
+    @pytest.fixture(autouse=True)
+    def clear_local_state(self):
+        _local_blocked_until.clear()
+        yield
+        _local_blocked_until.clear()
+
+    def test_should_allow_calls_up_to_the_rate(self, run_async):
+        limiter = RateLimiter(key='partner', rate=2, period=60)
+
+        async def run():
+            return [await limiter.aallow() for _ in range(3)]
+
+        assert run_async(run()) == [True, True, False]
+
+    def test_should_limit_decorated_coroutine_functions(self, run_async):
+        @RateLimiter(key='partner', rate=1, period=60)
+        async def call_partner():
+            return True
+
+        assert run_async(call_partner())
+        with pytest.raises(RateLimitExceededError):
+            run_async(call_partner())
@@ -1,12 +1,20 @@
+import threading
+import time
+
 import mock
 import pytest
+from django.core.cache import caches
 
 from django_toolkit.concurrent.locks import (
     CacheLock,
     LocalMemoryLock,
+    LocalThreadLock,
     LockAcquireError,
     LockActiveError,
-    LockReleaseError
+    LockReleaseError,
+    MultiCacheLock,
+    ReadWriteCacheLock,
+    ReleaseNotifier
 )
 
 
@@ -131,3 +139,665 @@ class TestCacheLock:
             with pytest.raises(LockReleaseError):
                 with lock:
                     pass
+
+
+class TestCacheLockOwnership:
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        caches['default'].delete('owned')
+
+    def test_should_store_an_owner_token(self):
+        with CacheLock(key='owned') as lock:
+            assert lock.token
+            assert lock.cache.get('owned') == lock.token
+
+    def test_should_store_different_tokens_for_each_acquisition(self):
+        with CacheLock(key='owned') as lock:
+            first_token = lock.token
+
+        with CacheLock(key='owned') as lock:
+            assert lock.token != first_token
+
+    def test_should_not_release_a_lock_owned_by_another_acquisition(self):
+        with CacheLock(key='owned', expire=10) as lock:
+            # the lock expires and is acquired by another worker
+            lock.cache.delete('owned')
+            other_lock = CacheLock(key='owned', expire=10).__enter__()
+
+        assert lock.cache.get('owned') == other_lock.token
+        other_lock.__exit__()
+
+    def test_should_release_with_a_script_on_redis(self):
+        lock = CacheLock(key='owned')
+        with mock.patch(
+            'django_toolkit.concurrent.locks.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.concurrent.locks.release_script',
+            return_value=1
+        ) as release_script:
+            with lock:
+                token = lock.token
+
+        release_script.assert_called_once_with(
+            lock.cache,
+            keys=['owned'],
+            args=[token]
+        )
+
+    def test_should_not_have_fencing_token_by_default(self):
+        with CacheLock(key='owned') as lock:
+            assert lock.fencing_token is None
+
+    def test_should_increase_the_fencing_token_on_each_acquisition(self):
+        lock = CacheLock(key='fenced', fencing=True)
+        lock.cache.delete('fenced:fencing')
+
+        with lock:
+            first_token = lock.fencing_token
+
+        with lock:
+            second_token = lock.fencing_token
+
+        assert first_token == 1
+        assert second_token == 2
+
+
+class TestCacheLockRenewal:
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        caches['default'].delete('renewed')
+
+    @pytest.mark.parametrize('expire,renew_interval', [
+        (None, 1),
+        (10, 10),
+        (10, 20),
+    ])
+    def test_should_require_a_renew_interval_smaller_than_expire(
+        self,
+        expire,
+        renew_interval
+    ):
+        with pytest.raises(ValueError):
+            CacheLock(
+                key='renewed',
+                expire=expire,
+                renew_interval=renew_interval
+            )
+
+    def test_should_require_an_expire_when_the_cache_never_expires(self):
+        with mock.patch.object(
+            caches['default'],
+            'default_timeout',
+            None
+        ), pytest.raises(ValueError):
+            CacheLock(key='renewed', renew_interval=1)
+
+    def test_should_keep_the_lock_while_the_context_is_active(self):
+        with CacheLock(key='renewed', expire=0.2, renew_interval=0.05) as lock:
+            time.sleep(0.4)
+
+            assert lock.cache.get('renewed') == lock.token
+            assert not lock.lease_lost.is_set()
+
+        assert lock.cache.get('renewed') is None
+
+    def test_should_stop_renewing_on_exit(self):
+        with CacheLock(
+            key='renewed',
+            expire=0.2,
+            renew_interval=0.05,
+            delete_on_exit=False
+        ) as lock:
+            renewal = lock._renewal
+
+        assert not renewal.is_alive()
+        time.sleep(0.3)
+        assert lock.cache.get('renewed') is None
+
+    def test_should_signal_when_the_lock_is_lost(self):
+        on_renew_failure = mock.Mock()
+
+        with CacheLock(
+            key='renewed',
+            expire=10,
+            renew_interval=0.05,
+            on_renew_failure=on_renew_failure
+        ) as lock:
+            lock.cache.delete('renewed')
+
+            assert lock.lease_lost.wait(1)
+
+        on_renew_failure.assert_called_once_with(lock)
+
+    def test_should_keep_trying_when_renewal_raises_an_error(self):
+        lock = CacheLock(key='renewed', expire=10, renew_interval=0.01)
+
+        with mock.patch.object(
+            lock,
+            '_renew',
+            side_effect=[Exception('oops')] + [True] * 100
+        ) as renew:
+            with lock:
+                time.sleep(0.1)
+
+        assert renew.call_count > 1
+        assert not lock.lease_lost.is_set()
+
+    def test_should_renew_with_the_cache_of_the_renewal_thread(self):
+        renewal_caches = []
+
+        def renew_script(cache, keys, args):
+            renewal_caches.append(cache)
+            return 1
+
+        with mock.patch(
+            'django_toolkit.concurrent.locks.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.concurrent.locks.renew_script',
+            side_effect=renew_script
+        ), mock.patch(
+            'django_toolkit.concurrent.locks.release_script'
+        ), CacheLock(key='renewed', expire=10, renew_interval=0.01) as lock:
+            time.sleep(0.05)
+
+        assert renewal_caches
+        assert lock.cache not in renewal_caches
+
+    def test_should_renew_with_a_script_on_redis(self):
+        lock = CacheLock(key='renewed', expire=10)
+        lock.token = 123
+
+        with mock.patch(
+            'django_toolkit.concurrent.locks.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.concurrent.locks.renew_script',
+            return_value=1
+        ) as renew_script:
+            assert lock._renew() is True
+
+        renew_script.assert_called_once_with(
+            lock.cache,
+            keys=['renewed'],
+            args=[123, 10000]
+        )
+
+
+class TestBlockingCacheLock:
+
+    def hold_lock(self, key, seconds):
+        acquired = threading.Event()
+
+        def hold():
+            with CacheLock(key=key, expire=10):
+                acquired.set()
+                time.sleep(seconds)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        acquired.wait(1)
+        return thread
+
+    def test_should_wait_for_the_lock_to_be_released(self):
+        thread = self.hold_lock('blocking', 0.1)
+
+        with CacheLock(key='blocking', blocking=True, timeout=5) as lock:
+            assert lock.active
+
+        thread.join()
+
+    def test_should_raise_exception_when_timeout_is_reached(self):
+        thread = self.hold_lock('blocking', 0.2)
+
+        with pytest.raises(LockActiveError):
+            with CacheLock(key='blocking', blocking=True, timeout=0.05):
+                pass
+
+        thread.join()
+
+    def test_should_not_be_active_when_timeout_is_reached(self):
+        thread = self.hold_lock('blocking', 0.2)
+
+        with CacheLock(
+            key='blocking',
+            blocking=True,
+            timeout=0.05,
+            raise_exception=False
+        ) as lock:
+            assert not lock.active
+
+        thread.join()
+
+    def test_should_retry_with_exponential_backoff(self):
+        lock = CacheLock(key='blocking', retry_delay=0.1, max_retry_delay=0.4)
+        delays = lock._get_retry_delays()
+
+        with mock.patch('random.uniform', side_effect=lambda a, b: b):
+            assert [next(delays) for _ in range(5)] == [
+                0.1, 0.2, 0.4, 0.4, 0.4
+            ]
+
+    def test_should_wake_up_waiters_when_lock_is_released(self):
+        thread = self.hold_lock('blocking', 0.1)
+
+        started_at = time.time()
+        with mock.patch('random.uniform', return_value=10):
+            with CacheLock(
+                key='blocking',
+                blocking=True,
+                retry_delay=10,
+                max_retry_delay=10,
+            ):
+                pass
+
+        assert time.time() - started_at < 5
+        thread.join()
+
+
+class TestReleaseNotifier:
+
+    def test_should_wake_up_waiters_of_the_key(self):
+        notifier = ReleaseNotifier()
+        threading.Timer(0.05, notifier.notify, args=('key',)).start()
+
+        started_at = time.time()
+        notifier.wait('key', 5)
+
+        assert time.time() - started_at < 5
+        assert not notifier._waiters
+
+    def test_should_wait_until_timeout_without_notification(self):
+        notifier = ReleaseNotifier()
+
+        started_at = time.time()
+        notifier.wait('key', 0.05)
+
+        assert time.time() - started_at >= 0.05
+
+
+class TestMultiCacheLock:
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        caches['default'].delete_many(['sku_1', 'sku_2', 'sku_3'])
+        yield
+        caches['default'].delete_many(['sku_1', 'sku_2', 'sku_3'])
+
+    def test_should_sort_and_deduplicate_keys(self):
+        lock = MultiCacheLock(keys=['sku_3', 'sku_1', 'sku_3', 'sku_2'])
+
+        assert lock.keys == ['sku_1', 'sku_2', 'sku_3']
+
+    def test_should_acquire_all_keys(self):
+        with MultiCacheLock(keys=['sku_2', 'sku_1']) as lock:
+            assert lock.active
+            assert lock.cache.get_many(['sku_1', 'sku_2']) == {
+                'sku_1': lock.token,
+                'sku_2': lock.token,
+            }
+
+    def test_should_release_all_keys(self):
+        with MultiCacheLock(keys=['sku_1', 'sku_2']) as lock:
+            pass
+
+        assert not lock.active
+        assert lock.cache.get_many(['sku_1', 'sku_2']) == {}
+
+    def test_should_not_keep_any_key_when_one_is_locked(self):
+        with CacheLock(key='sku_2') as other_lock:
+            with MultiCacheLock(
+                keys=['sku_1', 'sku_2', 'sku_3'],
+                raise_exception=False
+            ) as lock:
+                assert not lock.active
+                assert lock.cache.get_many(['sku_1', 'sku_2', 'sku_3']) == {
+                    'sku_2': other_lock.token,
+                }
+
+    def test_should_raise_exception_when_one_key_is_locked(self):
+        with pytest.raises(LockActiveError):
+            with MultiCacheLock(keys=['sku_1', 'sku_2']):
+                with MultiCacheLock(keys=['sku_2', 'sku_3']):
+                    pass
+
+    def test_should_not_release_keys_of_another_owner(self):
+        with MultiCacheLock(keys=['sku_1', 'sku_2']) as lock:
+            # sku_1 expires and is acquired by another worker
+            lock.cache.set('sku_1', 1)
+
+        assert lock.cache.get_many(['sku_1', 'sku_2']) == {'sku_1': 1}
+
+    def test_should_wait_until_keys_are_released(self):
+        holder = MultiCacheLock(keys=['sku_1', 'sku_2']).__enter__()
+        timer = threading.Timer(0.05, holder.__exit__)
+        timer.start()
+
+        with MultiCacheLock(
+            keys=['sku_2', 'sku_3'],
+            blocking=True,
+            timeout=2
+        ) as lock:
+            assert lock.active
+
+        timer.join()
+
+    def test_should_acquire_with_a_script_on_redis(self):
+        lock = MultiCacheLock(keys=['sku_2', 'sku_1'], expire=10)
+        with mock.patch(
+            'django_toolkit.concurrent.locks.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.concurrent.locks.multi_acquire_script',
+            return_value=1
+        ) as multi_acquire_script, mock.patch(
+            'django_toolkit.concurrent.locks.multi_release_script',
+            return_value=2
+        ) as multi_release_script:
+            with lock:
+                token = lock.token
+
+        multi_acquire_script.assert_called_once_with(
+            lock.cache,
+            keys=['sku_1', 'sku_2'],
+            args=[token, 10000]
+        )
+        multi_release_script.assert_called_once_with(
+            lock.cache,
+            keys=['sku_1', 'sku_2'],
+            args=[token]
+        )
+
+    def test_should_not_acquire_when_script_fails_to_acquire(self):
+        lock = MultiCacheLock(keys=['sku_1'], raise_exception=False)
+        with mock.patch(
+            'django_toolkit.concurrent.locks.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.concurrent.locks.multi_acquire_script',
+            return_value=0
+        ):
+            with lock:
+                assert not lock.active
+                assert lock.token is None
+
+
+class TestLocalThreadLock:
+
+    def hold_lock(self, key, seconds):
+        acquired = threading.Event()
+
+        def hold():
+            with LocalThreadLock(key=key):
+                acquired.set()
+                time.sleep(seconds)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        acquired.wait()
+        return thread
+
+    def test_should_be_active_on_enter(self):
+        with LocalThreadLock(key='thread') as lock:
+            assert lock.active
+
+        assert not lock.active
+
+    def test_should_share_the_lock_by_key(self):
+        assert (
+            LocalThreadLock(key='thread')._lock is
+            LocalThreadLock(key='thread')._lock
+        )
+        assert (
+            LocalThreadLock(key='thread')._lock is not
+            LocalThreadLock(key='other')._lock
+        )
+
+    def test_should_keep_the_status_of_a_shared_instance_per_thread(self):
+        lock = LocalThreadLock(key='shared', raise_exception=False)
+        acquired = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with lock:
+                acquired.set()
+                release.wait(1)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        acquired.wait(1)
+
+        statuses = []
+
+        def try_acquire():
+            with lock:
+                statuses.append(lock.active)
+
+        thread = threading.Thread(target=try_acquire)
+        thread.start()
+        thread.join()
+
+        try:
+            assert statuses == [False]
+            assert not lock.active
+
+            with LocalThreadLock(
+                key='shared',
+                raise_exception=False
+            ) as other_lock:
+                assert not other_lock.active
+        finally:
+            release.set()
+            holder.join()
+
+        with LocalThreadLock(key='shared') as other_lock:
+            assert other_lock.active
+
+    def test_should_raise_exception_when_held_by_another_thread(self):
+        thread = self.hold_lock('thread', 0.1)
+
+        with pytest.raises(LockActiveError):
+            with LocalThreadLock(key='thread'):
+                pass
+
+        thread.join()
+
+    def test_should_not_raise_exception_when_disabled(self):
+        thread = self.hold_lock('thread', 0.1)
+
+        with LocalThreadLock(key='thread', raise_exception=False) as lock:
+            assert not lock.active
+
+        thread.join()
+
+    def test_should_only_let_one_thread_in(self):
+        entered = []
+
+        def run():
+            with LocalThreadLock(key='thread', raise_exception=False) as lock:
+                if lock.active:
+                    entered.append(lock)
+                    time.sleep(0.05)
+
+        threads = [threading.Thread(target=run) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(entered) == 1
+
+    def test_should_wait_until_lock_is_released(self):
+        thread = self.hold_lock('thread', 0.05)
+
+        with LocalThreadLock(key='thread', blocking=True, timeout=1) as lock:
+            assert lock.active
+
+        thread.join()
+
+    def test_should_give_up_waiting_after_timeout(self):
+        thread = self.hold_lock('thread', 0.2)
+
+        with LocalThreadLock(
+            key='thread',
+            blocking=True,
+            timeout=0.01,
+            raise_exception=False
+        ) as lock:
+            assert not lock.active
+
+        thread.join()
+
+    def test_should_not_be_reentrant_by_default(self):
+        lock = LocalThreadLock(key='thread')
+
+        with lock:
+            with pytest.raises(LockActiveError):
+                with LocalThreadLock(key='thread'):
+                    pass
+
+    def test_should_be_reentrant_when_enabled(self):
+        lock = LocalThreadLock(key='thread', reentrant=True)
+
+        with lock:
+            with LocalThreadLock(key='thread', reentrant=True) as inner:
+                assert inner.active
+
+            with lock:
+                assert lock.active
+
+            assert lock.active
+
+        assert not lock.active
+        assert lock._lock.acquire(False)
+        lock._lock.release()
+
+
+class TestReadWriteCacheLock:
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        keys = ['rw:readers', 'rw:writer', 'rw:writer_waiting']
+        caches['default'].delete_many(keys)
+        yield
+        caches['default'].delete_many(keys)
+
+    @pytest.fixture
+    def lock(self):
+        return ReadWriteCacheLock(key='rw', expire=10)
+
+    def test_should_let_many_readers_in(self, lock):
+        with lock.read() as first, lock.read() as second:
+            assert first.active
+            assert second.active
+            assert first.cache.get('rw:readers') == 2
+
+        assert first.cache.get('rw:readers') == 0
+
+    def test_should_not_let_a_writer_in_while_reading(self, lock):
+        with lock.read():
+            with pytest.raises(LockActiveError):
+                with lock.write():
+                    pass
+
+    def test_should_not_let_a_reader_in_while_writing(self, lock):
+        with lock.write() as writer:
+            assert writer.active
+            with pytest.raises(LockActiveError):
+                with lock.read():
+                    pass
+
+        assert writer.cache.get('rw:writer') is None
+
+    def test_should_not_let_another_writer_in(self, lock):
+        with lock.write():
+            with pytest.raises(LockActiveError):
+                with lock.write():
+                    pass
+
+    def test_should_not_let_new_readers_in_while_a_writer_waits(self, lock):
+        reader = lock.read().__enter__()
+        writer_entered = threading.Event()
+
+        def write():
+            lock = ReadWriteCacheLock(
+                key='rw',
+                blocking=True,
+                timeout=2,
+                retry_delay=0.01,
+                max_retry_delay=0.05
+            )
+            with lock.write():
+                writer_entered.set()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        time.sleep(0.05)
+
+        with ReadWriteCacheLock(key='rw', raise_exception=False).read() as (
+            new_reader
+        ):
+            assert not new_reader.active
+
+        reader.__exit__()
+        thread.join()
+
+        assert writer_entered.is_set()
+        assert reader.cache.get('rw:writer_waiting') is None
+
+    def test_should_not_release_writer_of_another_owner(self, lock):
+        with lock.write() as writer:
+            writer.cache.set('rw:writer', 1)
+
+        assert writer.cache.get('rw:writer') == 1
+
+    def test_should_acquire_with_scripts_on_redis(self, lock):
+        with mock.patch(
+            'django_toolkit.concurrent.locks.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.concurrent.locks.read_acquire_script',
+            return_value=1
+        ) as read_acquire_script, mock.patch(
+            'django_toolkit.concurrent.locks.read_release_script',
+            return_value=0
+        ) as read_release_script:
+            with lock.read() as reader:
+                pass
+
+        read_acquire_script.assert_called_once_with(
+            reader.cache,
+            keys=['rw:writer', 'rw:writer_waiting', 'rw:readers'],
+            args=[10000]
+        )
+        read_release_script.assert_called_once_with(
+            reader.cache,
+            keys=['rw:readers']
+        )
+
+    def test_should_announce_a_blocking_writer_on_redis(self):
+        lock = ReadWriteCacheLock(
+            key='rw',
+            expire=10,
+            blocking=True,
+            max_retry_delay=0.5
+        )
+        with mock.patch(
+            'django_toolkit.concurrent.locks.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.concurrent.locks.write_acquire_script',
+            return_value=1
+        ) as write_acquire_script, mock.patch(
+            'django_toolkit.concurrent.locks.release_script',
+            return_value=1
+        ) as release_script:
+            with lock.write() as writer:
+                token = writer.token
+
+        write_acquire_script.assert_called_once_with(
+            writer.cache,
+            keys=['rw:writer', 'rw:writer_waiting', 'rw:readers'],
+            args=[token, 10000, writer.waiting_token, 1000]
+        )
+        release_script.assert_called_once_with(
+            writer.cache,
+            keys=['rw:writer'],
+            args=[token]
+        )
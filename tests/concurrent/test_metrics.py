@@ -0,0 +1,185 @@
+import logging
+
+import mock
+import pytest
+from django.core.cache import caches
+
+from django_toolkit.concurrent.locks import (
+    CacheLock,
+    LocalMemoryLock,
+    LocalThreadLock,
+    LockActiveError
+)
+from django_toolkit.concurrent.metrics import (
+    InMemoryExporter,
+    LoggingExporter,
+    get_key_prefix
+)
+from django_toolkit.concurrent.signals import (
+    lock_acquired,
+    lock_failed,
+    lock_released
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    caches['default'].delete_many(['sku_1', 'sku_2'])
+
+
+@pytest.fixture
+def receivers():
+    receivers = {
+        'acquired': mock.Mock(),
+        'released': mock.Mock(),
+        'failed': mock.Mock(),
+    }
+    lock_acquired.connect(receivers['acquired'])
+    lock_released.connect(receivers['released'])
+    lock_failed.connect(receivers['failed'])
+    yield receivers
+    lock_acquired.disconnect(receivers['acquired'])
+    lock_released.disconnect(receivers['released'])
+    lock_failed.disconnect(receivers['failed'])
+
+
+@pytest.fixture
+def exporter():
+    exporter = InMemoryExporter()
+    exporter.connect()
+    yield exporter
+    exporter.disconnect()
+
+
+class TestLockSignals:
+
+    def test_should_send_acquired_and_released_by_cache_lock(
+        self,
+        receivers
+    ):
+        with CacheLock(key='sku_1') as lock:
+            pass
+
+        receivers['acquired'].assert_called_once_with(
+            signal=lock_acquired,
+            sender=CacheLock,
+            lock=lock,
+            key='sku_1',
+            wait_time=mock.ANY
+        )
+        receivers['released'].assert_called_once_with(
+            signal=lock_released,
+            sender=CacheLock,
+            lock=lock,
+            key='sku_1',
+            hold_time=mock.ANY
+        )
+        assert not receivers['failed'].called
+
+    def test_should_send_failed_by_cache_lock(self, receivers):
+        with CacheLock(key='sku_1'):
+            with CacheLock(key='sku_1', raise_exception=False) as lock:
+                pass
+
+        receivers['failed'].assert_called_once_with(
+            signal=lock_failed,
+            sender=CacheLock,
+            lock=lock,
+            key='sku_1',
+            wait_time=mock.ANY
+        )
+        assert receivers['released'].call_count == 1
+
+    def test_should_send_signals_by_local_memory_lock(self, receivers):
+        lock = LocalMemoryLock()
+
+        with pytest.raises(LockActiveError):
+            with lock:
+                with lock:
+                    pass
+
+        assert receivers['acquired'].call_count == 1
+        assert receivers['failed'].call_count == 1
+        assert receivers['released'].call_count == 1
+
+    def test_should_send_signals_once_by_reentrant_lock(self, receivers):
+        lock = LocalThreadLock(key='sku_1', reentrant=True)
+
+        with lock:
+            with lock:
+                pass
+
+        assert receivers['acquired'].call_count == 1
+        assert receivers['released'].call_count == 1
+
+
+class TestGetKeyPrefix:
+
+    @pytest.mark.parametrize('key,prefix', [
+        ('sku_1', 'sku'),
+        ('partner:0', 'partner'),
+        ('catalog', 'catalog'),
+        ('_private', '_private'),
+        (None, None),
+    ])
+    def test_should_return_the_key_prefix(self, key, prefix):
+        assert get_key_prefix(key) == prefix
+
+
+class TestInMemoryExporter:
+
+    def test_should_aggregate_by_key_prefix(self, exporter):
+        with CacheLock(key='sku_1'):
+            with CacheLock(key='sku_2'):
+                with CacheLock(key='sku_2', raise_exception=False):
+                    pass
+
+        stats = exporter.get_stats()
+
+        assert list(stats) == ['sku']
+        assert stats['sku']['acquired'] == 2
+        assert stats['sku']['released'] == 2
+        assert stats['sku']['failed'] == 1
+        assert stats['sku']['hold_time'] >= stats['sku']['max_hold_time']
+        assert stats['sku']['max_hold_time'] > 0
+
+    def test_should_stop_aggregating_when_disconnected(self, exporter):
+        exporter.disconnect()
+
+        with CacheLock(key='sku_1'):
+            pass
+
+        assert exporter.get_stats() == {}
+
+    def test_should_reset_the_stats(self, exporter):
+        with CacheLock(key='sku_1'):
+            pass
+
+        exporter.reset()
+
+        assert exporter.get_stats() == {}
+
+
+class TestLoggingExporter:
+
+    def test_should_log_lock_signals(self):
+        exporter = LoggingExporter(level=logging.INFO)
+        exporter.connect()
+
+        try:
+            with mock.patch(
+                'django_toolkit.concurrent.metrics.logger'
+            ) as logger:
+                with CacheLock(key='sku_1'):
+                    with CacheLock(key='sku_1', raise_exception=False):
+                        pass
+        finally:
+            exporter.disconnect()
+
+        messages = [call[0][1] for call in logger.log.call_args_list]
+        assert [call[0][0] for call in logger.log.call_args_list] == [
+            logging.INFO
+        ] * 3
+        assert messages[0].startswith('Lock sku_1 acquired after')
+        assert messages[1].startswith('Lock sku_1 not acquired after')
+        assert messages[2].startswith('Lock sku_1 released after')
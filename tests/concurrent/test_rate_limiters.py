@@ -0,0 +1,141 @@
+import mock
+import pytest
+from django.core.cache import caches
+
+from django_toolkit.concurrent.exceptions import RateLimitExceededError
+from django_toolkit.concurrent.rate_limiters import (
+    RateLimiter,
+    _local_blocked_until,
+    rate_limiter
+)
+from django_toolkit.local_cache import LocalCache
+
+cache = caches['default']
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    _local_blocked_until.clear()
+    yield
+    cache.clear()
+    _local_blocked_until.clear()
+
+
+class TestRateLimiter:
+
+    @pytest.fixture
+    def now(self):
+        with mock.patch('time.time', return_value=1000.0) as time:
+            yield time
+
+    def test_should_allow_calls_up_to_the_rate(self, now):
+        limiter = RateLimiter(key='partner', rate=3, period=1)
+
+        assert [limiter.allow() for _ in range(4)] == [
+            True, True, True, False
+        ]
+
+    def test_should_allow_calls_up_to_the_burst(self, now):
+        limiter = RateLimiter(key='partner', rate=10, period=1, burst=2)
+
+        assert [limiter.allow() for _ in range(3)] == [True, True, False]
+
+    def test_should_return_the_time_to_wait(self, now):
+        limiter = RateLimiter(key='partner', rate=2, period=1)
+        limiter.check()
+        limiter.check()
+
+        assert limiter.check() == pytest.approx(0.5)
+
+    def test_should_allow_calls_again_after_waiting(self, now):
+        limiter = RateLimiter(key='partner', rate=2, period=1)
+        limiter.check()
+        limiter.check()
+
+        now.return_value += 0.5
+
+        assert limiter.allow()
+        assert not limiter.allow()
+
+    def test_should_share_the_limit_by_key(self, now):
+        RateLimiter(key='partner', rate=1).check()
+
+        assert not RateLimiter(key='partner', rate=1).allow()
+        assert RateLimiter(key='other', rate=1).allow()
+
+    def test_should_not_touch_the_cache_while_locally_limited(self, now):
+        limiter = RateLimiter(key='partner', rate=1)
+        limiter.check()
+        limiter.check()
+
+        with mock.patch.object(limiter.cache, 'get') as get:
+            assert limiter.check() == pytest.approx(1)
+
+        assert not get.called
+
+    def test_should_reset_the_limit(self, now):
+        limiter = RateLimiter(key='partner', rate=1)
+        limiter.check()
+        limiter.check()
+
+        limiter.reset()
+
+        assert limiter.allow()
+
+    def test_should_raise_exception_when_exceeded_as_context(self, now):
+        limiter = RateLimiter(key='partner', rate=1)
+
+        with limiter:
+            pass
+
+        with pytest.raises(RateLimitExceededError) as excinfo:
+            with limiter:
+                pass
+
+        assert excinfo.value.retry_after == pytest.approx(1)
+
+    def test_should_limit_decorated_functions(self, now):
+        @rate_limiter(key='partner', rate=1)
+        def call_partner():
+            return True
+
+        assert call_partner()
+        with pytest.raises(RateLimitExceededError):
+            call_partner()
+
+    def test_should_check_with_a_script_on_redis(self, now):
+        limiter = RateLimiter(key='partner', rate=4, period=1, burst=2)
+        with mock.patch(
+            'django_toolkit.concurrent.rate_limiters.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.concurrent.rate_limiters.gcra_script',
+            return_value=250000
+        ) as gcra_script:
+            assert limiter.check() == 0.25
+
+        gcra_script.assert_called_once_with(
+            limiter.cache,
+            keys=['partner'],
+            args=[1000000000, 250000, 500000]
+        )
+        assert _local_blocked_until.get('partner') == 1000250000
+
+    def test_should_bound_the_keys_remembered_as_limited(self, now):
+        blocked_until = LocalCache(max_size=2, shards=1)
+
+        with mock.patch(
+            'django_toolkit.concurrent.rate_limiters._local_blocked_until',
+            blocked_until
+        ):
+            for client in range(5):
+                limiter = RateLimiter(
+                    key='client_{}'.format(client),
+                    rate=1,
+                    period=60
+                )
+                limiter.check()
+                assert limiter.check()
+
+        lock, entries = blocked_until._shards[0]
+        assert list(entries) == ['client_3', 'client_4']
@@ -0,0 +1,135 @@
+import threading
+
+import mock
+import pytest
+from django.core.cache import caches
+
+from django_toolkit.concurrent.locks import LockActiveError
+from django_toolkit.concurrent.semaphores import CacheSemaphore
+
+cache = caches['default']
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+class TestCacheSemaphore:
+
+    def test_should_take_a_slot(self):
+        with CacheSemaphore(key='partner', value=2) as semaphore:
+            assert semaphore.active
+            assert semaphore.slot_key in ('partner:0', 'partner:1')
+            assert cache.get(semaphore.slot_key) == semaphore.token
+
+    def test_should_free_the_slot_on_exit(self):
+        with CacheSemaphore(key='partner', value=2) as semaphore:
+            slot_key = semaphore.slot_key
+
+        assert not semaphore.active
+        assert cache.get(slot_key) is None
+
+    def test_should_let_up_to_value_holders_in(self):
+        with CacheSemaphore(key='partner', value=2) as first:
+            with CacheSemaphore(key='partner', value=2) as second:
+                assert first.slot_key != second.slot_key
+                with pytest.raises(LockActiveError):
+                    with CacheSemaphore(key='partner', value=2):
+                        pass
+
+    def test_should_not_raise_exception_when_disabled(self):
+        with CacheSemaphore(key='partner', value=1):
+            with CacheSemaphore(
+                key='partner',
+                value=1,
+                raise_exception=False
+            ) as semaphore:
+                assert not semaphore.active
+
+    def test_should_not_free_the_slot_of_another_holder(self):
+        with CacheSemaphore(key='partner', value=1):
+            # the slot expires and is taken by another holder
+            cache.set('partner:0', 1)
+
+        assert cache.get('partner:0') == 1
+
+    def test_should_wait_until_a_slot_is_freed(self):
+        holder = CacheSemaphore(key='partner', value=1).__enter__()
+        timer = threading.Timer(0.05, holder.__exit__)
+        timer.start()
+
+        with CacheSemaphore(
+            key='partner',
+            value=1,
+            blocking=True,
+            timeout=2
+        ) as semaphore:
+            assert semaphore.active
+
+        timer.join()
+
+    def test_should_give_up_waiting_after_timeout(self):
+        with CacheSemaphore(key='partner', value=1):
+            with CacheSemaphore(
+                key='partner',
+                value=1,
+                blocking=True,
+                timeout=0.05,
+                raise_exception=False
+            ) as semaphore:
+                assert not semaphore.active
+
+    def test_should_limit_the_concurrent_calls_when_decorating(self):
+        calls = []
+
+        @CacheSemaphore(key='partner', value=1)
+        def call_partner():
+            calls.append(cache.get('partner:0'))
+            with pytest.raises(LockActiveError):
+                call_partner()
+
+        call_partner()
+
+        assert len(calls) == 1
+        assert cache.get('partner:0') is None
+
+    def test_should_renew_the_slot(self):
+        with CacheSemaphore(key='partner', value=1, expire=10) as semaphore:
+            with mock.patch.object(semaphore.cache, 'touch') as touch:
+                assert semaphore._renew()
+
+        touch.assert_called_once_with('partner:0', 10)
+
+    def test_should_take_a_slot_with_a_script_on_redis(self):
+        semaphore = CacheSemaphore(key='partner', value=2, expire=10)
+        with mock.patch(
+            'django_toolkit.concurrent.semaphores.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.concurrent.semaphores.random.randrange',
+            return_value=1
+        ), mock.patch(
+            'django_toolkit.concurrent.semaphores.acquire_slot_script',
+            return_value=2
+        ) as acquire_slot_script, mock.patch(
+            'django_toolkit.concurrent.locks.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.concurrent.locks.release_script',
+            return_value=1
+        ) as release_script:
+            with semaphore:
+                token = semaphore.token
+                assert semaphore.slot_key == 'partner:0'
+
+        acquire_slot_script.assert_called_once_with(
+            semaphore.cache,
+            keys=['partner:1', 'partner:0'],
+            args=[token, 10000]
+        )
+        release_script.assert_called_once_with(
+            semaphore.cache,
+            keys=['partner:0'],
+            args=[token]
+        )
@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+
+from django_toolkit.concurrent.single_flight import SingleFlight
+
+
+class TestSingleFlight:
+
+    @pytest.fixture
+    def single_flight(self):
+        return SingleFlight()
+
+    def run_concurrently(self, single_flight, func, threads=5, timeout=None):
+        results = []
+
+        def run():
+            try:
+                results.append(single_flight.do('key', func, timeout))
+            except Exception as e:
+                results.append(e)
+
+        workers = [threading.Thread(target=run) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        return results
+
+    def test_should_return_the_function_result(self, single_flight):
+        assert single_flight.do('key', lambda: 42) == 42
+
+    def test_should_run_concurrent_calls_once(self, single_flight):
+        calls = []
+        release = threading.Event()
+
+        def func():
+            calls.append(1)
+            release.wait(1)
+            return 'result'
+
+        threading.Timer(0.1, release.set).start()
+        results = self.run_concurrently(single_flight, func)
+
+        assert len(calls) == 1
+        assert results == ['result'] * 5
+
+    def test_should_share_the_exception(self, single_flight):
+        calls = []
+        release = threading.Event()
+
+        def func():
+            calls.append(1)
+            release.wait(1)
+            raise ValueError('oops')
+
+        threading.Timer(0.1, release.set).start()
+        results = self.run_concurrently(single_flight, func)
+
+        assert len(calls) == 1
+        assert all(isinstance(result, ValueError) for result in results)
+
+    def test_should_run_again_after_a_call_finishes(self, single_flight):
+        calls = []
+
+        def func():
+            calls.append(1)
+            return len(calls)
+
+        assert single_flight.do('key', func) == 1
+        assert single_flight.do('key', func) == 2
+
+    def test_should_run_by_itself_when_waiting_times_out(self, single_flight):
+        calls = []
+        release = threading.Event()
+
+        def func():
+            calls.append(1)
+            release.wait(1)
+
+        results = self.run_concurrently(
+            single_flight,
+            func,
+            threads=2,
+            timeout=0.01
+        )
+        release.set()
+
+        assert len(calls) == 2
+        assert results == [None, None]
+
+    def test_try_do_should_run_the_function(self, single_flight):
+        assert single_flight.try_do('key', lambda: 42, default=0) == 42
+
+    def test_try_do_should_not_wait_for_a_running_call(self, single_flight):
+        started = threading.Event()
+        release = threading.Event()
+
+        def func():
+            started.set()
+            release.wait(1)
+            return 'result'
+
+        leader = threading.Thread(target=lambda: single_flight.do('key', func))
+        leader.start()
+        started.wait(1)
+
+        try:
+            assert single_flight.try_do('key', func, default='stale') == (
+                'stale'
+            )
+        finally:
+            release.set()
+            leader.join()
+
+        assert single_flight.try_do('key', lambda: 'fresh') == 'fresh'
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import sys
+
+import pytest
+
+collect_ignore = []
+
+if sys.version_info < (3, 5):
+    collect_ignore.append('fallbacks/circuit_breaker/test_aio.py')
+    collect_ignore.append('concurrent/test_aio.py')
+
+
+@pytest.fixture
+def run_async():
+    """
+    Run a coroutine until it completes in a new event loop
+    """
+    import asyncio
+
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
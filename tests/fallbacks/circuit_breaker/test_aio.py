@@ -0,0 +1,282 @@
+import mock
+import pytest
+from django.core.cache import caches
+
+from django_toolkit.fallbacks.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    CircuitBreaker,
+    circuit_breaker,
+    circuit_closed,
+    circuit_opened,
+    invalidate_local_circuit_state
+)
+from django_toolkit.fallbacks.circuit_breaker.aio import aincrease_counters
+from django_toolkit.timing import start_request_timing, stop_request_timing
+from tests.fake.fallbacks.circuit_breaker.rules import (
+    FakeRuleShouldNotOpen,
+    FakeRuleShouldOpen
+)
+
+cache = caches['default']
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(cache, 'aget'),
+    reason='The async cache API requires Django 4.0+'
+)
+
+
+class MyException(Exception):
+    pass
+
+
+async def success_function():
+    return True
+
+
+async def fail_function():
+    raise ValueError()
+
+
+class TestAsyncCircuitBreaker:
+
+    @pytest.fixture
+    def failure_cache_key(self):
+        return 'async_fail'
+
+    @pytest.fixture
+    def request_cache_key(self):
+        return 'async_request'
+
+    @pytest.fixture
+    def circuit_cache_key(self, failure_cache_key):
+        return 'circuit_{}'.format(failure_cache_key)
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(
+        self,
+        failure_cache_key,
+        request_cache_key,
+        circuit_cache_key
+    ):
+        cache.delete_many([
+            failure_cache_key,
+            request_cache_key,
+            circuit_cache_key
+        ])
+        invalidate_local_circuit_state()
+
+    def make_breaker(self, rule_class, failure_cache_key, request_cache_key):
+        return CircuitBreaker(
+            rule=rule_class(
+                failure_cache_key=failure_cache_key,
+                request_cache_key=request_cache_key,
+            ),
+            cache=cache,
+            failure_exception=MyException,
+            catch_exceptions=(ValueError,),
+        )
+
+    def test_should_return_the_function_result(
+        self,
+        run_async,
+        failure_cache_key,
+        request_cache_key
+    ):
+        breaker = self.make_breaker(
+            FakeRuleShouldNotOpen,
+            failure_cache_key,
+            request_cache_key
+        )
+
+        async def guarded():
+            async with breaker:
+                return await success_function()
+
+        assert run_async(guarded()) is True
+        assert cache.get(request_cache_key) == 1
+        assert cache.get(failure_cache_key) == 0
+
+    def test_should_time_the_circuit_breaker_phase_of_the_request(
+        self,
+        run_async,
+        failure_cache_key,
+        request_cache_key
+    ):
+        breaker = self.make_breaker(
+            FakeRuleShouldNotOpen,
+            failure_cache_key,
+            request_cache_key
+        )
+
+        async def guarded():
+            timing = start_request_timing()
+            try:
+                async with breaker:
+                    await success_function()
+            finally:
+                stop_request_timing()
+            return timing
+
+        assert run_async(guarded()).phases['circuit_breaker'] > 0
+
+    def test_should_increase_failure_count(
+        self,
+        run_async,
+        failure_cache_key,
+        request_cache_key
+    ):
+        breaker = self.make_breaker(
+            FakeRuleShouldNotOpen,
+            failure_cache_key,
+            request_cache_key
+        )
+
+        async def guarded():
+            async with breaker:
+                await fail_function()
+
+        with pytest.raises(ValueError):
+            run_async(guarded())
+
+        assert cache.get(failure_cache_key) == 1
+
+    def test_should_open_circuit_when_rule_says_so(
+        self,
+        run_async,
+        failure_cache_key,
+        request_cache_key,
+        circuit_cache_key
+    ):
+        breaker = self.make_breaker(
+            FakeRuleShouldOpen,
+            failure_cache_key,
+            request_cache_key
+        )
+
+        async def guarded():
+            async with breaker:
+                await fail_function()
+
+        with pytest.raises(MyException):
+            run_async(guarded())
+
+        assert cache.get(circuit_cache_key) is True
+        assert cache.get(failure_cache_key) is None
+        assert cache.get(request_cache_key) is None
+
+    def test_should_send_the_circuit_signals(
+        self,
+        run_async,
+        failure_cache_key,
+        request_cache_key
+    ):
+        breaker = self.make_breaker(
+            FakeRuleShouldOpen,
+            failure_cache_key,
+            request_cache_key
+        )
+        opened = mock.Mock()
+        closed = mock.Mock()
+        circuit_opened.connect(opened, dispatch_uid='test_async_opened')
+        circuit_closed.connect(closed, dispatch_uid='test_async_closed')
+
+        try:
+            run_async(breaker.aopen_circuit())
+            run_async(breaker.aclose_circuit())
+        finally:
+            circuit_opened.disconnect(dispatch_uid='test_async_opened')
+            circuit_closed.disconnect(dispatch_uid='test_async_closed')
+
+        for receiver, signal in [
+            (opened, circuit_opened),
+            (closed, circuit_closed),
+        ]:
+            receiver.assert_called_once_with(
+                signal=signal,
+                sender=CircuitBreaker,
+                circuit_breaker=breaker,
+                circuit_cache_key=breaker.circuit_cache_key
+            )
+
+    def test_should_raise_when_circuit_is_open(
+        self,
+        run_async,
+        failure_cache_key,
+        request_cache_key,
+        circuit_cache_key
+    ):
+        cache.set(circuit_cache_key, True)
+        breaker = self.make_breaker(
+            FakeRuleShouldNotOpen,
+            failure_cache_key,
+            request_cache_key
+        )
+
+        async def guarded():
+            async with breaker:
+                return await success_function()
+
+        with pytest.raises(MyException):
+            run_async(guarded())
+
+    def test_decorator_should_wrap_coroutine_functions(
+        self,
+        run_async,
+        failure_cache_key,
+        request_cache_key
+    ):
+        @circuit_breaker(
+            rule=FakeRuleShouldOpen(
+                failure_cache_key=failure_cache_key,
+                request_cache_key=request_cache_key,
+            ),
+            cache=cache,
+            failure_exception=MyException,
+            catch_exceptions=(ValueError,),
+        )
+        async def guarded():
+            await fail_function()
+
+        with pytest.raises(MyException):
+            run_async(guarded())
+
+    def test_should_close_circuit_when_probe_calls_succeed(
+        self,
+        run_async,
+        failure_cache_key,
+        circuit_cache_key
+    ):
+        breaker = CircuitBreaker(
+            rule=FakeRuleShouldNotOpen(failure_cache_key=failure_cache_key),
+            cache=cache,
+            failure_exception=MyException,
+            half_open_max_calls=1,
+        )
+        cache.set(breaker.half_open_cache_key, True)
+        assert breaker.circuit_state == HALF_OPEN
+
+        async def guarded():
+            async with breaker:
+                return await success_function()
+
+        assert run_async(guarded()) is True
+        assert breaker.circuit_state == CLOSED
+
+
+class TestAsyncIncreaseCounters:
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        cache.delete_many(['requests', 'failures'])
+
+    def test_should_create_and_increase_counters(self, run_async):
+        cache.set('failures', 2)
+
+        totals = run_async(aincrease_counters(
+            cache,
+            [('requests', 1), ('failures', 0)],
+            timeout=10
+        ))
+
+        assert totals == {'requests': 1, 'failures': 2}
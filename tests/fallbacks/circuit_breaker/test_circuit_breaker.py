@@ -1,15 +1,25 @@
+import time
+
 import pytest
 from django.core.cache import caches
 from mock import mock
 
 from django_toolkit.fallbacks.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
     CircuitBreaker,
-    circuit_breaker
+    circuit_breaker,
+    circuit_closed,
+    circuit_opened,
+    invalidate_local_circuit_state
 )
 from django_toolkit.fallbacks.circuit_breaker.rules import (
     MaxFailuresRule,
-    PercentageFailuresRule
+    PercentageFailuresRule,
+    SlidingWindowFailuresRule
 )
+from django_toolkit.timing import start_request_timing, stop_request_timing
 from tests.fake.fallbacks.circuit_breaker.rules import (
     FakeRuleShouldNotIncreaseFailure,
     FakeRuleShouldNotIncreaseRequest,
@@ -121,6 +131,24 @@ class TestCircuitBreaker:
 
         inner_func()
 
+    def test_should_time_the_circuit_breaker_phase_of_the_request(
+        self,
+        rule_should_not_open
+    ):
+        timing = start_request_timing()
+        try:
+            with CircuitBreaker(
+                rule=rule_should_not_open,
+                cache=cache,
+                failure_exception=None,
+                catch_exceptions=None,
+            ):
+                assert 'circuit_breaker' in timing.phases
+        finally:
+            stop_request_timing()
+
+        assert timing.phases['circuit_breaker'] > 0
+
     def test_should_raise_error(self, rule_should_open):
         with pytest.raises(MyException):
             with CircuitBreaker(
@@ -369,3 +397,405 @@ class TestCircuitBreaker:
             success_function()
 
         assert cache.get(failure_cache_key) == 0
+
+
+class TestCircuitBreakerSlidingWindow:
+
+    @pytest.fixture
+    def rule(self):
+        return SlidingWindowFailuresRule(
+            max_failures_percentage=50,
+            failure_cache_key='window_fail',
+            min_accepted_requests=2,
+            request_cache_key='window_request',
+            window_size=3,
+            bucket_seconds=10,
+        )
+
+    @pytest.fixture
+    def breaker(self, rule):
+        return CircuitBreaker(
+            rule=rule,
+            cache=cache,
+            failure_exception=MyException,
+            catch_exceptions=(ValueError,),
+        )
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self, rule):
+        with mock.patch('time.time', return_value=1000):
+            keys = (
+                rule.get_failure_window_keys() +
+                rule.get_request_window_keys()
+            )
+        cache.delete_many(keys + ['window_fail_101', 'window_request_101'])
+        cache.delete('circuit_window_fail')
+
+    def test_should_count_in_time_buckets(self, breaker):
+        with mock.patch('time.time', return_value=1000):
+            with breaker:
+                success_function()
+
+        with mock.patch('time.time', return_value=1010):
+            with pytest.raises(ValueError):
+                with breaker:
+                    fail_function()
+
+            assert cache.get('window_request_100') == 1
+            assert cache.get('window_fail_100') == 0
+            assert cache.get('window_request_101') == 1
+            assert cache.get('window_fail_101') == 1
+
+    def test_should_open_circuit_with_the_window_totals(self, breaker):
+        cache.set('window_request_99', 2)
+        cache.set('window_fail_99', 1)
+
+        with mock.patch('time.time', return_value=1000):
+            with pytest.raises(MyException):
+                with breaker:
+                    fail_function()
+
+            assert breaker.is_circuit_open
+
+        assert cache.get('window_request_99') is None
+        assert cache.get('window_fail_99') is None
+
+    def test_should_ignore_buckets_out_of_the_window(self, breaker):
+        cache.set('window_request_97', 2)
+        cache.set('window_fail_97', 2)
+
+        with mock.patch('time.time', return_value=1000):
+            with pytest.raises(ValueError):
+                with breaker:
+                    fail_function()
+
+            assert not breaker.is_circuit_open
+
+
+class TestCircuitBreakerLocalState:
+
+    @pytest.fixture
+    def failure_cache_key(self):
+        return 'local_fail'
+
+    @pytest.fixture
+    def circuit_cache_key(self, failure_cache_key):
+        return 'circuit_{}'.format(failure_cache_key)
+
+    @pytest.fixture(autouse=True)
+    def clear_state(self, failure_cache_key, circuit_cache_key):
+        cache.delete(failure_cache_key)
+        cache.delete(circuit_cache_key)
+        invalidate_local_circuit_state()
+        yield
+        invalidate_local_circuit_state()
+
+    @pytest.fixture
+    def breaker(self, failure_cache_key):
+        return CircuitBreaker(
+            rule=FakeRuleShouldNotOpen(failure_cache_key=failure_cache_key),
+            cache=cache,
+            failure_exception=MyException,
+            catch_exceptions=(ValueError,),
+            local_state_timeout=10,
+        )
+
+    def test_should_not_reach_cache_on_enter_when_state_is_known(
+        self,
+        breaker
+    ):
+        with breaker:
+            success_function()
+
+        with mock.patch.object(cache, 'get') as get:
+            with breaker:
+                pass
+
+        assert not get.called
+
+    def test_should_keep_state_until_local_timeout(
+        self,
+        breaker,
+        circuit_cache_key
+    ):
+        assert not breaker.is_circuit_open
+
+        cache.set(circuit_cache_key, True)
+        assert not breaker.is_circuit_open
+
+        with mock.patch('time.time', return_value=time.time() + 11):
+            assert breaker.is_circuit_open
+
+    def test_should_read_cache_after_invalidation(
+        self,
+        breaker,
+        circuit_cache_key
+    ):
+        assert not breaker.is_circuit_open
+
+        cache.set(circuit_cache_key, True)
+        invalidate_local_circuit_state(circuit_cache_key)
+
+        with pytest.raises(MyException):
+            with breaker:
+                success_function()
+
+    def test_should_share_state_between_instances(
+        self,
+        breaker,
+        failure_cache_key
+    ):
+        other_breaker = CircuitBreaker(
+            rule=FakeRuleShouldOpen(failure_cache_key=failure_cache_key),
+            cache=cache,
+            failure_exception=MyException,
+            catch_exceptions=(ValueError,),
+            local_state_timeout=10,
+        )
+        with pytest.raises(MyException):
+            with other_breaker:
+                fail_function()
+
+        with mock.patch.object(cache, 'get') as get:
+            assert breaker.is_circuit_open
+
+        assert not get.called
+
+    def test_should_not_keep_an_open_state_past_the_circuit_timeout(
+        self,
+        failure_cache_key,
+        circuit_cache_key
+    ):
+        breaker = CircuitBreaker(
+            rule=FakeRuleShouldOpen(failure_cache_key=failure_cache_key),
+            cache=cache,
+            failure_exception=MyException,
+            catch_exceptions=(ValueError,),
+            circuit_timeout=2,
+            local_state_timeout=10,
+        )
+        with pytest.raises(MyException):
+            with breaker:
+                fail_function()
+
+        cache.delete(circuit_cache_key)
+        assert breaker.is_circuit_open
+
+        with mock.patch('time.time', return_value=time.time() + 3):
+            assert not breaker.is_circuit_open
+
+    def test_should_always_read_cache_without_local_timeout(
+        self,
+        failure_cache_key,
+        circuit_cache_key
+    ):
+        breaker = CircuitBreaker(
+            rule=FakeRuleShouldNotOpen(failure_cache_key=failure_cache_key),
+            cache=cache,
+            failure_exception=MyException,
+        )
+        assert not breaker.is_circuit_open
+
+        cache.set(circuit_cache_key, True)
+        assert breaker.is_circuit_open
+
+
+class TestCircuitBreakerHalfOpen:
+
+    @pytest.fixture
+    def failure_cache_key(self):
+        return 'half_fail'
+
+    @pytest.fixture
+    def breaker(self, failure_cache_key):
+        return CircuitBreaker(
+            rule=MaxFailuresRule(
+                max_failures=1,
+                failure_cache_key=failure_cache_key
+            ),
+            cache=cache,
+            failure_exception=MyException,
+            catch_exceptions=(ValueError,),
+            half_open_max_calls=2,
+            half_open_timeout=10,
+        )
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self, breaker):
+        cache.delete_many([
+            breaker.rule.failure_cache_key,
+            breaker.circuit_cache_key,
+            breaker.half_open_cache_key,
+            breaker.half_open_calls_cache_key,
+            breaker.half_open_successes_cache_key,
+        ])
+
+    def open_and_wait_circuit_timeout(self, breaker):
+        with pytest.raises(MyException):
+            with breaker:
+                fail_function()
+
+        assert breaker.circuit_state == OPEN
+        cache.delete(breaker.circuit_cache_key)
+
+    def test_should_be_closed_by_default(self, breaker):
+        assert breaker.circuit_state == CLOSED
+
+    def test_should_be_half_open_after_circuit_timeout(self, breaker):
+        self.open_and_wait_circuit_timeout(breaker)
+
+        assert breaker.circuit_state == HALF_OPEN
+        assert breaker.is_circuit_half_open
+        assert not breaker.is_circuit_open
+
+    def test_should_admit_a_limited_number_of_probe_calls(self, breaker):
+        self.open_and_wait_circuit_timeout(breaker)
+
+        breaker.__enter__()
+        breaker.__enter__()
+
+        with pytest.raises(MyException):
+            with breaker:
+                success_function()
+
+    def test_should_close_circuit_when_probe_calls_succeed(self, breaker):
+        self.open_and_wait_circuit_timeout(breaker)
+
+        with breaker:
+            success_function()
+
+        assert breaker.circuit_state == HALF_OPEN
+
+        with breaker:
+            success_function()
+
+        assert breaker.circuit_state == CLOSED
+        assert cache.get(breaker.half_open_calls_cache_key) is None
+
+    def test_should_open_circuit_when_a_probe_call_fails(self, breaker):
+        self.open_and_wait_circuit_timeout(breaker)
+
+        with pytest.raises(MyException):
+            with breaker:
+                fail_function()
+
+        assert breaker.circuit_state == OPEN
+        assert cache.get(breaker.half_open_cache_key)
+        assert cache.get(breaker.half_open_calls_cache_key) is None
+
+    def test_should_not_count_failures_while_half_open(self, breaker):
+        self.open_and_wait_circuit_timeout(breaker)
+
+        with breaker:
+            success_function()
+
+        assert cache.get(breaker.rule.failure_cache_key) is None
+
+    def test_should_admit_new_probe_calls_when_a_probe_never_exits(
+        self,
+        failure_cache_key
+    ):
+        breaker = CircuitBreaker(
+            rule=MaxFailuresRule(
+                max_failures=1,
+                failure_cache_key=failure_cache_key
+            ),
+            cache=cache,
+            failure_exception=MyException,
+            catch_exceptions=(ValueError,),
+            circuit_timeout=0.2,
+            half_open_max_calls=1,
+        )
+        assert breaker.half_open_timeout == 0.2
+
+        with pytest.raises(MyException):
+            with breaker:
+                fail_function()
+        time.sleep(0.25)
+
+        # A probe call that never reaches __exit__
+        breaker.__enter__()
+
+        with pytest.raises(MyException):
+            breaker.__enter__()
+
+        time.sleep(0.25)
+
+        with breaker:
+            success_function()
+
+        assert breaker.circuit_state == CLOSED
+
+    def test_should_close_without_half_open_state_by_default(
+        self,
+        failure_cache_key
+    ):
+        breaker = CircuitBreaker(
+            rule=MaxFailuresRule(
+                max_failures=1,
+                failure_cache_key=failure_cache_key
+            ),
+            cache=cache,
+            failure_exception=MyException,
+            catch_exceptions=(ValueError,),
+        )
+        with pytest.raises(MyException):
+            with breaker:
+                fail_function()
+
+        cache.delete(breaker.circuit_cache_key)
+
+        assert breaker.circuit_state == CLOSED
+
+
+class TestCircuitBreakerSignals:
+
+    @pytest.fixture
+    def breaker(self):
+        return CircuitBreaker(
+            rule=MaxFailuresRule(
+                max_failures=1,
+                failure_cache_key='signal_fail'
+            ),
+            cache=cache,
+            failure_exception=MyException,
+            catch_exceptions=(ValueError,),
+        )
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self, breaker):
+        cache.delete_many([
+            breaker.rule.failure_cache_key,
+            breaker.circuit_cache_key,
+        ])
+
+    @pytest.fixture
+    def receiver(self):
+        receiver = mock.Mock()
+        circuit_opened.connect(receiver, dispatch_uid='test_opened')
+        circuit_closed.connect(receiver, dispatch_uid='test_closed')
+        yield receiver
+        circuit_opened.disconnect(dispatch_uid='test_opened')
+        circuit_closed.disconnect(dispatch_uid='test_closed')
+
+    def test_should_send_circuit_opened(self, breaker, receiver):
+        with pytest.raises(MyException):
+            with breaker:
+                fail_function()
+
+        receiver.assert_called_once_with(
+            signal=circuit_opened,
+            sender=CircuitBreaker,
+            circuit_breaker=breaker,
+            circuit_cache_key=breaker.circuit_cache_key
+        )
+
+    def test_should_send_circuit_closed(self, breaker, receiver):
+        breaker.close_circuit()
+
+        receiver.assert_called_once_with(
+            signal=circuit_closed,
+            sender=CircuitBreaker,
+            circuit_breaker=breaker,
+            circuit_cache_key=breaker.circuit_cache_key
+        )
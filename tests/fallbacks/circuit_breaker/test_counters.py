@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import pytest
+from django.core.cache import caches
+from mock import mock
+
+from django_toolkit.fallbacks.circuit_breaker.counters import (
+    increase_counters
+)
+
+cache = caches['default']
+
+
+class TestIncreaseCounters(object):
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        cache.delete_many(['requests', 'failures'])
+
+    def test_should_create_and_increase_counters(self):
+        totals = increase_counters(
+            cache,
+            [('requests', 1), ('failures', 1)],
+            timeout=10
+        )
+
+        assert totals == {'requests': 1, 'failures': 1}
+        assert cache.get('requests') == 1
+        assert cache.get('failures') == 1
+
+    def test_should_only_create_counter_when_amount_is_zero(self):
+        cache.set('failures', 3)
+
+        totals = increase_counters(
+            cache,
+            [('requests', 1), ('failures', 0)],
+            timeout=10
+        )
+
+        assert totals == {'requests': 1, 'failures': 3}
+        assert cache.get('failures') == 3
+
+    def test_should_read_the_given_keys(self):
+        cache.set('failures', 3)
+
+        totals = increase_counters(
+            cache,
+            [('requests', 1)],
+            timeout=10,
+            read_keys=['requests', 'failures']
+        )
+
+        assert totals == {'requests': 1, 'failures': 3}
+
+    def test_should_recreate_counter_when_it_expires_before_incr(self):
+        def expire_and_incr(key, delta):
+            cache.delete(key)
+            raise ValueError()
+
+        with mock.patch.object(cache, 'incr', side_effect=expire_and_incr):
+            totals = increase_counters(cache, [('failures', 1)], timeout=10)
+
+        assert totals == {'failures': 1}
+        assert cache.get('failures') == 1
+
+    def test_should_run_a_single_script_on_redis(self):
+        with mock.patch(
+            'django_toolkit.fallbacks.circuit_breaker.counters'
+            '.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.fallbacks.circuit_breaker.counters'
+            '.increase_counters_script',
+            return_value=[b'4', b'2']
+        ) as script, mock.patch.object(cache, 'add') as add:
+            totals = increase_counters(
+                cache,
+                [('requests', 1), ('failures', 0)],
+                timeout=10
+            )
+
+        script.assert_called_once_with(
+            cache,
+            keys=['requests', 'failures'],
+            args=[10, 1, 0]
+        )
+        assert not add.called
+        assert totals == {'requests': 4, 'failures': 2}
+
+    def test_should_read_keys_in_the_same_script_on_redis(self):
+        with mock.patch(
+            'django_toolkit.fallbacks.circuit_breaker.counters'
+            '.get_redis_client'
+        ), mock.patch(
+            'django_toolkit.fallbacks.circuit_breaker.counters'
+            '.increase_counters_script',
+            return_value=[1, 3]
+        ) as script:
+            totals = increase_counters(
+                cache,
+                [('requests', 1)],
+                timeout=10,
+                read_keys=['requests', 'failures']
+            )
+
+        script.assert_called_once_with(
+            cache,
+            keys=['requests', 'failures'],
+            args=[10, 1]
+        )
+        assert totals == {'requests': 1, 'failures': 3}
@@ -1,9 +1,11 @@
 import pytest
+from mock import mock
 
 from django_toolkit.fallbacks.circuit_breaker.rules import (
     MaxFailuresRule,
     PercentageFailuresRule,
-    Rule
+    Rule,
+    SlidingWindowFailuresRule
 )
 
 
@@ -37,6 +39,14 @@ class TestMaxFailuresRule:
     def test_should_not_increase_request_count(self, rule):
         assert rule.should_increase_request_count() is False
 
+    def test_should_count_failures_in_a_single_key(self, rule):
+        assert rule.get_failure_counter_key() == 'fail'
+        assert rule.get_failure_window_keys() == ['fail']
+        assert rule.get_request_window_keys() == []
+
+    def test_should_use_failure_timeout_as_counter_timeout(self, rule):
+        assert rule.get_counter_timeout(60) == 60
+
 
 class TestPercentageFailureRule:
 
@@ -78,3 +88,59 @@ class TestPercentageFailureRule:
 
     def test_should_increase_request_count(self, rule):
         assert rule.should_increase_request_count() is True
+
+
+class TestSlidingWindowFailuresRule:
+
+    @pytest.fixture
+    def rule(self):
+        return SlidingWindowFailuresRule(
+            max_failures_percentage=50,
+            failure_cache_key='fail',
+            min_accepted_requests=5,
+            request_cache_key='request',
+            window_size=3,
+            bucket_seconds=10,
+        )
+
+    @pytest.fixture(autouse=True)
+    def time(self):
+        with mock.patch('time.time', return_value=1005) as time:
+            yield time
+
+    def test_sliding_window_rule_should_return_rule_instance(self, rule):
+        assert isinstance(rule, Rule)
+
+    def test_should_count_in_the_current_bucket(self, rule):
+        assert rule.get_failure_counter_key() == 'fail_100'
+        assert rule.get_request_counter_key() == 'request_100'
+
+    def test_should_sum_the_buckets_of_the_window(self, rule):
+        assert rule.get_failure_window_keys() == [
+            'fail_98',
+            'fail_99',
+            'fail_100',
+        ]
+        assert rule.get_request_window_keys() == [
+            'request_98',
+            'request_99',
+            'request_100',
+        ]
+
+    def test_should_slide_the_window(self, rule, time):
+        time.return_value = 1010
+
+        assert rule.get_failure_window_keys() == [
+            'fail_99',
+            'fail_100',
+            'fail_101',
+        ]
+
+    def test_should_expire_buckets_after_the_window(self, rule):
+        assert rule.get_counter_timeout(3600) == 30
+
+    def test_should_open_circuit(self, rule):
+        assert rule.should_open_circuit(
+            total_failures=20,
+            total_requests=40
+        ) is True
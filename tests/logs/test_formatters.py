@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import socket
+import sys
+
+import pytest
+from mock import ANY, Mock, patch
+
+from django_toolkit.logs import formatters
+from django_toolkit.logs.filters import AddHostName
+from django_toolkit.logs.formatters import JSONFormatter, compile_format
+
+
+class TestCompileFormat(object):
+
+    @pytest.fixture
+    def request_(self):
+        return Mock(method='GET', path=u'/ação')
+
+    @pytest.fixture
+    def response(self):
+        return Mock(status_code=200)
+
+    @pytest.mark.parametrize('format_string', [
+        u'[{app_name}] {response.status_code} {request.method} '
+        u'{request.path}',
+        u'{app_name!r} {response.status_code:>5}',
+        u'{{literal}} {app_name}',
+        u'{app_name}',
+        u'no fields',
+        u'',
+    ])
+    def test_should_render_as_str_format(
+        self,
+        format_string,
+        request_,
+        response
+    ):
+        kwargs = {
+            'app_name': 'myapp',
+            'request': request_,
+            'response': response,
+        }
+
+        assert compile_format(format_string)(**kwargs) == (
+            format_string.format(**kwargs)
+        )
+
+    def test_should_parse_the_format_once(self):
+        with patch.object(
+            formatters._formatter,
+            'parse',
+            wraps=formatters._formatter.parse
+        ) as parse:
+            render = compile_format(u'[{app_name}]')
+            render(app_name='a')
+            render(app_name='b')
+
+        assert parse.call_count == 1
+
+    @pytest.mark.parametrize('format_string', [
+        u'{0}',
+        u'{}',
+        u'{items[0]}',
+        u'{app_name:{width}}',
+    ])
+    def test_should_fall_back_to_str_format(self, format_string):
+        assert compile_format(format_string) == format_string.format
+
+    def test_should_raise_when_an_argument_is_missing(self):
+        with pytest.raises(KeyError):
+            compile_format(u'{app_name}')()
+
+
+class TestJSONFormatter(object):
+
+    @pytest.fixture
+    def record(self):
+        record = logging.LogRecord(
+            'django_toolkit.middlewares',
+            logging.INFO,
+            __file__,
+            10,
+            u'[%s] 200 GET /',
+            ('myapp',),
+            None
+        )
+        record.status_code = 200
+        record.path = u'/ação'
+        return record
+
+    def test_should_format_the_record_as_json(self, record):
+        data = json.loads(JSONFormatter().format(record))
+
+        assert data == {
+            'timestamp': ANY,
+            'level': 'INFO',
+            'logger': 'django_toolkit.middlewares',
+            'message': u'[myapp] 200 GET /',
+            'status_code': 200,
+            'path': u'/ação',
+        }
+
+    def test_should_format_a_single_line(self, record):
+        assert '\n' not in JSONFormatter().format(record)
+
+    def test_should_only_include_the_given_fields(self, record):
+        data = json.loads(
+            JSONFormatter(fields=['status_code', 'hostname']).format(record)
+        )
+
+        assert data['status_code'] == 200
+        assert data['hostname'] is None
+        assert 'path' not in data
+
+    def test_should_include_the_hostname_added_by_filter(self, record):
+        AddHostName().filter(record)
+
+        data = json.loads(JSONFormatter().format(record))
+
+        assert data['hostname'] == socket.gethostname()
+
+    def test_should_format_values_that_are_not_serializable(self, record):
+        record.user = object()
+
+        data = json.loads(JSONFormatter().format(record))
+
+        assert data['user'].startswith('<object object')
+
+    def test_should_include_the_exception(self, record):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record.exc_info = sys.exc_info()
+
+        data = json.loads(JSONFormatter().format(record))
+
+        assert 'ValueError: boom' in data['exc_info']
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+import pytest
+from mock import ANY, patch
+
+from django_toolkit.logs.handlers import QueueLogDispatcher
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super(RecordingHandler, self).__init__()
+        self.records = []
+        self.threads = []
+
+    def emit(self, record):
+        self.records.append(record)
+        self.threads.append(threading.current_thread())
+
+
+@pytest.fixture
+def handler():
+    return RecordingHandler()
+
+
+@pytest.fixture
+def test_logger(handler):
+    logger = logging.getLogger('tests.logs.handlers')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(handler)
+    yield logger
+    logger.removeHandler(handler)
+
+
+class TestQueueLogDispatcher(object):
+
+    @pytest.fixture
+    def dispatcher(self, test_logger):
+        dispatcher = QueueLogDispatcher(test_logger, maxsize=10)
+        yield dispatcher
+        dispatcher.stop()
+
+    def test_should_handle_records_in_a_background_thread(
+        self,
+        dispatcher,
+        handler
+    ):
+        assert dispatcher.log(logging.INFO, 'message')
+
+        dispatcher.stop()
+
+        assert [record.getMessage() for record in handler.records] == [
+            'message'
+        ]
+        assert handler.records[0].levelno == logging.INFO
+        assert handler.threads[0] is not threading.current_thread()
+
+    def test_should_ignore_disabled_levels(self, dispatcher, handler):
+        assert dispatcher.log(logging.DEBUG, 'message')
+
+        dispatcher.stop()
+
+        assert handler.records == []
+        assert dispatcher.queue is None
+
+    def test_should_drop_records_when_queue_is_full(
+        self,
+        test_logger,
+        handler
+    ):
+        dispatcher = QueueLogDispatcher(test_logger, maxsize=1)
+        handling = threading.Event()
+        released = threading.Event()
+
+        def handle(record):
+            handling.set()
+            released.wait()
+
+        with patch.object(test_logger, 'handle', side_effect=handle):
+            dispatcher.log(logging.INFO, 'first')
+            # the thread is stuck handling the first record
+            handling.wait()
+            assert dispatcher.log(logging.INFO, 'second')
+            assert not dispatcher.log(logging.INFO, 'third')
+            released.set()
+            dispatcher.stop()
+
+        assert dispatcher.dropped == 1
+
+    def test_should_wait_for_room_when_blocking(self, test_logger):
+        dispatcher = QueueLogDispatcher(
+            test_logger,
+            maxsize=1,
+            block=True,
+            timeout=0.01
+        )
+        dispatcher.start()
+
+        with patch.object(dispatcher.queue, 'put') as put:
+            dispatcher.log(logging.INFO, 'message')
+
+        dispatcher.stop()
+
+        put.assert_called_once_with(ANY, True, 0.01)
+
+    def test_should_restart_in_a_forked_process(self, dispatcher):
+        dispatcher.log(logging.INFO, 'message')
+        queue = dispatcher.queue
+
+        with patch('os.getpid', return_value=-1):
+            dispatcher.log(logging.INFO, 'message')
+            assert dispatcher.queue is not queue
+            dispatcher.stop()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from django_toolkit.oauth2.payloads import (
+    dump_access_token,
+    load_access_token
+)
+
+
+@pytest.mark.django_db
+class TestAccessTokenPayload(object):
+
+    @pytest.fixture
+    def access_token(self, access_token, user):
+        access_token.user = user
+        access_token.save()
+        return access_token
+
+    @pytest.fixture
+    def payload(self, access_token):
+        return dump_access_token(access_token)
+
+    def test_should_dump_only_the_needed_fields(
+        self,
+        payload,
+        access_token
+    ):
+        assert payload == {
+            'id': access_token.pk,
+            'token': access_token.token,
+            'expires': access_token.expires,
+            'scope': access_token.scope,
+            'application': {
+                'id': access_token.application.pk,
+                'name': access_token.application.name,
+                'client_id': access_token.application.client_id,
+            },
+            'user': {
+                'id': access_token.user.pk,
+                'username': access_token.user.username,
+                'is_active': True,
+                'is_staff': False,
+                'is_superuser': False,
+            },
+        }
+
+    def test_should_load_the_access_token_without_queries(
+        self,
+        payload,
+        access_token,
+        scopes
+    ):
+        with CaptureQueriesContext(connection) as context:
+            loaded_token = load_access_token(payload)
+
+            assert loaded_token == access_token
+            assert loaded_token.is_valid(scopes)
+            assert loaded_token.application == access_token.application
+            assert loaded_token.application.name == 'Test Application'
+            assert loaded_token.user == access_token.user
+            assert loaded_token.user.username == 'my-user'
+            assert loaded_token.user.is_active
+            assert not loaded_token.user.is_staff
+            assert not loaded_token.user.is_superuser
+
+        assert len(context.captured_queries) == 0
+
+    def test_should_load_other_fields_on_access(self, payload, access_token):
+        loaded_token = load_access_token(payload)
+
+        with CaptureQueriesContext(connection) as context:
+            assert loaded_token.created == access_token.created
+            assert (
+                loaded_token.application.client_secret ==
+                access_token.application.client_secret
+            )
+
+        assert len(context.captured_queries) == 2
+
+    def test_should_load_an_access_token_without_user(self, access_token):
+        access_token.user = None
+        access_token.save()
+
+        loaded_token = load_access_token(dump_access_token(access_token))
+
+        assert loaded_token.user is None
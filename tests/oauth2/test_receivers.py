@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 import pytest
+from mock import patch
+
+from django_toolkit.local_cache import LocalCache
 
 
 @pytest.mark.django_db
@@ -14,3 +17,15 @@ class TestDeleteAccessTokenCache(object):
         access_token.delete()
 
         assert cache.get(key) is None
+
+    def test_should_delete_local_token_cache(self, access_token):
+        local_cache = LocalCache(max_size=10)
+        local_cache.set(access_token.token, access_token, 10)
+
+        with patch(
+            'django_toolkit.oauth2.validators.local_cache',
+            local_cache
+        ):
+            access_token.delete()
+
+        assert local_cache.get(access_token.token) is None
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import threading
+import time
 from datetime import timedelta
 
 import pytest
@@ -6,9 +8,13 @@ from django.db import connection
 from django.db.models.query import QuerySet
 from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from mock import patch
 from oauth2_provider.models import get_access_token_model
 
+from django_toolkit.local_cache import LocalCache
+from django_toolkit.oauth2.payloads import dump_access_token
 from django_toolkit.oauth2.validators import CachedOAuth2Validator
+from django_toolkit.timing import start_request_timing, stop_request_timing
 
 
 @pytest.mark.django_db
@@ -28,10 +34,14 @@ class TestCachedOAuth2Validator(object):
     def test_validate_bearer_token_should_not_reach_db_when_cached(
         self,
         access_token,
+        user,
         validator,
         http_request,
         scopes
     ):
+        access_token.user = user
+        access_token.save()
+
         db_result = self._warm_up_cache(
             validator,
             access_token.token,
@@ -46,6 +56,11 @@ class TestCachedOAuth2Validator(object):
                 http_request
             )
 
+            # The user fields checked on most requests
+            assert http_request.user.is_active
+            assert not http_request.user.is_staff
+            assert not http_request.user.is_superuser
+
         assert len(context.captured_queries) == 0
         assert db_result == cached_result
 
@@ -102,6 +117,45 @@ class TestCachedOAuth2Validator(object):
 
         assert len(context.captured_queries) == 1
 
+    def test_validate_bearer_token_should_cache_a_compact_payload(
+        self,
+        access_token,
+        validator,
+        cache,
+        scopes,
+        http_request
+    ):
+        self._warm_up_cache(
+            validator,
+            access_token.token,
+            scopes,
+            http_request
+        )
+
+        payload = cache.get(access_token.token)
+        assert isinstance(payload, dict)
+        assert payload['token'] == access_token.token
+
+    def test_validate_bearer_token_should_accept_cached_models(
+        self,
+        access_token,
+        validator,
+        cache,
+        scopes,
+        http_request
+    ):
+        cache.set(access_token.token, access_token)
+
+        with CaptureQueriesContext(connection) as context:
+            is_valid = validator.validate_bearer_token(
+                access_token.token,
+                scopes,
+                http_request
+            )
+
+        assert is_valid
+        assert len(context.captured_queries) == 0
+
     def test_validate_bearer_returns_false_when_no_token_is_provided(
         self,
         validator,
@@ -130,6 +184,24 @@ class TestCachedOAuth2Validator(object):
         )
         assert not is_valid
 
+    def test_validate_bearer_token_should_time_the_auth_phase_of_the_request(
+        self,
+        validator,
+        scopes,
+        http_request
+    ):
+        timing = start_request_timing()
+        try:
+            validator.validate_bearer_token(
+                'invalid-token',
+                scopes,
+                http_request
+            )
+        finally:
+            stop_request_timing()
+
+        assert timing.phases['auth'] > 0
+
     def test_get_queryset_should_return_an_access_token_queryset(
         self,
         validator,
@@ -138,3 +210,460 @@ class TestCachedOAuth2Validator(object):
 
         assert isinstance(queryset, QuerySet)
         assert queryset.model == get_access_token_model()
+
+
+@pytest.mark.django_db
+class TestCachedOAuth2ValidatorLocalCache(object):
+
+    @pytest.fixture
+    def validator(self):
+        return CachedOAuth2Validator()
+
+    @pytest.fixture(autouse=True)
+    def local_cache(self):
+        local_cache = LocalCache(max_size=10)
+        with patch(
+            'django_toolkit.oauth2.validators.local_cache',
+            local_cache
+        ):
+            yield local_cache
+
+    def test_should_not_reach_the_shared_cache_when_cached_locally(
+        self,
+        access_token,
+        validator,
+        cache,
+        scopes,
+        rf
+    ):
+        validator.validate_bearer_token(
+            access_token.token,
+            scopes,
+            rf.get('/')
+        )
+
+        with patch.object(cache, 'get') as get:
+            with CaptureQueriesContext(connection) as context:
+                is_valid = validator.validate_bearer_token(
+                    access_token.token,
+                    scopes,
+                    rf.get('/')
+                )
+
+        assert is_valid
+        assert not get.called
+        assert len(context.captured_queries) == 0
+
+    def test_should_not_share_the_models_between_requests(
+        self,
+        access_token,
+        user,
+        validator,
+        scopes,
+        rf
+    ):
+        access_token.user = user
+        access_token.save()
+
+        requests = [rf.get('/'), rf.get('/')]
+        for request in requests:
+            assert validator.validate_bearer_token(
+                access_token.token,
+                scopes,
+                request
+            )
+
+        first, second = requests
+        assert first.access_token is not second.access_token
+        assert first.user is not second.user
+        assert first.client is not second.client
+
+    def test_should_cache_locally_until_the_token_expires(
+        self,
+        access_token,
+        validator,
+        local_cache,
+        scopes,
+        rf
+    ):
+        access_token.expires = timezone.now() + timedelta(seconds=5)
+        access_token.save()
+
+        with patch.object(local_cache, 'set') as set_local:
+            validator.validate_bearer_token(
+                access_token.token,
+                scopes,
+                rf.get('/')
+            )
+
+        timeout = set_local.call_args[0][2]
+        assert 0 < timeout <= 5
+
+    def test_should_bound_the_local_cache_timeout(
+        self,
+        access_token,
+        validator,
+        local_cache,
+        scopes,
+        rf
+    ):
+        with patch.object(local_cache, 'set') as set_local:
+            validator.validate_bearer_token(
+                access_token.token,
+                scopes,
+                rf.get('/')
+            )
+
+        timeout = set_local.call_args[0][2]
+        assert timeout == 30
+
+
+@pytest.mark.django_db
+class TestCachedOAuth2ValidatorNegativeCache(object):
+
+    @pytest.fixture
+    def validator(self):
+        return CachedOAuth2Validator()
+
+    @pytest.fixture(autouse=True)
+    def negative_cache(self):
+        negative_cache = LocalCache(max_size=10)
+        with patch(
+            'django_toolkit.oauth2.validators.negative_cache',
+            negative_cache
+        ), patch(
+            'django_toolkit.toolkit_settings'
+            '.ACCESS_TOKEN_NEGATIVE_CACHE_TIMEOUT',
+            5
+        ):
+            yield negative_cache
+
+    def test_should_not_reach_db_again_for_an_unknown_token(
+        self,
+        validator,
+        scopes,
+        rf
+    ):
+        validator.validate_bearer_token('invalid-token', scopes, rf.get('/'))
+
+        with CaptureQueriesContext(connection) as context:
+            is_valid = validator.validate_bearer_token(
+                'invalid-token',
+                scopes,
+                rf.get('/')
+            )
+
+        assert not is_valid
+        assert len(context.captured_queries) == 0
+
+    def test_should_not_remember_valid_tokens(
+        self,
+        access_token,
+        validator,
+        negative_cache,
+        scopes,
+        rf
+    ):
+        validator.validate_bearer_token(
+            access_token.token,
+            scopes,
+            rf.get('/')
+        )
+
+        assert negative_cache.get(access_token.token) is None
+
+    def test_should_accept_a_token_created_after_an_unknown_lookup(
+        self,
+        access_token,
+        validator,
+        scopes,
+        rf
+    ):
+        assert not validator.validate_bearer_token(
+            'new-token',
+            scopes,
+            rf.get('/')
+        )
+
+        access_token.token = 'new-token'
+        access_token.save()
+
+        assert validator.validate_bearer_token(
+            'new-token',
+            scopes,
+            rf.get('/')
+        )
+
+
+@pytest.mark.django_db
+class TestCachedOAuth2ValidatorCoalescing(object):
+
+    @pytest.fixture
+    def validator(self):
+        return CachedOAuth2Validator()
+
+    def test_should_query_a_token_once_for_concurrent_requests(
+        self,
+        validator,
+        access_token
+    ):
+        release = threading.Event()
+        queries = []
+
+        def query_payload(token):
+            queries.append(token)
+            release.wait(1)
+            return dump_access_token(access_token)
+
+        results = []
+        workers = [
+            threading.Thread(
+                target=lambda: results.append(
+                    validator._get_access_token(access_token.token)
+                )
+            )
+            for _ in range(5)
+        ]
+        with patch.object(
+            validator,
+            '_query_payload',
+            side_effect=query_payload
+        ):
+            threading.Timer(0.1, release.set).start()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        assert queries == [access_token.token]
+        assert results == [access_token] * 5
+
+    def test_should_wait_for_a_token_queried_by_another_process(
+        self,
+        validator,
+        access_token,
+        cache
+    ):
+        cache.add('coalesce_{}'.format(access_token.token), True)
+        validator.coalesce_poll_interval = 0
+
+        def query_by_another_process(interval):
+            validator._query_payload(access_token.token)
+
+        with patch(
+            'django_toolkit.toolkit_settings'
+            '.ACCESS_TOKEN_COALESCE_LOCK_EXPIRE',
+            5
+        ), patch(
+            'django_toolkit.oauth2.validators.time.sleep',
+            side_effect=query_by_another_process
+        ) as sleep, patch.object(
+            validator,
+            'get_queryset',
+            wraps=validator.get_queryset
+        ) as get_queryset:
+            result = validator._get_access_token(access_token.token)
+
+        assert result == access_token
+        assert sleep.call_count == 1
+        assert get_queryset.call_count == 1
+
+    def test_should_not_wait_for_an_early_refresh_by_another_process(
+        self,
+        validator,
+        access_token,
+        cache
+    ):
+        validator._get_access_token(access_token.token)
+        payload = cache.get(access_token.token)
+        payload.update(cache_expires=time.time(), delta=10)
+        cache.set(access_token.token, payload)
+        cache.add('coalesce_{}'.format(access_token.token), True)
+
+        with patch(
+            'django_toolkit.toolkit_settings'
+            '.ACCESS_TOKEN_COALESCE_LOCK_EXPIRE',
+            5
+        ), patch(
+            'django_toolkit.oauth2.validators.time.sleep'
+        ) as sleep, CaptureQueriesContext(connection) as context:
+            result = validator._get_access_token(access_token.token)
+
+        assert result == access_token
+        assert not sleep.called
+        assert len(context.captured_queries) == 0
+        assert cache.get(access_token.token)['delta'] == 10
+
+    def test_should_not_wait_for_an_early_refresh_by_another_thread(
+        self,
+        validator,
+        access_token,
+        cache
+    ):
+        validator._get_access_token(access_token.token)
+        payload = cache.get(access_token.token)
+        payload.update(cache_expires=time.time(), delta=10)
+        cache.set(access_token.token, payload)
+
+        started = threading.Event()
+        release = threading.Event()
+
+        def query_payload(token):
+            started.set()
+            release.wait(1)
+            return dump_access_token(access_token)
+
+        with patch.object(
+            validator,
+            '_query_payload',
+            side_effect=query_payload
+        ) as query:
+            refresh = threading.Thread(
+                target=validator._get_access_token,
+                args=(access_token.token,)
+            )
+            refresh.start()
+            started.wait(1)
+
+            try:
+                result = validator._get_access_token(access_token.token)
+                assert not release.is_set()
+            finally:
+                release.set()
+                refresh.join()
+
+        assert result == access_token
+        assert query.call_count == 1
+
+    def test_should_query_the_token_when_the_other_process_gives_up(
+        self,
+        validator,
+        access_token,
+        cache
+    ):
+        lock_key = 'coalesce_{}'.format(access_token.token)
+        cache.add(lock_key, True)
+        validator.coalesce_poll_interval = 0
+
+        with patch(
+            'django_toolkit.toolkit_settings'
+            '.ACCESS_TOKEN_COALESCE_LOCK_EXPIRE',
+            5
+        ), patch(
+            'django_toolkit.oauth2.validators.time.sleep',
+            side_effect=lambda interval: cache.delete(lock_key)
+        ):
+            result = validator._get_access_token(access_token.token)
+
+        assert result == access_token
+        assert cache.get(access_token.token)
+
+
+@pytest.mark.django_db
+class TestCachedOAuth2ValidatorCacheTimeout(object):
+
+    @pytest.fixture
+    def validator(self):
+        return CachedOAuth2Validator()
+
+    def get_cache_timeout(self, validator, cache, token):
+        with patch.object(cache, 'set') as cache_set:
+            validator._get_access_token(token)
+
+        return cache_set.call_args[0][2]
+
+    def test_should_include_the_days_in_the_cache_timeout(
+        self,
+        validator,
+        access_token,
+        cache
+    ):
+        access_token.expires = timezone.now() + timedelta(days=2, seconds=5)
+        access_token.save()
+
+        timeout = self.get_cache_timeout(validator, cache, access_token.token)
+
+        assert 2 * 24 * 3600 <= timeout <= 2 * 24 * 3600 + 5
+
+    def test_should_bound_the_cache_timeout(
+        self,
+        validator,
+        access_token,
+        cache
+    ):
+        access_token.expires = timezone.now() + timedelta(days=2)
+        access_token.save()
+
+        with patch(
+            'django_toolkit.toolkit_settings.ACCESS_TOKEN_CACHE_MAX_TIMEOUT',
+            3600
+        ):
+            timeout = self.get_cache_timeout(
+                validator,
+                cache,
+                access_token.token
+            )
+
+        assert timeout == 3600
+
+    def test_should_store_the_early_refresh_data(
+        self,
+        validator,
+        access_token,
+        cache
+    ):
+        validator._get_access_token(access_token.token)
+
+        payload = cache.get(access_token.token)
+        assert payload['cache_expires'] > time.time()
+        assert payload['delta'] >= 0
+
+    def test_should_refresh_the_cache_early_when_close_to_expire(
+        self,
+        validator,
+        access_token,
+        cache
+    ):
+        validator._get_access_token(access_token.token)
+        payload = cache.get(access_token.token)
+        payload.update(cache_expires=time.time(), delta=10)
+        cache.set(access_token.token, payload)
+
+        with CaptureQueriesContext(connection) as context:
+            validator._get_access_token(access_token.token)
+
+        assert len(context.captured_queries) == 1
+        assert cache.get(access_token.token)['delta'] < 10
+
+    def test_should_not_refresh_the_cache_early_when_far_from_expire(
+        self,
+        validator,
+        access_token,
+        cache
+    ):
+        validator._get_access_token(access_token.token)
+
+        with CaptureQueriesContext(connection) as context:
+            validator._get_access_token(access_token.token)
+
+        assert len(context.captured_queries) == 0
+
+    def test_should_not_refresh_the_cache_early_when_disabled(
+        self,
+        validator,
+        access_token,
+        cache
+    ):
+        validator._get_access_token(access_token.token)
+        payload = cache.get(access_token.token)
+        payload.update(cache_expires=time.time() + 1, delta=10)
+        cache.set(access_token.token, payload)
+
+        with patch(
+            'django_toolkit.toolkit_settings'
+            '.ACCESS_TOKEN_CACHE_EARLY_REFRESH_BETA',
+            0
+        ), CaptureQueriesContext(connection) as context:
+            validator._get_access_token(access_token.token)
+
+        assert len(context.captured_queries) == 0
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import pytest
+from django.core.cache import caches
+from mock import Mock
+
+from django_toolkit.cache_scripts import CacheScript, get_redis_client
+
+
+class TestGetRedisClient(object):
+
+    def test_should_return_none_when_cache_is_not_redis(self):
+        assert get_redis_client(caches['default']) is None
+
+    @pytest.mark.parametrize('attribute', ['client', '_cache'])
+    def test_should_return_the_redis_client(self, attribute):
+        cache = Mock(spec=[attribute])
+        client = getattr(cache, attribute)
+
+        assert get_redis_client(cache) == client.get_client.return_value
+        client.get_client.assert_called_once_with(write=True)
+
+
+class TestCacheScript(object):
+
+    def test_should_run_script_with_cache_keys(self):
+        cache = Mock(spec=['client', 'make_key'])
+        cache.make_key.side_effect = lambda key: ':1:{}'.format(key)
+        redis = cache.client.get_client.return_value
+
+        script = CacheScript('return 1')
+        result = script(cache, keys=['a', 'b'], args=[1])
+
+        redis.register_script.assert_called_once_with('return 1')
+        registered_script = redis.register_script.return_value
+        registered_script.assert_called_once_with(
+            keys=[':1:a', ':1:b'],
+            args=[1],
+            client=redis
+        )
+        assert result == registered_script.return_value
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+from mock import patch
+
+from django_toolkit.local_cache import LocalCache
+
+
+class TestLocalCache(object):
+
+    @pytest.fixture
+    def local_cache(self):
+        return LocalCache(max_size=2, shards=1)
+
+    def test_should_return_default_when_key_is_missing(self, local_cache):
+        assert local_cache.get('missing') is None
+        assert local_cache.get('missing', 'default') == 'default'
+
+    def test_should_return_the_cached_value(self, local_cache):
+        local_cache.set('key', 'value', 10)
+
+        assert local_cache.get('key') == 'value'
+
+    def test_should_expire_entries(self, local_cache):
+        local_cache.set('key', 'value', 10)
+
+        with patch('time.time', return_value=time.time() + 11):
+            assert local_cache.get('key') is None
+
+    def test_should_not_cache_when_timeout_is_not_positive(
+        self,
+        local_cache
+    ):
+        local_cache.set('key', 'value', 10)
+        local_cache.set('key', 'other value', 0)
+
+        assert local_cache.get('key') is None
+
+    def test_should_evict_the_least_recently_used_entry(self, local_cache):
+        local_cache.set('first', 1, 10)
+        local_cache.set('second', 2, 10)
+        local_cache.get('first')
+
+        local_cache.set('third', 3, 10)
+
+        assert local_cache.get('first') == 1
+        assert local_cache.get('second') is None
+        assert local_cache.get('third') == 3
+
+    def test_should_delete_entries(self, local_cache):
+        local_cache.set('key', 'value', 10)
+        local_cache.delete('key')
+
+        assert local_cache.get('key') is None
+
+    def test_should_clear_all_shards(self):
+        local_cache = LocalCache(max_size=100, shards=4)
+        for key in range(10):
+            local_cache.set(key, key, 10)
+
+        local_cache.clear()
+
+        assert all(local_cache.get(key) is None for key in range(10))
+
+    def test_should_bound_the_size_of_each_shard(self):
+        local_cache = LocalCache(max_size=10, shards=4)
+
+        assert local_cache.shard_size == 3
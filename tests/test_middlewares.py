@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
+import logging
+import socket
+
 import pytest
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from mock import Mock, PropertyMock, patch
 
 from django_toolkit import middlewares
+from django_toolkit.timing import get_request_timing, timed_phase
 
 
 @pytest.fixture
@@ -69,6 +73,13 @@ class TestAccessLogMiddleware(object):
             new_callable=PropertyMock
         )
 
+    @pytest.fixture
+    def patched_duration(self):
+        return patch(
+            'django_toolkit.middlewares.to_milliseconds',
+            return_value=12.3456
+        )
+
     @pytest.fixture
     def authenticated_http_request(self, http_request):
         http_request.user = u'jovem'
@@ -99,47 +110,424 @@ class TestAccessLogMiddleware(object):
 
     def test_should_include_request_and_response_in_the_message(
         self,
-        middleware,
         http_request,
         http_response,
         patched_logger,
         patched_format
     ):
+        with patched_format as mock_format_property:
+            mock_format_property.return_value = (
+                u'{app_name} {request.method} {response.status_code}'
+            )
+            middleware = middlewares.AccessLogMiddleware()
+
         with patched_logger as mock_logger:
-            with patched_format as mock_format_property:
-                middleware.process_response(http_request, http_response)
+            middleware.process_response(http_request, http_response)
+
+        mock_logger.info.assert_called_once_with(
+            u'{} GET 200'.format(middleware.UNKNOWN_APP_NAME),
+            extra={'sample_weight': 1.0}
+        )
 
-        mock_format_string = mock_format_property.return_value
+    def test_should_include_the_authenticated_app_in_the_message(
+        self,
+        middleware,
+        authenticated_http_request,
+        http_response,
+        patched_logger,
+        patched_duration
+    ):
+        middleware.process_request(authenticated_http_request)
+        with patched_logger as mock_logger, patched_duration:
+            middleware.process_response(
+                authenticated_http_request,
+                http_response
+            )
 
-        assert mock_format_string.format.called
-        mock_format_string.format.assert_called_once_with(
-            app_name=middleware.UNKNOWN_APP_NAME,
-            request=http_request,
-            response=http_response
+        mock_logger.info.assert_called_once_with(
+            u'[{}] 200 GET /'.format(
+                authenticated_http_request.auth.application.name
+            ),
+            extra={'sample_weight': 1.0}
         )
+
+    def test_should_include_the_duration_when_in_the_format(
+        self,
+        http_request,
+        http_response,
+        patched_logger,
+        patched_format,
+        patched_duration
+    ):
+        with patched_format as mock_format_property:
+            mock_format_property.return_value = u'{request.path} {duration}ms'
+            middleware = middlewares.AccessLogMiddleware()
+
+        middleware.process_request(http_request)
+        with patched_logger as mock_logger, patched_duration:
+            middleware.process_response(http_request, http_response)
+
         mock_logger.info.assert_called_once_with(
-            mock_format_string.format.return_value
+            u'/ 12.346ms',
+            extra={'sample_weight': 1.0}
         )
 
-    def test_should_include_the_authenticated_app_in_the_message(
+    def test_should_not_render_the_message_when_info_is_disabled(
+        self,
+        middleware,
+        http_request,
+        http_response,
+        patched_logger
+    ):
+        middleware.render_log = Mock()
+
+        with patched_logger as mock_logger:
+            mock_logger.isEnabledFor.return_value = False
+            response = middleware.process_response(
+                http_request,
+                http_response
+            )
+
+        assert response is http_response
+        assert not middleware.render_log.called
+        assert not mock_logger.info.called
+
+    def test_should_dispatch_logs_to_a_queue_when_enabled(
+        self,
+        http_request,
+        http_response,
+        patched_logger,
+        patched_format
+    ):
+        with patch.object(
+            middlewares.AccessLogMiddleware,
+            'QUEUE_SIZE',
+            10
+        ), patched_format as mock_format_property:
+            mock_format_property.return_value = u'[{app_name}] {request.path}'
+            middleware = middlewares.AccessLogMiddleware()
+
+        with patched_logger as mock_logger:
+            with patch.object(
+                middleware.log_dispatcher,
+                'log'
+            ) as mock_log:
+                middleware.process_response(http_request, http_response)
+
+        assert not mock_logger.info.called
+        mock_log.assert_called_once_with(
+            logging.INFO,
+            '[unknown] /',
+            {'sample_weight': 1.0}
+        )
+
+    def test_should_include_the_log_fields_when_structured(
         self,
         middleware,
         authenticated_http_request,
+        patched_logger,
+        patched_duration
+    ):
+        app = authenticated_http_request.auth.application
+        response = HttpResponse(b'content', status=201)
+
+        middleware.process_request(authenticated_http_request)
+        with patch.object(
+            middlewares.AccessLogMiddleware,
+            'STRUCTURED',
+            True
+        ), patched_logger as mock_logger, patched_duration:
+            middleware.process_response(authenticated_http_request, response)
+
+        mock_logger.info.assert_called_once_with(
+            u'[{}] 201 GET /'.format(app.name),
+            extra={
+                'app_name': app.name,
+                'client_id': app.client_id,
+                'status_code': 201,
+                'method': 'GET',
+                'path': '/',
+                'response_size': 7,
+                'hostname': socket.gethostname(),
+                'duration': 12.346,
+                'sample_weight': 1.0,
+            }
+        )
+
+    def test_should_not_include_the_size_of_streaming_responses(
+        self,
+        middleware,
+        http_request,
+        patched_logger
+    ):
+        response = StreamingHttpResponse(iter([b'content']))
+
+        with patch.object(
+            middlewares.AccessLogMiddleware,
+            'STRUCTURED',
+            True
+        ), patched_logger as mock_logger:
+            middleware.process_response(http_request, response)
+
+        extra = mock_logger.info.call_args[1]['extra']
+        assert extra['response_size'] is None
+        assert extra['client_id'] is None
+
+    def test_should_not_log_a_duration_without_a_timed_request(
+        self,
+        http_request,
         http_response,
         patched_logger,
         patched_format
     ):
         with patched_format as mock_format_property:
+            mock_format_property.return_value = u'{request.path} {duration}'
+            middleware = middlewares.AccessLogMiddleware()
+
+        with patch.object(
+            middlewares.AccessLogMiddleware,
+            'STRUCTURED',
+            True
+        ), patched_logger as mock_logger:
+            middleware.process_response(http_request, http_response)
+
+        assert mock_logger.info.call_args[0][0] == u'/ -'
+        assert mock_logger.info.call_args[1]['extra']['duration'] is None
+
+    def test_should_not_log_excluded_paths(
+        self,
+        middleware,
+        rf,
+        http_response,
+        patched_logger
+    ):
+        with patch.object(
+            middlewares.AccessLogMiddleware,
+            'EXCLUDE_PATHS',
+            ('/healthcheck', '/metrics')
+        ):
+            middleware = middlewares.AccessLogMiddleware()
+
+        with patched_logger as mock_logger:
             middleware.process_response(
-                authenticated_http_request,
+                rf.get('/healthcheck/db'),
                 http_response
             )
+            middleware.process_response(rf.get('/metrics'), http_response)
 
-        mock_format_string = mock_format_property.return_value
+        assert not mock_logger.info.called
 
-        assert mock_format_string.format.called
-        mock_format_string.format.assert_called_once_with(
-            app_name=authenticated_http_request.auth.application.name,
-            request=authenticated_http_request,
-            response=http_response
+        with patched_logger as mock_logger:
+            middleware.process_response(rf.get('/products'), http_response)
+
+        assert mock_logger.info.called
+
+    @pytest.mark.parametrize('random_value,logged', [
+        (0.05, True),
+        (0.15, False),
+    ])
+    def test_should_sample_the_logs_by_status_class(
+        self,
+        middleware,
+        http_request,
+        http_response,
+        patched_logger,
+        random_value,
+        logged
+    ):
+        with patch.object(
+            middlewares.AccessLogMiddleware,
+            'SAMPLE_RATES',
+            {'2xx': 0.1}
+        ), patch(
+            'django_toolkit.middlewares.random.random',
+            return_value=random_value
+        ), patched_logger as mock_logger:
+            middleware.process_response(http_request, http_response)
+
+        assert mock_logger.info.called is logged
+
+    def test_should_include_the_sample_weight_in_the_record(
+        self,
+        middleware,
+        http_request,
+        http_response,
+        patched_logger
+    ):
+        with patch.object(
+            middlewares.AccessLogMiddleware,
+            'SAMPLE_RATES',
+            {'2xx': 0.25}
+        ), patch(
+            'django_toolkit.middlewares.random.random',
+            return_value=0
+        ), patched_logger as mock_logger:
+            middleware.process_response(http_request, http_response)
+
+        assert mock_logger.info.call_args[1]['extra'] == {'sample_weight': 4}
+
+    @pytest.mark.parametrize('status', [404, 503])
+    def test_should_always_log_errors(
+        self,
+        middleware,
+        http_request,
+        patched_logger,
+        status
+    ):
+        with patch.object(
+            middlewares.AccessLogMiddleware,
+            'SAMPLE_RATES',
+            {'4xx': 0, '5xx': 0}
+        ), patched_logger as mock_logger:
+            middleware.process_response(
+                http_request,
+                HttpResponse(status=status)
+            )
+
+        assert mock_logger.info.called
+
+    def test_should_always_log_slow_requests(
+        self,
+        middleware,
+        http_request,
+        http_response,
+        patched_logger,
+        patched_duration
+    ):
+        middleware.process_request(http_request)
+        with patch.multiple(
+            middlewares.AccessLogMiddleware,
+            SAMPLE_RATES={'2xx': 0},
+            SLOW_THRESHOLD=10
+        ), patched_logger as mock_logger, patched_duration:
+            middleware.process_response(http_request, http_response)
+
+        assert mock_logger.info.called
+
+    def test_should_not_log_status_classes_sampled_out(
+        self,
+        middleware,
+        http_request,
+        http_response,
+        patched_logger,
+        patched_duration
+    ):
+        middleware.process_request(http_request)
+        with patch.multiple(
+            middlewares.AccessLogMiddleware,
+            SAMPLE_RATES={'2xx': 0},
+            SLOW_THRESHOLD=100
+        ), patched_logger as mock_logger, patched_duration:
+            response = middleware.process_response(
+                http_request,
+                http_response
+            )
+
+        assert response is http_response
+        assert not mock_logger.info.called
+
+    def test_should_add_the_server_timing_header_when_enabled(
+        self,
+        middleware,
+        http_request,
+        http_response
+    ):
+        middleware.process_request(http_request)
+        middleware.process_view(http_request, None, (), {})
+        with timed_phase('auth'):
+            pass
+
+        with patch.object(
+            middlewares.AccessLogMiddleware,
+            'SERVER_TIMING',
+            True
+        ):
+            response = middleware.process_response(
+                http_request,
+                http_response
+            )
+
+        metrics = [
+            metric.split(';')[0]
+            for metric in response['Server-Timing'].split(', ')
+        ]
+        assert metrics == ['total', 'auth', 'view']
+
+    def test_should_not_add_the_server_timing_header_by_default(
+        self,
+        middleware,
+        http_request,
+        http_response
+    ):
+        middleware.process_request(http_request)
+        response = middleware.process_response(http_request, http_response)
+
+        assert 'Server-Timing' not in response
+
+    def test_should_stop_the_request_timing_on_response(
+        self,
+        middleware,
+        http_request,
+        http_response
+    ):
+        middleware.process_request(http_request)
+        assert get_request_timing() is not None
+
+        middleware.process_response(http_request, http_response)
+
+        assert get_request_timing() is None
+
+
+class TestRateLimitMiddleware(object):
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        from django.core.cache import caches
+
+        from django_toolkit.concurrent.rate_limiters import (
+            _local_blocked_until
         )
+
+        caches['default'].clear()
+        _local_blocked_until.clear()
+
+    @pytest.fixture
+    def middleware(self):
+        with patch.object(middlewares.RateLimitMiddleware, 'RATE', 1):
+            yield middlewares.RateLimitMiddleware()
+
+    def test_should_let_requests_in_up_to_the_rate(
+        self,
+        middleware,
+        http_request
+    ):
+        assert middleware.process_request(http_request) is None
+
+    def test_should_respond_too_many_requests_when_exceeded(
+        self,
+        middleware,
+        http_request
+    ):
+        middleware.process_request(http_request)
+
+        response = middleware.process_request(http_request)
+
+        assert response.status_code == 429
+        assert response['Retry-After'] == '1'
+
+    def test_should_limit_each_client_apart(
+        self,
+        middleware,
+        rf
+    ):
+        middleware.process_request(rf.get('/', REMOTE_ADDR='10.0.0.1'))
+
+        assert middleware.process_request(
+            rf.get('/', REMOTE_ADDR='10.0.0.2')
+        ) is None
+
+    def test_should_not_limit_when_disabled(self, http_request):
+        middleware = middlewares.RateLimitMiddleware()
+
+        for _ in range(3):
+            assert middleware.process_request(http_request) is None
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+from mock import patch
+
+from django_toolkit.timing import (
+    RequestTiming,
+    get_request_timing,
+    start_request_timing,
+    stop_request_timing,
+    timed_phase,
+    to_milliseconds
+)
+
+
+class TestRequestTiming(object):
+
+    @pytest.fixture
+    def timing(self):
+        with patch(
+            'django_toolkit.timing.perf_counter_ns',
+            return_value=1000000
+        ):
+            return RequestTiming()
+
+    def test_should_measure_the_duration_since_it_was_created(self, timing):
+        with patch(
+            'django_toolkit.timing.perf_counter_ns',
+            return_value=3500000
+        ):
+            assert timing.duration == 2500000
+
+    def test_should_add_up_the_time_of_a_phase(self, timing):
+        timing.add('auth', 100)
+        timing.add('auth', 50)
+
+        assert timing.phases == {'auth': 150}
+
+    def test_should_time_a_started_phase_until_it_is_stopped(self, timing):
+        with patch(
+            'django_toolkit.timing.perf_counter_ns',
+            side_effect=[1000, 4000]
+        ):
+            timing.start('view')
+            timing.stop('view')
+
+        assert timing.phases == {'view': 3000}
+
+    def test_should_ignore_stopping_a_phase_not_started(self, timing):
+        timing.stop('view')
+        assert timing.phases == {}
+
+    def test_should_time_a_phase_block(self, timing):
+        with patch(
+            'django_toolkit.timing.perf_counter_ns',
+            side_effect=[1000, 3000]
+        ):
+            with pytest.raises(ValueError):
+                with timing.phase('auth'):
+                    raise ValueError()
+
+        assert timing.phases == {'auth': 2000}
+
+    def test_should_render_the_server_timing_in_milliseconds(self, timing):
+        timing.add('view', 2500000)
+        timing.add('auth', 1234567)
+
+        assert timing.get_server_timing(5000000) == (
+            'total;dur=5.000, auth;dur=1.235, view;dur=2.500'
+        )
+
+
+class TestTimedPhase(object):
+
+    @pytest.fixture(autouse=True)
+    def clear_timing(self):
+        yield
+        stop_request_timing()
+
+    def test_should_add_the_phase_to_the_current_request_timing(self):
+        timing = start_request_timing()
+
+        with timed_phase('auth'):
+            pass
+
+        assert get_request_timing() is timing
+        assert 'auth' in timing.phases
+
+    def test_should_do_nothing_without_a_request_timing(self):
+        with timed_phase('auth'):
+            assert get_request_timing() is None
+
+    def test_should_not_share_the_request_timing_between_threads(self):
+        start_request_timing()
+        timings = []
+
+        thread = threading.Thread(
+            target=lambda: timings.append(get_request_timing())
+        )
+        thread.start()
+        thread.join()
+
+        assert timings == [None]
+
+    def test_should_stop_the_request_timing(self):
+        start_request_timing()
+        stop_request_timing()
+
+        assert get_request_timing() is None
+
+
+def test_to_milliseconds():
+    assert to_milliseconds(1500000) == 1.5